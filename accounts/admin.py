@@ -6,7 +6,7 @@ from django.contrib.auth.models import User
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'nickname', 'avatar', 'created_at', 'updated_at')
+    list_display = ('user', 'nickname', 'avatar', 'avatar_thumb', 'created_at', 'updated_at')
     date_hierarchy = 'created_at'
 
 
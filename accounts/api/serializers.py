@@ -1,6 +1,7 @@
 from accounts.models import UserProfile
 from django.contrib.auth.models import User, Group
 from rest_framework import serializers, exceptions
+from utils.images import ImageVariantHelper
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -11,16 +12,34 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
 
 class UserSerializerWithProfile(UserSerializer):
     nickname = serializers.CharField(source='profile.nickname')
+    followers_count = serializers.IntegerField(source='profile.followers_count')
+    followings_count = serializers.IntegerField(source='profile.followings_count')
     avatar_url = serializers.SerializerMethodField()
+    avatar_urls = serializers.SerializerMethodField()
 
     def get_avatar_url(self, obj):
         if obj.profile.avatar:
             return obj.profile.avatar.url
         return None
 
+    def get_avatar_urls(self, obj):
+        # {'original', 'thumb', 'medium', 'large'}，客户端按显示的大小选择
+        return ImageVariantHelper.get_urls(
+            obj.profile.avatar,
+            obj.profile.avatar_variant_files,
+        )
+
     class Meta:
         model = User
-        fields = ('id', 'username', 'nickname', 'avatar_url')
+        fields = (
+            'id',
+            'username',
+            'nickname',
+            'avatar_url',
+            'avatar_urls',
+            'followers_count',
+            'followings_count',
+        )
 
 
 class UserSerializerForTweet(UserSerializerWithProfile):
@@ -40,6 +59,13 @@ class UserProfileSerializerForUpdate(serializers.ModelSerializer):
         model = UserProfile
         fields = ('nickname', 'avatar')
 
+    def update(self, instance, validated_data):
+        # 只保存修改了的字段，避免用内存里旧的关注计数覆盖掉并发的 F() 更新
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=list(validated_data.keys()) + ['updated_at'])
+        return instance
+
 
 class UserSerializerForLike(UserSerializerWithProfile):
     pass
@@ -1,7 +1,11 @@
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
+from accounts.api.serializers import UserSerializerWithProfile
 from accounts.models import UserProfile
+from accounts.tasks import generate_avatar_variants_task
+from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
 
 LOGIN_URL = '/api/accounts/login/'
 LOGOUT_URL = '/api/accounts/logout/'
@@ -13,6 +17,7 @@ USER_PROFILE_DETAIL_URL = '/api/profiles/{}/'
 class AccountApiTests(TestCase):
 
     def setUp(self):
+        self.clear_cache()
         self.client = APIClient()
         self.user = self.create_user(
             username='admin',
@@ -160,3 +165,44 @@ class UserProfileAPITests(TestCase):
         self.assertEqual('my-avatar' in response.data['avatar'], True)
         p.refresh_from_db()
         self.assertIsNotNone(p.avatar)
+
+    def test_avatar_variants(self):
+        linghu, linghu_client = self.create_user_and_client('linghu')
+        profile = linghu.profile
+        url = USER_PROFILE_DETAIL_URL.format(profile.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = linghu_client.put(url, {
+                'avatar': self.create_image_file('avatar.jpg', (800, 800)),
+            })
+        self.assertEqual(response.status_code, 200)
+        profile.refresh_from_db()
+        with profile.avatar_thumb.open('rb') as f:
+            self.assertEqual(Image.open(f).size, (150, 150))
+
+        serializer_data = UserSerializerWithProfile(linghu).data
+        self.assertEqual(serializer_data['avatar_urls']['original'], profile.avatar.url)
+        self.assertEqual(serializer_data['avatar_urls']['thumb'], profile.avatar_thumb.url)
+        self.assertEqual(serializer_data['avatar_urls']['medium'], profile.avatar_medium.url)
+
+        # 换头像以后旧的缩略图马上被清空，新的生成之前都用原图
+        with self.captureOnCommitCallbacks() as callbacks:
+            linghu_client.put(url, {'avatar': self.create_image_file('avatar2.jpg', (300, 300))})
+        profile.refresh_from_db()
+        self.assertFalse(profile.avatar_thumb)
+        linghu = User.objects.get(id=linghu.id)
+        self.assertEqual(
+            UserSerializerWithProfile(linghu).data['avatar_urls']['thumb'],
+            profile.avatar.url,
+        )
+
+        # 任务执行之前又换了头像，旧的任务不会写入
+        old_avatar_name = profile.avatar.name
+        UserProfile.objects.filter(id=profile.id).update(avatar='another.jpg')
+        self.assertIn(
+            'has changed',
+            generate_avatar_variants_task(profile.id, old_avatar_name),
+        )
+        for callback in callbacks:
+            callback()
+        profile.refresh_from_db()
+        self.assertFalse(profile.avatar_thumb)
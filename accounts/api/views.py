@@ -6,6 +6,7 @@ from accounts.api.serializers import (
     UserSerializerWithProfile
 )
 from accounts.models import UserProfile
+from accounts.services import UserService
 from django.contrib.auth.models import User
 from rest_framework import permissions
 from rest_framework import viewsets
@@ -37,6 +38,11 @@ class UserProfileViewSet(
     permission_classes = (IsObjectOwner,)
     serializer_class = UserProfileSerializerForUpdate
 
+    def perform_update(self, serializer):
+        profile = serializer.save()
+        if 'avatar' in serializer.validated_data:
+            UserService.refresh_avatar_variants(profile)
+
 
 class AccountViewSet(viewsets.ViewSet):
     permission_classes = (AllowAny,)
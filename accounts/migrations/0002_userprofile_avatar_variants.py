@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_large',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_medium',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_thumb',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:13
+
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def backfill_friendship_counts(apps, schema_editor):
+    # 之后的计数只会在关注 / 取关的时候更新，所以先给还没有 profile 的用户补上 profile，
+    # 再按 profile id 分批把已有的关注关系数一遍
+    # newsfeed 的分库上也会跑这个 migration，但是用户和关注关系都只在 default 上
+    if schema_editor.connection.alias != 'default':
+        return
+    User = apps.get_model('auth', 'User')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    Friendship = apps.get_model('friendships', 'Friendship')
+    while True:
+        user_ids = list(User.objects.filter(
+            userprofile__isnull=True,
+        ).values_list('id', flat=True)[:BATCH_SIZE])
+        if not user_ids:
+            break
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+
+    last_id = 0
+    while True:
+        profiles = list(UserProfile.objects.filter(
+            id__gt=last_id,
+            user_id__isnull=False,
+        ).order_by('id')[:BATCH_SIZE])
+        if not profiles:
+            break
+        last_id = profiles[-1].id
+        user_ids = [profile.user_id for profile in profiles]
+        followers_counts = dict(Friendship.objects.filter(
+            to_user_id__in=user_ids,
+        ).values('to_user_id').annotate(count=Count('id')).values_list('to_user_id', 'count'))
+        followings_counts = dict(Friendship.objects.filter(
+            from_user_id__in=user_ids,
+        ).values('from_user_id').annotate(count=Count('id')).values_list('from_user_id', 'count'))
+        for profile in profiles:
+            profile.followers_count = followers_counts.get(profile.user_id, 0)
+            profile.followings_count = followings_counts.get(profile.user_id, 0)
+        UserProfile.objects.bulk_update(profiles, ['followers_count', 'followings_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_userprofile_avatar_variants'),
+        ('friendships', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='followings_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_friendship_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pull_authors(apps, schema_editor):
+    # 现在粉丝数超过阈值的用户发的帖子都没有 fanout 过
+    if schema_editor.connection.alias != 'default':
+        return
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    UserProfile.objects.filter(
+        followers_count__gte=settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD,
+    ).update(has_unpushed_tweets=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_userprofile_friendship_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='has_unpushed_tweets',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_pull_authors, migrations.RunPython.noop),
+    ]
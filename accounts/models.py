@@ -6,10 +6,28 @@ from django.contrib.auth.models import User
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.SET_NULL, null=True)
     avatar = models.FileField(null=True)
+    # 后台生成的不同尺寸的头像，更换头像以后会被清空重新生成
+    avatar_thumb = models.FileField(null=True, blank=True)
+    avatar_medium = models.FileField(null=True, blank=True)
+    avatar_large = models.FileField(null=True, blank=True)
     nickname = models.CharField(null=True, max_length=200)
+
+    # 冗余的关注计数，关注 / 取关的时候用 F() 更新，避免每次都在 friendship 表上 count
+    followers_count = models.IntegerField(default=0)
+    followings_count = models.IntegerField(default=0)
+    # 粉丝数超过阈值时发的帖子没有 fanout，粉丝数降到阈值以下以后要把这些帖子补推给粉丝
+    has_unpushed_tweets = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    @property
+    def avatar_variant_files(self):
+        return {
+            'thumb': self.avatar_thumb,
+            'medium': self.avatar_medium,
+            'large': self.avatar_large,
+        }
+
     def __str__(self):
         return '{} {]'.format(self.user, self.nickname)
 
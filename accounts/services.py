@@ -0,0 +1,54 @@
+from accounts.models import UserProfile
+from accounts.tasks import generate_avatar_variants_task
+from django.db import transaction
+from utils.images import IMAGE_VARIANTS
+
+
+class UserService(object):
+
+    @classmethod
+    def get_profiles_by_user_ids(cls, user_ids):
+        """
+        批量获取 user profile，返回 {user_id: profile}
+        和 user.profile 一样，没有 profile 的用户会自动创建一个
+        """
+        user_ids = set(user_ids)
+        profiles = {
+            profile.user_id: profile
+            for profile in UserProfile.objects.filter(user_id__in=user_ids)
+        }
+        missing_ids = user_ids - set(profiles.keys())
+        if missing_ids:
+            UserProfile.objects.bulk_create(
+                [UserProfile(user_id=user_id) for user_id in missing_ids],
+                ignore_conflicts=True,
+            )
+            for profile in UserProfile.objects.filter(user_id__in=missing_ids):
+                profiles[profile.user_id] = profile
+        return profiles
+
+    @classmethod
+    def attach_profiles(cls, users):
+        """
+        批量加载 profile 并缓存在 user 对象上，之后访问 user.profile 不会再查询数据库
+        """
+        users = [user for user in users if user is not None]
+        profiles = cls.get_profiles_by_user_ids([user.id for user in users])
+        for user in users:
+            setattr(user, '_cached_user_profile', profiles[user.id])
+
+    @classmethod
+    def refresh_avatar_variants(cls, profile):
+        """
+        换了头像以后先清空旧的缩略图，提交以后再异步生成新的
+        """
+        UserProfile.objects.filter(id=profile.id).update(**{
+            'avatar_{}'.format(variant): None
+            for variant in IMAGE_VARIANTS
+        })
+        if not profile.avatar:
+            return
+        avatar_name = profile.avatar.name
+        transaction.on_commit(
+            lambda: generate_avatar_variants_task.delay(profile.id, avatar_name),
+        )
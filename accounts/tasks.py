@@ -0,0 +1,34 @@
+from accounts.models import UserProfile
+from celery import shared_task
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+from utils.images import ImageTooLargeError, ImageVariantHelper
+from utils.time_constants import ONE_HOUR
+
+
+@shared_task(
+    bind=True,
+    queue='photos',
+    time_limit=ONE_HOUR,
+    max_retries=settings.TWEET_PHOTO_UPLOAD_MAX_RETRIES,
+)
+def generate_avatar_variants_task(self, profile_id, avatar_name):
+    profile = UserProfile.objects.filter(id=profile_id, avatar=avatar_name).first()
+    # 任务执行之前用户可能又换了头像，新的头像会有自己的任务
+    if profile is None or not profile.avatar:
+        return 'avatar of profile {} has changed'.format(profile_id)
+    try:
+        names = ImageVariantHelper.save_variants(profile.avatar)
+    except (UnidentifiedImageError, ImageTooLargeError, Image.DecompressionBombError) as exc:
+        return 'avatar of profile {} is not a valid image: {}'.format(profile_id, exc)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            return 'failed to generate avatar variants for profile {}'.format(profile_id)
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+
+    # 带上原来的头像做条件，生成期间换过头像的话不会把旧头像的缩略图写进去
+    UserProfile.objects.filter(id=profile_id, avatar=avatar_name).update(**{
+        'avatar_{}'.format(variant): name
+        for variant, name in names.items()
+    })
+    return 'avatar variants generated for profile {}'.format(profile_id)
@@ -1,9 +1,10 @@
 from accounts.api.serializers import UserSerializerForComment
 from comments.models import Comment
+from comments.services import CommentService
 from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from tweets.models import Tweet
+from tweets.services import TweetService
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -24,9 +25,12 @@ class CommentSerializer(serializers.ModelSerializer):
         )
 
     def get_likes_count(self, obj):
-        return obj.like_set.count()
+        return obj.likes_count
 
     def get_has_liked(self, obj):
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.has_liked(obj.id)
         return LikeService.has_liked(self.context['request'].user, obj)
 
 
@@ -42,14 +46,14 @@ class CommentSerializerForCreate(serializers.ModelSerializer):
 
     def validate(self, data):
         tweet_id = data['tweet_id']
-        if not Tweet.objects.filter(id=tweet_id).exists():
+        if TweetService.get(tweet_id) is None:
             raise ValidationError({'message': 'tweet does not exist'})
         # 必须 return validated data
         # 也就是验证过之后，进行过处理的（当然也可以不做处理）输入数据
         return data
 
     def create(self, validated_data):
-        return Comment.objects.create(
+        return CommentService.create_comment(
             user_id=validated_data['user_id'],
             tweet_id=validated_data['tweet_id'],
             content=validated_data['content'],
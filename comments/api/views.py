@@ -2,7 +2,9 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from utils.decorators import required_params
+from comments.hydrators import CommentHydrator
 from comments.models import Comment
+from comments.services import CommentService
 from inbox.services import NotificationService
 from utils.permissions import IsObjectOwner
 from comments.api.serializers import (
@@ -69,17 +71,17 @@ class CommentViewSet(viewsets.GenericViewSet):
         )
 
     def destroy(self, request, *args, **kwargs):
-        comment = self.get_object()
-        comment.delete()
+        CommentService.delete_comment(self.get_object())
         return Response({'success': True}, status=status.HTTP_200_OK)
 
     @required_params(params=['tweet_id'])
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
         comments = self.filter_queryset(queryset).order_by('created_at')
+        hydrator = CommentHydrator(comments, request.user)
         serializer = CommentSerializer(
-            comments,
-            context={'request': request},
+            hydrator.comments,
+            context={'request': request, 'hydrator': hydrator},
             many=True,
         )
         return Response(
@@ -0,0 +1,40 @@
+from accounts.services import UserService
+from comments.models import Comment
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from likes.models import Like
+
+
+class CommentHydrator(object):
+    """
+    和 TweetHydrator 一样，一页 comments 的 user, profile, has_liked 用固定数量的 query 批量取出来
+    通过 serializer 的 context['hydrator'] 传给 CommentSerializer
+    """
+
+    def __init__(self, comments, viewer):
+        self.comments = [comment for comment in comments if comment is not None]
+        self.viewer = viewer
+        self._liked_comment_ids = set()
+        if not self.comments:
+            return
+
+        self._load_users()
+        self._load_liked_comment_ids([comment.id for comment in self.comments])
+
+    def _load_users(self):
+        users = User.objects.in_bulk({comment.user_id for comment in self.comments})
+        UserService.attach_profiles(users.values())
+        for comment in self.comments:
+            comment.user = users.get(comment.user_id)
+
+    def _load_liked_comment_ids(self, comment_ids):
+        if self.viewer is None or self.viewer.is_anonymous:
+            return
+        self._liked_comment_ids = set(Like.objects.filter(
+            content_type=ContentType.objects.get_for_model(Comment),
+            object_id__in=comment_ids,
+            user=self.viewer,
+        ).values_list('object_id', flat=True))
+
+    def has_liked(self, comment_id):
+        return comment_id in self._liked_comment_ids
@@ -14,6 +14,8 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    likes_count = models.IntegerField(default=0)
+
     class Meta:
         index_together = (('tweet', 'created_at'),)
 
@@ -0,0 +1,41 @@
+from comments.models import Comment
+from django.db import transaction
+from tweets.models import Tweet
+from tweets.services import TweetService
+from utils.counters import CounterHelper
+
+
+class CommentService(object):
+
+    @classmethod
+    def create_comment(cls, user_id, tweet_id, content):
+        with transaction.atomic():
+            comment = Comment.objects.create(
+                user_id=user_id,
+                tweet_id=tweet_id,
+                content=content,
+            )
+            CounterHelper.incr(Tweet, tweet_id, 'comments_count')
+            TweetService.invalidate_tweet_cache(tweet_id)
+        return comment
+
+    @classmethod
+    def delete_comment(cls, comment):
+        with transaction.atomic():
+            tweet_id = comment.tweet_id
+            comment.delete()
+            if tweet_id is not None:
+                CounterHelper.decr(Tweet, tweet_id, 'comments_count')
+                TweetService.invalidate_tweet_cache(tweet_id)
+
+    @classmethod
+    def reconcile_comments_count(cls, batch_size=1000, sleep=0):
+        return CounterHelper.reconcile(
+            Tweet,
+            'comments_count',
+            Comment.objects.all(),
+            'tweet_id',
+            batch_size=batch_size,
+            sleep=sleep,
+            on_fixed=TweetService.invalidate_tweet_cache,
+        )
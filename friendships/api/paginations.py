@@ -1,7 +1,27 @@
+from functools import partial
+
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 
+class CountedPaginator(Paginator):
+    """
+    总数由调用方给出的 Paginator，不会在表上 count(*)
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is None:
+            return super().count
+        return self._count
+
+
 class FriendshipPagination(PageNumberPagination):
     # 默认的 page size，也就是 page 没有在 url 参数里的时候
     page_size = 20
@@ -12,6 +32,11 @@ class FriendshipPagination(PageNumberPagination):
     # 允许客户端指定的最大 page_size 是多少
     max_page_size = 20
 
+    def paginate_queryset(self, queryset, request, view=None, count=None):
+        # count 可以直接用 UserProfile 上冗余的关注数，粉丝多的用户翻页时不用每次都 count
+        self.django_paginator_class = partial(CountedPaginator, count=count)
+        return super().paginate_queryset(queryset, request, view)
+
     def get_paginated_response(self, data):
         return Response({
             'total_results': self.page.paginator.count,
@@ -38,6 +38,9 @@ class FollowerSerializer(serializers.ModelSerializer):
         fields = ('user', 'created_at', 'has_followed')
 
     def get_has_followed(self, obj):
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.has_followed(obj.from_user_id)
         if self.context['request'].user.is_anonymous:
             return False
 
@@ -54,6 +57,9 @@ class FollowingSerializer(serializers.ModelSerializer):
         fields = ('user', 'created_at', 'has_followed')
 
     def get_has_followed(self, obj):
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.has_followed(obj.to_user_id)
         if self.context['request'].user.is_anonymous:
             return False
 
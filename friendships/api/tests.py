@@ -1,3 +1,5 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from friendships.api.paginations import FriendshipPagination
 from friendships.models import Friendship
 from rest_framework.test import APIClient
@@ -8,6 +10,7 @@ FOLLOWERS_URL = '/api/friendships/{}/followers/'
 FOLLOWINGS_URL = '/api/friendships/{}/followings/'
 class FriendshipApiTests(TestCase):
     def setUp(self):
+        self.clear_cache()
         self.linghu = self.create_user('linghu')
         self.linghu_client = APIClient()
         self.linghu_client.force_authenticate(self.linghu)
@@ -169,6 +172,49 @@ class FriendshipApiTests(TestCase):
         for result in response.data['results']:
             self.assertEqual(result['has_followed'], True)
 
+    def test_friendship_pages_queries(self):
+        def count_queries(url):
+            # 先预热 cache 和 profile
+            self.linghu_client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.linghu_client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        for url in [FOLLOWERS_URL, FOLLOWINGS_URL]:
+            url = url.format(self.dongxie.id)
+            before = count_queries(url)
+            for i in range(5):
+                user = self.create_user('{}{}'.format(url.split('/')[-2], i))
+                if 'followers' in url:
+                    Friendship.objects.create(from_user=user, to_user=self.dongxie)
+                else:
+                    Friendship.objects.create(from_user=self.dongxie, to_user=user)
+                Friendship.objects.create(from_user=self.linghu, to_user=user)
+            # 每一行的 user, profile 和 has_followed 都是批量加载的，query 数量和页面大小无关
+            self.assertEqual(count_queries(url), before)
+
+    def test_friendship_pages_use_stored_counts(self):
+        for url, count in [(FOLLOWERS_URL, 2), (FOLLOWINGS_URL, 3)]:
+            url = url.format(self.dongxie.id)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.anonymous_client.get(url)
+            self.assertEqual(response.data['total_results'], count)
+            # 总数来自 UserProfile，不会在 friendship 表上 count
+            self.assertFalse(any(
+                'COUNT(' in query['sql'] and 'friendship' in query['sql']
+                for query in queries.captured_queries
+            ))
+
+        response = self.linghu_client.post(FOLLOW_URL.format(self.dongxie.id))
+        self.assertEqual(response.status_code, 201)
+        response = self.anonymous_client.get(FOLLOWERS_URL.format(self.dongxie.id))
+        self.assertEqual(response.data['total_results'], 3)
+        self.assertEqual(response.data['results'][0]['user']['followings_count'], 1)
+        self.linghu_client.post(UNFOLLOW_URL.format(self.dongxie.id))
+        response = self.anonymous_client.get(FOLLOWERS_URL.format(self.dongxie.id))
+        self.assertEqual(response.data['total_results'], 2)
+
     def _test_friendship_pagination(self, url, page_size, max_page_size):
         response = self.anonymous_client.get(url, {'page': 1})
         self.assertEqual(response.status_code, 200)
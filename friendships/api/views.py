@@ -5,7 +5,11 @@ from friendships.api.serializers import (
     FollowingSerializer,
     FriendshipSerializerForCreate,
 )
+from friendships.hydrators import FriendshipHydrator
 from friendships.models import Friendship
+from friendships.services import FriendshipService
+from newsfeeds.services import NewsFeedService
+from django.db import transaction
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -16,18 +20,38 @@ class FriendshipViewSet(viewsets.GenericViewSet):
     queryset = User.objects.all()
     pagination_class = FriendshipPagination
 
+    def paginate_friendships(self, friendships, user_id, count_field):
+        # 总数直接读 UserProfile 上的计数，还没有 profile 的用户才 count
+        counts = FriendshipService.get_friendship_counts(user_id)
+        return self.paginator.paginate_queryset(
+            friendships,
+            self.request,
+            view=self,
+            count=counts[count_field] if counts is not None else None,
+        )
+
     @action(methods=['GET'], detail=True, permission_classes=[AllowAny])
     def followers(self, request, pk):
         friendships = Friendship.objects.filter(to_user_id=pk).order_by('-created_at')
-        page = self.paginate_queryset(friendships)
-        serializer = FollowerSerializer(page, many=True, context={'request': request})
+        page = self.paginate_friendships(friendships, pk, 'followers_count')
+        hydrator = FriendshipHydrator(page, request.user, 'from_user')
+        serializer = FollowerSerializer(
+            hydrator.friendships,
+            many=True,
+            context={'request': request, 'hydrator': hydrator},
+        )
         return self.get_paginated_response(serializer.data)
 
     @action(methods=['GET'], detail=True, permission_classes=[AllowAny])
     def followings(self, request, pk):
         friendships = Friendship.objects.filter(from_user_id=pk).order_by('-created_at')
-        page = self.paginate_queryset(friendships)
-        serializer = FollowingSerializer(page, many=True, context={'request': request})
+        page = self.paginate_friendships(friendships, pk, 'followings_count')
+        hydrator = FriendshipHydrator(page, request.user, 'to_user')
+        serializer = FollowingSerializer(
+            hydrator.friendships,
+            many=True,
+            context={'request': request, 'hydrator': hydrator},
+        )
         return self.get_paginated_response(serializer.data)
 
     @action(methods=['POST'], detail=True, permission_classes=[IsAuthenticated])
@@ -46,7 +70,10 @@ class FriendshipViewSet(viewsets.GenericViewSet):
                 'success': False,
                 'errors': serializer.errors,
             }, status=400)
-        serializer.save()
+        # friendship 和双方的关注计数在同一个事务里写入
+        with transaction.atomic():
+            friendship = serializer.save()
+        NewsFeedService.backfill_followee(friendship.from_user_id, friendship.to_user_id)
         return Response({'success': True}, status=201)
 
     @action(methods=['POST'], detail=True, permission_classes=[IsAuthenticated])
@@ -56,9 +83,12 @@ class FriendshipViewSet(viewsets.GenericViewSet):
                 'success': False,
                 'message': 'You cannot unfollow yourself',
             }, status=400)
-        deleted, _ = Friendship.objects.filter(
-            from_user=request.user,
-            to_user=pk,
-        ).delete()
+        with transaction.atomic():
+            deleted, _ = Friendship.objects.filter(
+                from_user=request.user,
+                to_user=pk,
+            ).delete()
+        if deleted:
+            NewsFeedService.retract_followee(request.user.id, int(pk))
         return Response({'success': True, 'deleted': deleted})
 
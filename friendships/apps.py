@@ -3,3 +3,16 @@ from django.apps import AppConfig
 
 class FriendshipsConfig(AppConfig):
     name = 'friendships'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from friendships.listeners import (
+            decr_friendship_counts,
+            incr_friendship_counts,
+            invalidate_friendship_ids,
+        )
+        from friendships.models import Friendship
+        post_save.connect(invalidate_friendship_ids, sender=Friendship)
+        post_save.connect(incr_friendship_counts, sender=Friendship)
+        post_delete.connect(invalidate_friendship_ids, sender=Friendship)
+        post_delete.connect(decr_friendship_counts, sender=Friendship)
@@ -0,0 +1,35 @@
+from accounts.services import UserService
+from django.contrib.auth.models import User
+from friendships.services import FriendshipService
+
+
+class FriendshipHydrator(object):
+    """
+    一页 followers / followings 的 user, profile, has_followed 用固定数量的 query 批量取出来
+    user_field 是列表里要展示的那个人，followers 是 from_user，followings 是 to_user
+    通过 serializer 的 context['hydrator'] 传给 FollowerSerializer / FollowingSerializer
+    """
+
+    def __init__(self, friendships, viewer, user_field):
+        self.friendships = list(friendships)
+        self.viewer = viewer
+        self.user_field = user_field
+        self._followed_user_ids = set()
+        if not self.friendships:
+            return
+
+        user_ids = [self._get_user_id(friendship) for friendship in self.friendships]
+        self._load_users(user_ids)
+        self._followed_user_ids = FriendshipService.get_followed_user_ids(viewer, user_ids)
+
+    def _get_user_id(self, friendship):
+        return getattr(friendship, '{}_id'.format(self.user_field))
+
+    def _load_users(self, user_ids):
+        users = User.objects.in_bulk(set(user_ids))
+        UserService.attach_profiles(users.values())
+        for friendship in self.friendships:
+            setattr(friendship, self.user_field, users.get(self._get_user_id(friendship)))
+
+    def has_followed(self, user_id):
+        return user_id in self._followed_user_ids
@@ -0,0 +1,15 @@
+def invalidate_friendship_ids(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    FriendshipService.invalidate_friendship_ids(instance.from_user_id, instance.to_user_id)
+
+
+def incr_friendship_counts(sender, instance, created, **kwargs):
+    if not created:
+        return
+    from friendships.services import FriendshipService
+    FriendshipService.incr_friendship_counts(instance.from_user_id, instance.to_user_id, 1)
+
+
+def decr_friendship_counts(sender, instance, **kwargs):
+    from friendships.services import FriendshipService
+    FriendshipService.incr_friendship_counts(instance.from_user_id, instance.to_user_id, -1)
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from friendships.services import FriendshipService
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute UserProfile.followers_count and UserProfile.followings_count '
+        'in batches and fix the rows that drifted from the friendship table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to sleep between two batches.',
+        )
+
+    def handle(self, *args, **options):
+        fixed = FriendshipService.reconcile_friendship_counts(
+            options['batch_size'],
+            options['sleep'],
+        )
+        for name, count in fixed.items():
+            self.stdout.write(self.style.SUCCESS('{} {} fixed'.format(count, name)))
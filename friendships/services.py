@@ -1,4 +1,24 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from accounts.models import UserProfile
 from friendships.models import Friendship
+from utils.counters import CounterHelper
+from utils.lru_cache import LRUCache
+from utils.time_constants import ONE_DAY, ONE_HOUR
+
+FOLLOWERS_COUNT_PATTERN = 'friendships:followers_count:{user_id}'
+# id 列表的 key 里带着版本号，关注和取关的时候只需要换一个新的版本号，
+# 每个进程内存里的 LRU 也用同样的 key，不会读到别的进程已经失效的数据
+FOLLOWER_IDS_PATTERN = 'friendships:follower_ids:{user_id}:{version}'
+FOLLOWING_IDS_PATTERN = 'friendships:following_ids:{user_id}:{version}'
+FOLLOWER_IDS_VERSION_PATTERN = 'friendships:follower_ids_version:{user_id}'
+FOLLOWING_IDS_VERSION_PATTERN = 'friendships:following_ids_version:{user_id}'
+
+_local_cache = LRUCache(settings.FRIENDSHIP_IDS_LOCAL_CACHE_SIZE)
 
 
 class FriendshipService(object):
@@ -9,9 +29,181 @@ class FriendshipService(object):
         ).prefetch_related('from_user')
         return [friendship.from_user for friendship in friendships]
 
+    @classmethod
+    def _get_version(cls, version_key):
+        version = cache.get(version_key)
+        if version is None:
+            # 版本号被淘汰以后换一个新的，旧版本的 id 列表不会再被读到
+            cache.add(version_key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(version_key)
+        return version
+
+    @classmethod
+    def _get_ids(cls, pattern, version_pattern, user_id, queryset, id_field):
+        """
+        先读进程内的 LRU，再读共享的 cache，都没有命中才查数据库
+        返回 tuple，调用方不能修改 LRU 里的数据
+        """
+        version = cls._get_version(version_pattern.format(user_id=user_id))
+        if version is None:
+            # cache 不可用的时候直接查数据库，也不能写到 LRU 里
+            return tuple(queryset.values_list(id_field, flat=True))
+        key = pattern.format(user_id=user_id, version=version)
+        ids = _local_cache.get(key)
+        if ids is not None:
+            return ids
+        ids = cache.get(key)
+        if ids is None:
+            ids = tuple(queryset.values_list(id_field, flat=True))
+            cache.set(key, ids, timeout=ONE_DAY)
+        _local_cache.set(key, ids)
+        return ids
+
+    @classmethod
+    def _get_follower_ids(cls, to_user_id):
+        return cls._get_ids(
+            FOLLOWER_IDS_PATTERN,
+            FOLLOWER_IDS_VERSION_PATTERN,
+            to_user_id,
+            Friendship.objects.filter(to_user_id=to_user_id),
+            'from_user_id',
+        )
+
+    @classmethod
+    def _get_following_ids(cls, from_user_id):
+        return cls._get_ids(
+            FOLLOWING_IDS_PATTERN,
+            FOLLOWING_IDS_VERSION_PATTERN,
+            from_user_id,
+            Friendship.objects.filter(from_user_id=from_user_id),
+            'to_user_id',
+        )
+
+    @classmethod
+    def get_follower_ids(cls, to_user_id):
+        # fanout 只需要 id，不需要把 User 对象整个取出来
+        return list(cls._get_follower_ids(to_user_id))
+
+    @classmethod
+    def get_following_ids(cls, from_user_id):
+        return list(cls._get_following_ids(from_user_id))
+
+    @classmethod
+    def get_followed_user_ids(cls, viewer, user_ids):
+        """
+        返回 user_ids 里 viewer 已经关注了的人，一页 followers / followings 只需要读一次关注列表
+        """
+        if viewer is None or viewer.is_anonymous:
+            return set()
+        return set(cls._get_following_ids(viewer.id)).intersection(user_ids)
+
+    @classmethod
+    def invalidate_friendship_ids(cls, from_user_id, to_user_id):
+        keys = [
+            FOLLOWING_IDS_VERSION_PATTERN.format(user_id=from_user_id),
+            FOLLOWER_IDS_VERSION_PATTERN.format(user_id=to_user_id),
+        ]
+
+        def renew_versions():
+            cache.set_many({key: uuid.uuid4().hex for key in keys}, timeout=None)
+
+        renew_versions()
+        # 事务提交之前，并发的请求可能又把旧的数据写到了新版本下，提交以后再换一次
+        transaction.on_commit(renew_versions)
+
+    @classmethod
+    def get_followers_counts(cls, user_ids):
+        """
+        返回 {user_id: followers_count}
+        粉丝数只用来判断是否是大V，允许有一定的延迟，所以缓存一段时间，
+        避免每次读 newsfeed 都要查一遍 UserProfile
+        """
+        keys = {
+            user_id: FOLLOWERS_COUNT_PATTERN.format(user_id=user_id)
+            for user_id in user_ids
+        }
+        cached = cache.get_many(keys.values())
+        counts = {}
+        missing_ids = []
+        for user_id, key in keys.items():
+            if key in cached:
+                counts[user_id] = cached[key]
+            else:
+                missing_ids.append(user_id)
+        if not missing_ids:
+            return counts
+
+        missing_counts = {user_id: 0 for user_id in missing_ids}
+        missing_counts.update(UserProfile.objects.filter(
+            user_id__in=missing_ids,
+        ).values_list('user_id', 'followers_count'))
+        cache.set_many({
+            keys[user_id]: count
+            for user_id, count in missing_counts.items()
+        }, timeout=ONE_HOUR)
+        counts.update(missing_counts)
+        return counts
+
+    @classmethod
+    def invalidate_followers_count(cls, user_id):
+        cache.delete(FOLLOWERS_COUNT_PATTERN.format(user_id=user_id))
+
+    @classmethod
+    def get_followers_count(cls, user_id):
+        return cls.get_followers_counts([user_id])[user_id]
+
+    @classmethod
+    def get_friendship_counts(cls, user_id):
+        """
+        返回 {'followers_count': ..., 'followings_count': ...}，还没有 profile 的用户返回 None
+        """
+        return UserProfile.objects.filter(user_id=user_id).values(
+            'followers_count',
+            'followings_count',
+        ).first()
+
+    @classmethod
+    def incr_friendship_counts(cls, from_user_id, to_user_id, delta):
+        for user_id, field in [
+            (from_user_id, 'followings_count'),
+            (to_user_id, 'followers_count'),
+        ]:
+            updated = UserProfile.objects.filter(user_id=user_id).update(**{
+                field: F(field) + delta,
+            })
+            if updated:
+                continue
+            # 还没有 profile 的用户，创建的时候直接从 friendship 表里数出来，
+            # 这时候这一次的关注 / 取关已经写到了 friendship 表里
+            UserProfile.objects.get_or_create(user_id=user_id, defaults={
+                'followers_count': Friendship.objects.filter(to_user_id=user_id).count(),
+                'followings_count': Friendship.objects.filter(from_user_id=user_id).count(),
+            })
+
+    @classmethod
+    def reconcile_friendship_counts(cls, batch_size=1000, sleep=0):
+        """
+        返回 {field: 被修正的行数}
+        """
+        return {
+            field: CounterHelper.reconcile(
+                UserProfile,
+                field,
+                Friendship.objects.all(),
+                group_field,
+                batch_size=batch_size,
+                sleep=sleep,
+                key_field='user_id',
+            )
+            for field, group_field in [
+                ('followers_count', 'to_user_id'),
+                ('followings_count', 'from_user_id'),
+            ]
+        }
+
     @classmethod
     def has_followed(cls, from_user, to_user):
-        return Friendship.objects.filter(
-            from_user=from_user,
-            to_user=to_user,
-        ).exists()
\ No newline at end of file
+        # 可以传 User 对象或者 user id，关注列表一般不大，直接在 id 列表里找
+        from_user_id = getattr(from_user, 'id', from_user)
+        to_user_id = getattr(to_user, 'id', to_user)
+        return int(to_user_id) in cls._get_following_ids(from_user_id)
@@ -1,3 +1,119 @@
-from django.test import TestCase
+from accounts.models import UserProfile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from friendships.models import Friendship
+from friendships.services import FriendshipService, _local_cache
+from io import StringIO
+from testing.testcases import TestCase
 
-# Create your tests here.
+
+class FriendshipServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        _local_cache.clear()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+        self.followers = [self.create_user('follower{}'.format(i)) for i in range(3)]
+        for follower in self.followers:
+            self.create_friendship(follower, self.linghu)
+
+    def test_get_follower_ids(self):
+        expected = sorted(follower.id for follower in self.followers)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sorted(FriendshipService.get_follower_ids(self.linghu.id)), expected)
+        self.assertEqual(len(queries), 1)
+        # 第二次直接读进程内的 LRU
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sorted(FriendshipService.get_follower_ids(self.linghu.id)), expected)
+        self.assertEqual(len(queries), 0)
+        # LRU 被清空以后读共享的 cache
+        _local_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sorted(FriendshipService.get_follower_ids(self.linghu.id)), expected)
+        self.assertEqual(len(queries), 0)
+
+        # 返回的是拷贝，修改它不会影响 cache
+        FriendshipService.get_follower_ids(self.linghu.id).append(0)
+        self.assertEqual(sorted(FriendshipService.get_follower_ids(self.linghu.id)), expected)
+        self.assertEqual(FriendshipService.get_follower_ids(self.dongxie.id), [])
+
+    def test_invalidate_on_follow_and_unfollow(self):
+        self.assertEqual(FriendshipService.get_following_ids(self.dongxie.id), [])
+        self.assertEqual(len(FriendshipService.get_follower_ids(self.linghu.id)), 3)
+        self.assertFalse(FriendshipService.has_followed(self.dongxie, self.linghu))
+
+        self.create_friendship(self.dongxie, self.linghu)
+        self.assertEqual(FriendshipService.get_following_ids(self.dongxie.id), [self.linghu.id])
+        self.assertEqual(len(FriendshipService.get_follower_ids(self.linghu.id)), 4)
+        self.assertTrue(FriendshipService.has_followed(self.dongxie, self.linghu))
+        # 传 id 也可以
+        self.assertTrue(FriendshipService.has_followed(self.dongxie.id, str(self.linghu.id)))
+
+        Friendship.objects.filter(from_user=self.dongxie, to_user=self.linghu).delete()
+        self.assertEqual(FriendshipService.get_following_ids(self.dongxie.id), [])
+        self.assertEqual(len(FriendshipService.get_follower_ids(self.linghu.id)), 3)
+        self.assertFalse(FriendshipService.has_followed(self.dongxie, self.linghu))
+
+    def test_has_followed_uses_cache(self):
+        FriendshipService.has_followed(self.followers[0], self.linghu)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(FriendshipService.has_followed(self.followers[0], self.linghu))
+            self.assertFalse(FriendshipService.has_followed(self.followers[0], self.dongxie))
+        self.assertEqual(len(queries), 0)
+
+    def test_friendship_counts(self):
+        self.assertEqual(self.linghu.profile.followers_count, 3)
+        self.assertEqual(self.followers[0].profile.followings_count, 1)
+
+        self.create_friendship(self.linghu, self.dongxie)
+        self.create_friendship(self.dongxie, self.linghu)
+        Friendship.objects.filter(from_user=self.followers[0], to_user=self.linghu).delete()
+        self.assertEqual(FriendshipService.get_friendship_counts(self.linghu.id), {
+            'followers_count': 3,
+            'followings_count': 1,
+        })
+        self.assertEqual(FriendshipService.get_friendship_counts(self.dongxie.id), {
+            'followers_count': 1,
+            'followings_count': 1,
+        })
+        self.assertEqual(FriendshipService.get_friendship_counts(self.followers[0].id), {
+            'followers_count': 0,
+            'followings_count': 0,
+        })
+
+        # 没有 profile 的用户被关注的时候，从 friendship 表里数出来
+        user = self.create_user('noprofile')
+        UserProfile.objects.filter(user=user).delete()
+        self.create_friendship(user, self.dongxie)
+        self.assertEqual(FriendshipService.get_friendship_counts(user.id), {
+            'followers_count': 0,
+            'followings_count': 1,
+        })
+        self.assertEqual(FriendshipService.get_followers_counts([self.linghu.id, user.id]), {
+            self.linghu.id: 3,
+            user.id: 0,
+        })
+
+    def test_reconcile_friendship_counts_command(self):
+        UserProfile.objects.filter(user=self.linghu).update(followers_count=10, followings_count=-1)
+        UserProfile.objects.filter(user=self.followers[1]).update(followings_count=0)
+
+        out = StringIO()
+        call_command('reconcile_friendship_counts', '--batch-size', '2', '--sleep', '0', stdout=out)
+        self.assertIn('1 followers_count fixed', out.getvalue())
+        self.assertIn('2 followings_count fixed', out.getvalue())
+        self.assertEqual(FriendshipService.get_friendship_counts(self.linghu.id), {
+            'followers_count': 3,
+            'followings_count': 0,
+        })
+        self.assertEqual(
+            FriendshipService.get_friendship_counts(self.followers[1].id)['followings_count'],
+            1,
+        )
+
+        out = StringIO()
+        call_command('reconcile_friendship_counts', '--sleep', '0', stdout=out)
+        self.assertIn('0 followers_count fixed', out.getvalue())
+        self.assertIn('0 followings_count fixed', out.getvalue())
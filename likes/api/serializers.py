@@ -1,10 +1,11 @@
 from accounts.api.serializers import UserSerializerForLike
 from comments.models import Comment
-from django.contrib.contenttypes.models import ContentType
 from likes.models import Like
+from likes.services import LikeService
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from tweets.models import Tweet
+from tweets.services import TweetService
 
 
 class LikeSerializer(serializers.ModelSerializer):
@@ -34,7 +35,10 @@ class BaseLikeSerializerForCreateAndCancel(serializers.ModelSerializer):
         model_class = self._get_model_class(data)
         if model_class is None:
             raise ValidationError({'content_type': 'Content type does not exist'})
-        liked_object = model_class.objects.filter(id=data['object_id']).first()
+        if model_class is Tweet:
+            liked_object = TweetService.get(data['object_id'])
+        else:
+            liked_object = model_class.objects.filter(id=data['object_id']).first()
         if liked_object is None:
             raise ValidationError({'object_id': 'Object does not exist'})
         return data
@@ -42,19 +46,17 @@ class BaseLikeSerializerForCreateAndCancel(serializers.ModelSerializer):
 
 class LikeSerializerForCreate(BaseLikeSerializerForCreateAndCancel):
     def get_or_create(self):
-        model_class = self._get_model_class(self.validated_data)
-        return Like.objects.get_or_create(
-            content_type=ContentType.objects.get_for_model(model_class),
-            object_id=self.validated_data['object_id'],
-            user=self.context['request'].user,
+        return LikeService.create_like(
+            self.context['request'].user,
+            self._get_model_class(self.validated_data),
+            self.validated_data['object_id'],
         )
 
 
 class LikeSerializerForCancel(BaseLikeSerializerForCreateAndCancel):
     def cancel(self):
-        model_class = self._get_model_class(self.validated_data)
-        Like.objects.filter(
-            content_type=ContentType.objects.get_for_model(model_class),
-            object_id=self.validated_data['object_id'],
-            user=self.context['request'].user,
-        ).delete()
\ No newline at end of file
+        return LikeService.cancel_like(
+            self.context['request'].user,
+            self._get_model_class(self.validated_data),
+            self.validated_data['object_id'],
+        )
\ No newline at end of file
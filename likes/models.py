@@ -5,7 +5,8 @@ from django.db import models
 
 
 class Like(models.Model):
-    object_id = models.PositiveIntegerField()
+    # tweet 的 id 是 64 位的 snowflake id
+    object_id = models.PositiveBigIntegerField()
     content_type = models.ForeignKey(
         ContentType,
         on_delete=models.SET_NULL,
@@ -1,5 +1,9 @@
-from likes.models import Like
 from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from likes.models import Like
+from tweets.models import Tweet
+from tweets.services import TweetService
+from utils.counters import CounterHelper
 
 
 class LikeService(object):
@@ -12,4 +16,59 @@ class LikeService(object):
             content_type=ContentType.objects.get_for_model(target.__class__),
             object_id=target.id,
             user=user,
-        ).exists()
\ No newline at end of file
+        ).exists()
+
+    @classmethod
+    def _get_invalidator(cls, model_class):
+        # F() 的 update 不会触发 post_save，cache 里的 tweet 需要手动清理
+        if model_class is Tweet:
+            return TweetService.invalidate_tweet_cache
+        return None
+
+    @classmethod
+    def _incr_likes_count(cls, model_class, object_id, delta):
+        CounterHelper.incr(model_class, object_id, 'likes_count', delta)
+        invalidator = cls._get_invalidator(model_class)
+        if invalidator is not None:
+            invalidator(object_id)
+
+    @classmethod
+    def create_like(cls, user, model_class, object_id):
+        # 写 Like 和更新 likes_count 在同一个事务里，要么都成功要么都失败
+        with transaction.atomic():
+            instance, created = Like.objects.get_or_create(
+                content_type=ContentType.objects.get_for_model(model_class),
+                object_id=object_id,
+                user=user,
+            )
+            if created:
+                cls._incr_likes_count(model_class, object_id, 1)
+        return instance, created
+
+    @classmethod
+    def cancel_like(cls, user, model_class, object_id):
+        with transaction.atomic():
+            _, deleted = Like.objects.filter(
+                content_type=ContentType.objects.get_for_model(model_class),
+                object_id=object_id,
+                user=user,
+            ).delete()
+            # 没有点过赞的时候什么都不会删掉，计数也不能减
+            deleted = deleted.get(Like._meta.label, 0)
+            if deleted:
+                cls._incr_likes_count(model_class, object_id, -deleted)
+        return deleted
+
+    @classmethod
+    def reconcile_likes_count(cls, model_class, batch_size=1000, sleep=0):
+        return CounterHelper.reconcile(
+            model_class,
+            'likes_count',
+            Like.objects.filter(
+                content_type=ContentType.objects.get_for_model(model_class),
+            ),
+            'object_id',
+            batch_size=batch_size,
+            sleep=sleep,
+            on_fixed=cls._get_invalidator(model_class),
+        )
@@ -8,5 +8,7 @@ class NewsFeedSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = NewsFeed
+        # id 已经不推荐使用，只是为了兼容老的客户端，去重请用 tweet.id
+        # 从大V那里 pull 过来的帖子没有 newsfeed，id 是 null
         fields = ('id', 'created_at', 'user', 'tweet')
 
@@ -1,8 +1,15 @@
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
 from friendships.models import Friendship
 from testing.testcases import TestCase
 from rest_framework.test import APIClient
 from rest_framework import status
+from unittest import mock
+from utils.paginations import EndlessPagination
 
 NEWSFEEDS_URL = '/api/newsfeeds/'
 POST_TWEETS_URL = '/api/tweets/'
@@ -12,6 +19,7 @@ FOLLOW_URL = '/api/friendships/{}/follow/'
 class NewsFeedApiTest(TestCase):
 
     def setUp(self):
+        self.clear_cache()
         self.gongzi = self.create_user('gongzi')
         self.gongzi_client = APIClient()
         self.gongzi_client.force_authenticate(self.gongzi)
@@ -39,17 +47,208 @@ class NewsFeedApiTest(TestCase):
 
         # initial state, has nothing
         response = self.gongzi_client.get(NEWSFEEDS_URL)
-        self.assertEqual(len(response.data['newsfeeds']), 0)
+        self.assertEqual(len(response.data['results']), 0)
 
-        self.gongzi_client.post(POST_TWEETS_URL, {'content': 'Hello Gongzi'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gongzi_client.post(POST_TWEETS_URL, {'content': 'Hello Gongzi'})
         response = self.gongzi_client.get(NEWSFEEDS_URL)
-        self.assertEqual(len(response.data['newsfeeds']), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
         self.gongzi_client.post(FOLLOW_URL.format(self.xiaoweige.id))
-        response = self.xiaoweige_client.post(POST_TWEETS_URL, {
-            'content': 'Hello Gongzi',
-        })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.xiaoweige_client.post(POST_TWEETS_URL, {
+                'content': 'Hello Gongzi',
+            })
         posted_tweet_id = response.data['id']
         response = self.gongzi_client.get(NEWSFEEDS_URL)
-        self.assertEqual(len(response.data['newsfeeds']), 2)
-        self.assertEqual(response.data['newsfeeds'][0]['tweet']['id'], posted_tweet_id)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], posted_tweet_id)
+        # 兼容老的客户端，仍然返回 newsfeed 的 id
+        self.assertEqual(
+            response.data['results'][0]['id'],
+            NewsFeed.objects.for_user(self.gongzi.id).get(tweet_id=posted_tweet_id).id,
+        )
+
+    def test_pagination(self):
+        page_size = EndlessPagination.page_size
+        followed_user = self.create_user('followed')
+        newsfeeds = []
+        for i in range(page_size * 2):
+            tweet = self.create_tweet(followed_user)
+            newsfeed = self.create_newsfeed(user=self.gongzi, tweet=tweet)
+            newsfeeds.append(newsfeed)
+
+        newsfeeds = newsfeeds[::-1]
+
+        # pull the first page
+        response = self.gongzi_client.get(NEWSFEEDS_URL)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(len(response.data['results']), page_size)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], newsfeeds[0].tweet_id)
+        self.assertEqual(response.data['results'][1]['tweet']['id'], newsfeeds[1].tweet_id)
+        self.assertEqual(
+            response.data['results'][page_size - 1]['tweet']['id'],
+            newsfeeds[page_size - 1].tweet_id,
+        )
+
+        # pull the second page
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {
+            'created_at__lt': newsfeeds[page_size - 1].created_at,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        results = response.data['results']
+        self.assertEqual(len(results), page_size)
+        self.assertEqual(results[0]['tweet']['id'], newsfeeds[page_size].tweet_id)
+        self.assertEqual(results[1]['tweet']['id'], newsfeeds[page_size + 1].tweet_id)
+        self.assertEqual(
+            results[page_size - 1]['tweet']['id'],
+            newsfeeds[2 * page_size - 1].tweet_id,
+        )
+
+        # pull latest newsfeeds
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {
+            'created_at__gt': newsfeeds[0].created_at,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(len(response.data['results']), 0)
+
+        tweet = self.create_tweet(followed_user)
+        new_newsfeed = self.create_newsfeed(user=self.gongzi, tweet=tweet)
+
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {
+            'created_at__gt': newsfeeds[0].created_at,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['tweet']['id'], new_newsfeed.tweet_id)
+
+    def test_page_size(self):
+        max_page_size = EndlessPagination.max_page_size
+        followed_user = self.create_user('followed')
+        for i in range(max_page_size + 1):
+            tweet = self.create_tweet(followed_user)
+            self.create_newsfeed(user=self.gongzi, tweet=tweet)
+
+        # client can shrink the page
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['has_next_page'], True)
+
+        # but can never exceed the hard cap
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'size': max_page_size + 1})
+        self.assertEqual(len(response.data['results']), max_page_size)
+        self.assertEqual(response.data['has_next_page'], True)
+
+        # malformed cursor is rejected
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'created_at__lt': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'created_at__lt': '2020-13-45T00:00:00'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_number_of_queries_does_not_grow_with_page(self):
+        followed_user = self.create_user('followed')
+        for i in range(2):
+            tweet = self.create_tweet(followed_user)
+            self.create_newsfeed(user=self.gongzi, tweet=tweet)
+            self.create_comment(self.gongzi, tweet)
+            self.create_like(self.gongzi, tweet)
+        self.gongzi_client.get(NEWSFEEDS_URL)
+        with CaptureQueriesContext(connection) as small_page:
+            self.gongzi_client.get(NEWSFEEDS_URL)
+
+        for i in range(8):
+            author = self.create_user('author{}'.format(i))
+            # profile 只会在第一次读的时候创建一次
+            author.profile
+            tweet = self.create_tweet(author)
+            self.create_newsfeed(user=self.gongzi, tweet=tweet)
+            self.create_comment(author, tweet)
+            self.create_like(author, tweet)
+        # 两次都在 tweet cache 热了以后再比较
+        self.gongzi_client.get(NEWSFEEDS_URL)
+        with CaptureQueriesContext(connection) as large_page:
+            response = self.gongzi_client.get(NEWSFEEDS_URL)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(len(small_page), len(large_page))
+
+    def test_conditional_get(self):
+        response = self.gongzi_client.get(NEWSFEEDS_URL)
+        etag = response['ETag']
+        response = self.gongzi_client.get(NEWSFEEDS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        # 其他的 query 参数对应不同的 ETag
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'size': 2}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # 自己发帖以后 newsfeed 变了
+        with self.captureOnCommitCallbacks(execute=True):
+            self.gongzi_client.post(POST_TWEETS_URL, {'content': 'Hello Gongzi'})
+        response = self.gongzi_client.get(NEWSFEEDS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        etag = response['ETag']
+
+        # 关注的人发帖以后 newsfeed 变了
+        self.gongzi_client.post(FOLLOW_URL.format(self.xiaoweige.id))
+        response = self.gongzi_client.get(NEWSFEEDS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.xiaoweige_client.post(POST_TWEETS_URL, {'content': 'Hello Gongzi'})
+        response = self.gongzi_client.get(NEWSFEEDS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+    @override_settings(NEWSFEED_PULL_FOLLOWERS_THRESHOLD=2)
+    def test_conditional_get_with_pulled_tweets(self):
+        # xiaoweige 有两个粉丝，是大V
+        self.gongzi_client.post(FOLLOW_URL.format(self.xiaoweige.id))
+        response = self.gongzi_client.get(NEWSFEEDS_URL)
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.xiaoweige_client.post(POST_TWEETS_URL, {'content': 'Hello Gongzi'})
+        response = self.gongzi_client.get(NEWSFEEDS_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        # pull 过来的帖子没有 newsfeed
+        self.assertIsNone(response.data['results'][0]['id'])
+
+        # 关注的大V在一个请求里只算一次
+        for params in [{}, {'since': response.data['results'][0]['created_at']}]:
+            with mock.patch.object(
+                NewsFeedService,
+                'get_pull_author_ids',
+                wraps=NewsFeedService.get_pull_author_ids,
+            ) as get_pull_author_ids:
+                response = self.gongzi_client.get(NEWSFEEDS_URL, params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(get_pull_author_ids.call_count, 1)
+
+    def test_since(self):
+        followed_user = self.create_user('followed')
+        tweets = [self.create_tweet(followed_user) for i in range(8)]
+        for tweet in tweets[:2]:
+            self.create_newsfeed(self.gongzi, tweet)
+        response = self.gongzi_client.get(NEWSFEEDS_URL)
+        head = response.data['results'][0]['created_at']
+
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'since': head})
+        self.assertEqual(response.data['new_count'], 0)
+        self.assertEqual(response.data['results'], [])
+
+        for tweet in tweets[2:5]:
+            self.create_newsfeed(self.gongzi, tweet)
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'since': head, 'size': 2})
+        self.assertEqual(response.data['new_count'], 3)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [result['tweet']['id'] for result in response.data['results']],
+            [tweets[4].id, tweets[3].id],
+        )
+
+        # 条数最多数到 NEWSFEED_NEW_COUNT_LIMIT
+        for tweet in tweets[5:]:
+            self.create_newsfeed(self.gongzi, tweet)
+        response = self.gongzi_client.get(NEWSFEEDS_URL, {'since': head})
+        self.assertEqual(response.data['new_count'], settings.NEWSFEED_NEW_COUNT_LIMIT)
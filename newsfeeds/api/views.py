@@ -1,25 +1,81 @@
-from rest_framework import viewsets
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.decorators import action
+from django.conf import settings
+from django.utils.http import parse_etags
+from rest_framework import viewsets, status
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.contrib.auth.models import User
 from newsfeeds.models import NewsFeed
 from newsfeeds.api.serializers import NewsFeedSerializer
-from rest_framework import status
+from newsfeeds.services import NewsFeedService
+from tweets.hydrators import TweetHydrator
+from utils.paginations import EndlessPagination
 
 
 class NewsFeedViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = EndlessPagination
 
     def get_queryset(self):
-        return NewsFeed.objects.filter(user=self.request.user)
+        return NewsFeed.objects.for_user(self.request.user.id)
 
-    def list(self, request):
+    def serialize(self, newsfeeds):
+        hydrator = TweetHydrator.from_ids(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            self.request.user,
+        )
+        for newsfeed in newsfeeds:
+            newsfeed.tweet = hydrator.get_tweet(newsfeed.tweet_id)
+        NewsFeedService.attach_newsfeed_ids(self.request.user.id, newsfeeds)
         serializer = NewsFeedSerializer(
-            self.get_queryset(),
-            context={'request': request},
+            newsfeeds,
+            context={'request': self.request, 'hydrator': hydrator},
             many=True
         )
+        return serializer.data
+
+    def list(self, request):
+        # 客户端带着上次拿到的 ETag 来轮询，newsfeed 没有变化的时候直接返回 304
+        # 关注的大V在一个请求里只算一次，ETag 和 newsfeed 用的是同一份
+        author_ids = NewsFeedService.get_pull_author_ids(request.user.id)
+        etag = NewsFeedService.get_newsfeeds_etag(
+            request.user.id,
+            request.query_params.urlencode(),
+            author_ids=author_ids,
+        )
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        if 'since' in request.query_params:
+            response = self.list_since(request, author_ids)
+        else:
+            created_at__gt, created_at__lt = self.paginator.get_cursors(request)
+            # 多取一条用来判断 has_next_page
+            newsfeeds = NewsFeedService.get_newsfeeds(
+                request.user.id,
+                limit=self.paginator.get_page_size(request) + 1,
+                created_at__gt=created_at__gt,
+                created_at__lt=created_at__lt,
+                author_ids=author_ids,
+            )
+            page = self.paginator.paginate_ordered_list(newsfeeds, request)
+            response = self.get_paginated_response(self.serialize(page))
+        response['ETag'] = etag
+        return response
+
+    def list_since(self, request, author_ids):
+        """
+        ?since=<客户端最新一条的 created_at>，返回比它新的数据的条数和最新的一页
+        条数最多数到 NEWSFEED_NEW_COUNT_LIMIT，客户端可以显示成 "99+ 条新动态"
+        """
+        since = self.paginator.get_cursor(request, 'since')
+        newsfeeds = NewsFeedService.get_newsfeeds(
+            request.user.id,
+            limit=settings.NEWSFEED_NEW_COUNT_LIMIT,
+            created_at__gt=since,
+            author_ids=author_ids,
+        )
+        page_size = self.paginator.get_page_size(request)
         return Response({
-            'newsfeeds': serializer.data,
-        }, status=status.HTTP_200_OK)
+            'new_count': len(newsfeeds),
+            'has_next_page': len(newsfeeds) > page_size,
+            'results': self.serialize(newsfeeds[:page_size]),
+        })
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class NewsfeedsConfig(AppConfig):
+    name = 'newsfeeds'
+
+    def ready(self):
+        from django.db.models.signals import post_delete
+        from friendships.models import Friendship
+        from newsfeeds.listeners import handle_unfollowed
+        post_delete.connect(handle_unfollowed, sender=Friendship)
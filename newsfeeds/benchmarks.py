@@ -0,0 +1,288 @@
+import math
+import random
+import subprocess
+import time
+from contextlib import ExitStack, contextmanager
+
+from accounts.models import UserProfile
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from friendships.models import Friendship
+from friendships.services import (
+    FOLLOWER_IDS_VERSION_PATTERN,
+    FOLLOWERS_COUNT_PATTERN,
+    FOLLOWING_IDS_VERSION_PATTERN,
+    FriendshipService,
+)
+from newsfeeds.api.views import NewsFeedViewSet
+from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
+from newsfeeds.sharding import get_shards
+from newsfeeds.tasks import fanout_newsfeeds_main_task
+from rest_framework.test import APIRequestFactory, force_authenticate
+from tweets.models import Tweet
+from twitter.celery import app as celery_app
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(values, percent):
+    # nearest-rank，样本很少的时候也不需要插值
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, math.ceil(percent / 100 * len(values)) - 1)
+    return values[index]
+
+
+def summarize(values):
+    return {
+        'count': len(values),
+        'p50': percentile(values, 50),
+        'p99': percentile(values, 99),
+        'max': max(values) if values else None,
+    }
+
+
+def get_git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def capture_queries(aliases):
+    # newsfeed 分布在多个库上，每个库的查询都要算进去
+    with ExitStack() as stack:
+        contexts = [
+            stack.enter_context(CaptureQueriesContext(connections[alias]))
+            for alias in aliases
+        ]
+        yield contexts
+
+
+def count_queries(contexts):
+    return sum(len(context) for context in contexts)
+
+
+class NewsFeedBenchmark(object):
+    """
+    在一个幂律分布 (power-law) 的模拟社交网络上测量 fanout 和读 newsfeed 的性能：
+    - 排名第 i 的用户有 max_followers / i ^ alpha 个粉丝，少数大V + 大量普通用户
+    - 所有数据写在一个事务里，跑完以后整体回滚，不会在数据库里留下测试数据
+    """
+
+    def __init__(self, users, alpha=1.0, max_followers=None, tweets_per_user=1,
+                 samples=20, seed=0, batch_size=1000):
+        self.users = users
+        self.alpha = alpha
+        self.max_followers = min(max_followers or users // 10, users - 1)
+        self.tweets_per_user = tweets_per_user
+        self.samples = samples
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.user_ids = []
+        self.aliases = sorted(set(['default'] + get_shards()))
+        self.request_factory = APIRequestFactory()
+
+    def get_followers_count(self, rank):
+        return max(1, int(self.max_followers / rank ** self.alpha))
+
+    def build_graph(self):
+        prefix = 'bench{}_'.format(self.random.randint(0, 10 ** 9))
+        start = time.perf_counter()
+        User.objects.bulk_create([
+            User(username='{}{}'.format(prefix, i), password='!')
+            for i in range(self.users)
+        ], batch_size=self.batch_size)
+        # bulk_create 在 mysql 上不会返回 id，需要再查一次
+        self.user_ids = list(User.objects.filter(
+            username__startswith=prefix,
+        ).order_by('id').values_list('id', flat=True))
+
+        friendships = []
+        edges = 0
+        followers_counts = {user_id: 0 for user_id in self.user_ids}
+        followings_counts = {user_id: 0 for user_id in self.user_ids}
+        for rank, user_id in enumerate(self.user_ids, start=1):
+            candidates = self.random.sample(
+                self.user_ids,
+                min(self.get_followers_count(rank) + 1, self.users),
+            )
+            for follower_id in candidates:
+                if follower_id == user_id:
+                    continue
+                friendships.append(Friendship(from_user_id=follower_id, to_user_id=user_id))
+                followers_counts[user_id] += 1
+                followings_counts[follower_id] += 1
+            if len(friendships) >= self.batch_size:
+                Friendship.objects.bulk_create(friendships, batch_size=self.batch_size)
+                edges += len(friendships)
+                friendships = []
+        Friendship.objects.bulk_create(friendships, batch_size=self.batch_size)
+        edges += len(friendships)
+        # bulk_create 不会触发 signal，关注计数要自己写进 profile，
+        # 否则所有人的粉丝数都是 0，测不到大V pull 的路径
+        UserProfile.objects.bulk_create([
+            UserProfile(
+                user_id=user_id,
+                followers_count=followers_counts[user_id],
+                followings_count=followings_counts[user_id],
+            )
+            for user_id in self.user_ids
+        ], batch_size=self.batch_size)
+
+        Tweet.objects.bulk_create([
+            Tweet(user_id=user_id, content='benchmark tweet {}'.format(i))
+            for user_id in self.user_ids
+            for i in range(self.tweets_per_user)
+        ], batch_size=self.batch_size)
+        tweets = len(self.user_ids) * self.tweets_per_user
+        seconds = time.perf_counter() - start
+        return {
+            'users': self.users,
+            'friendships': edges,
+            'tweets': tweets,
+            'pull_authors': sum(
+                count >= settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD
+                for count in followers_counts.values()
+            ),
+            'seconds': seconds,
+            'rows_per_second': (self.users * 2 + edges + tweets) / seconds,
+        }
+
+    def sample_user_ids(self):
+        # 粉丝最多的几个人 + 随机的普通用户，这样 p99 能反映大V的情况
+        head = self.user_ids[:max(1, self.samples // 4)]
+        tail = self.random.sample(
+            self.user_ids,
+            min(self.samples - len(head), len(self.user_ids)),
+        )
+        return head + tail
+
+    def measure_fanout(self):
+        durations, queries = [], []
+        rows_written, total_seconds = 0, 0
+        for user_id in self.sample_user_ids():
+            tweet = Tweet.objects.create(user_id=user_id, content='benchmark fanout')
+            before = self.count_newsfeeds()
+            with capture_queries(self.aliases) as contexts:
+                start = time.perf_counter()
+                fanout_newsfeeds_main_task(tweet.id, user_id)
+                duration = time.perf_counter() - start
+            durations.append(duration)
+            queries.append(count_queries(contexts))
+            rows_written += self.count_newsfeeds() - before
+            total_seconds += duration
+        return {
+            'seconds': summarize(durations),
+            'queries': summarize(queries),
+            'rows_written': rows_written,
+            'rows_per_second': rows_written / total_seconds if total_seconds else None,
+        }
+
+    def measure_get_followers(self):
+        durations = []
+        for user_id in self.sample_user_ids():
+            user = User(id=user_id)
+            start = time.perf_counter()
+            FriendshipService.get_followers(user)
+            durations.append(time.perf_counter() - start)
+        return {'seconds': summarize(durations)}
+
+    def measure_get_follower_ids(self):
+        # 第一次读要查数据库，第二次读命中进程内的 LRU
+        results = {}
+        user_ids = self.sample_user_ids()
+        for name in ['cold', 'warm']:
+            durations = []
+            for user_id in user_ids:
+                start = time.perf_counter()
+                FriendshipService.get_follower_ids(user_id)
+                durations.append(time.perf_counter() - start)
+            results[name] = {'seconds': summarize(durations)}
+        return results
+
+    def read_newsfeeds(self, user_id):
+        request = self.request_factory.get('/api/newsfeeds/')
+        force_authenticate(request, user=User(id=user_id))
+        view = NewsFeedViewSet.as_view({'get': 'list'})
+        with capture_queries(self.aliases) as contexts:
+            start = time.perf_counter()
+            response = view(request)
+            response.render()
+            duration = time.perf_counter() - start
+        return duration, count_queries(contexts)
+
+    def measure_feed_reads(self):
+        # 第一次读 cache 是空的，第二次读可以命中 cache，分开统计
+        results = {}
+        user_ids = self.sample_user_ids()
+        for name in ['cold', 'warm']:
+            durations, queries = [], []
+            for user_id in user_ids:
+                duration, num_queries = self.read_newsfeeds(user_id)
+                durations.append(duration)
+                queries.append(num_queries)
+            results[name] = {
+                'seconds': summarize(durations),
+                'queries': summarize(queries),
+            }
+        return results
+
+    def count_newsfeeds(self):
+        return sum(
+            NewsFeed.objects.using(alias).count()
+            for alias in get_shards()
+        )
+
+    def clear_cache(self):
+        # 数据库回滚以后 id 可能会被重新使用，cache 里不能留下这些用户的数据
+        # 删掉 id 列表的版本号，下次读的时候会换一个新的版本，LRU 里的旧数据也不会再被读到
+        cache.delete_many([
+            pattern.format(user_id=user_id)
+            for user_id in self.user_ids
+            for pattern in [
+                FOLLOWERS_COUNT_PATTERN,
+                FOLLOWER_IDS_VERSION_PATTERN,
+                FOLLOWING_IDS_VERSION_PATTERN,
+            ]
+        ])
+        for user_id in self.user_ids:
+            NewsFeedService.invalidate_newsfeeds_cache(user_id)
+
+    def run(self):
+        result = {}
+        # fanout 在 request 里是 on_commit 以后异步执行的，这里直接在当前进程里
+        # 同步执行所有的 task，测的是 worker 端真正的开销
+        always_eager = celery_app.conf.task_always_eager
+        eager_propagates = celery_app.conf.task_eager_propagates
+        celery_app.conf.task_always_eager = True
+        celery_app.conf.task_eager_propagates = True
+        try:
+            with ExitStack() as stack:
+                for alias in self.aliases:
+                    stack.enter_context(transaction.atomic(using=alias))
+                result['graph'] = self.build_graph()
+                result['fanout'] = self.measure_fanout()
+                result['get_followers'] = self.measure_get_followers()
+                result['get_follower_ids'] = self.measure_get_follower_ids()
+                result['feed_read'] = self.measure_feed_reads()
+                raise _Rollback()
+        except _Rollback:
+            pass
+        finally:
+            celery_app.conf.task_always_eager = always_eager
+            celery_app.conf.task_eager_propagates = eager_propagates
+            self.clear_cache()
+        return result
@@ -0,0 +1,3 @@
+def handle_unfollowed(sender, instance, **kwargs):
+    from newsfeeds.services import NewsFeedService
+    NewsFeedService.handle_unfollowed(instance.to_user_id)
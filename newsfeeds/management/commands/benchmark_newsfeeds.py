@@ -0,0 +1,67 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from newsfeeds.benchmarks import NewsFeedBenchmark, get_git_revision
+
+
+class Command(BaseCommand):
+    help = (
+        'Build synthetic power-law social graphs of several sizes and measure fanout, '
+        'get_followers and newsfeed read latency and query counts. All rows are rolled '
+        'back afterwards. Results are written as JSON so runs on different commits '
+        'can be compared.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+        parser.add_argument('--alpha', type=float, default=1.0)
+        parser.add_argument(
+            '--max-followers',
+            type=int,
+            default=None,
+            help='Followers of the most followed user, defaults to 10%% of the users.',
+        )
+        parser.add_argument('--tweets-per-user', type=int, default=1)
+        parser.add_argument('--samples', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Write JSON here instead of stdout.')
+
+    def handle(self, *args, **options):
+        runs = []
+        for size in options['sizes']:
+            benchmark = NewsFeedBenchmark(
+                users=size,
+                alpha=options['alpha'],
+                max_followers=options['max_followers'],
+                tweets_per_user=options['tweets_per_user'],
+                samples=options['samples'],
+                seed=options['seed'],
+            )
+            runs.append(dict(benchmark.run(), size=size))
+            self.stderr.write('finished benchmark for {} users'.format(size))
+
+        report = {
+            'revision': get_git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'settings': {
+                'NEWSFEED_DB_SHARDS': settings.NEWSFEED_DB_SHARDS,
+                'NEWSFEED_FANOUT_BATCH_SIZE': settings.NEWSFEED_FANOUT_BATCH_SIZE,
+                'NEWSFEED_PULL_FOLLOWERS_THRESHOLD': settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD,
+                'REDIS_LIST_LENGTH_LIMIT': settings.REDIS_LIST_LENGTH_LIMIT,
+            },
+            'options': {
+                key: options[key]
+                for key in ['alpha', 'max_followers', 'tweets_per_user', 'samples', 'seed']
+            },
+            'runs': runs,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
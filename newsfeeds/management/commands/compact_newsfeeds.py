@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from newsfeeds.services import NewsFeedService
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete NewsFeed rows whose tweet no longer exists and keep only the '
+        'newest rows of each user. Deletes in small batches so it can run on a live primary.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=settings.NEWSFEED_RETENTION_LIMIT)
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.NEWSFEED_COMPACT_BATCH_SIZE,
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=settings.NEWSFEED_COMPACT_SLEEP,
+            help='Seconds to sleep between two delete batches.',
+        )
+
+    def handle(self, *args, **options):
+        dangling_deleted, trimmed = NewsFeedService.compact(
+            keep=options['keep'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            '{} dangling newsfeeds deleted, {} old newsfeeds trimmed'.format(
+                dangling_deleted,
+                trimmed,
+            )
+        ))
@@ -0,0 +1,70 @@
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from newsfeeds.models import NewsFeed
+from newsfeeds.sharding import get_shard, get_shards
+
+
+class Command(BaseCommand):
+    help = (
+        'Move NewsFeed rows to the shard their user_id maps to. '
+        'Run it after changing settings.NEWSFEED_DB_SHARDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source',
+            action='append',
+            default=[],
+            help='Extra database alias to drain, e.g. a shard that has been removed '
+                 'from NEWSFEED_DB_SHARDS. Can be used multiple times.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        sources = list(get_shards())
+        for source in options['source']:
+            if source not in sources:
+                sources.append(source)
+
+        total = 0
+        for source in sources:
+            moved = self.rebalance(source, options['batch_size'], options['dry_run'])
+            self.stdout.write('{}: {} newsfeeds moved'.format(source, moved))
+            total += moved
+        self.stdout.write(self.style.SUCCESS('{} newsfeeds moved in total'.format(total)))
+
+    def rebalance(self, source, batch_size, dry_run):
+        # 按 id 分批扫描，先写入目标 shard 再从原 shard 删除
+        # 写入时忽略冲突，所以中途失败以后可以直接重新运行
+        moved = 0
+        last_id = 0
+        while True:
+            newsfeeds = list(
+                NewsFeed.objects.using(source).filter(id__gt=last_id).order_by('id')[:batch_size]
+            )
+            if not newsfeeds:
+                break
+            last_id = newsfeeds[-1].id
+
+            groups = defaultdict(list)
+            for newsfeed in newsfeeds:
+                target = get_shard(newsfeed.user_id) if newsfeed.user_id is not None else source
+                if target != source:
+                    groups[target].append(newsfeed)
+            for target, group in groups.items():
+                moved += len(group)
+                if dry_run:
+                    continue
+                NewsFeed.objects.using(target).bulk_create([
+                    NewsFeed(
+                        user_id=newsfeed.user_id,
+                        tweet_id=newsfeed.tweet_id,
+                        created_at=newsfeed.created_at,
+                    )
+                    for newsfeed in group
+                ], ignore_conflicts=True)
+                NewsFeed.objects.using(source).filter(
+                    id__in=[newsfeed.id for newsfeed in group],
+                ).delete()
+        return moved
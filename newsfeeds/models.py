@@ -1,20 +1,46 @@
+from collections import defaultdict
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+from newsfeeds.sharding import get_shard
 from tweets.models import Tweet
 
 
+class NewsFeedManager(models.Manager):
+
+    def for_user(self, user_id):
+        # 读写一个用户的 newsfeed 都要先找到他所在的 shard
+        return self.using(get_shard(user_id)).filter(user_id=user_id)
+
+    def bulk_create_sharded(self, newsfeeds, **kwargs):
+        # 按 shard 分组，每个 shard 只需要一次 bulk_create
+        groups = defaultdict(list)
+        for newsfeed in newsfeeds:
+            groups[get_shard(newsfeed.user_id)].append(newsfeed)
+        for shard, group in groups.items():
+            self.using(shard).bulk_create(group, **kwargs)
+
+
 class NewsFeed(models.Model):
+    # newsfeed 和 user, tweet 可能不在同一个数据库上，所以不能有外键约束
+    # 删除 user 或 tweet 的时候也不会级联处理 newsfeed，由定期的清理任务删除
     user = models.ForeignKey(
         User,
-        on_delete=models.SET_NULL,
-        null=True
+        on_delete=models.DO_NOTHING,
+        null=True,
+        db_constraint=False,
     )
     tweet = models.ForeignKey(
         Tweet,
-        on_delete=models.SET_NULL,
-        null=True
+        on_delete=models.DO_NOTHING,
+        null=True,
+        db_constraint=False,
     )
-    created_at = models.DateTimeField(auto_now_add=True)
+    # 和 tweet.created_at 保持一致而不是写入的时间，这样 push 过来的 newsfeed 和
+    # 读的时候从大V那里 pull 过来的 tweet 可以用同一个 cursor 进行排序和翻页
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = NewsFeedManager()
 
     class Meta:
         index_together = (('user', 'created_at'),)
@@ -22,6 +48,4 @@ class NewsFeed(models.Model):
         ordering = ('user', '-created_at')
 
     def __str__(self):
-        return f'{self.created_at} inbox of {self.user}:{self.tweet}'
-
-
+        return f'{self.created_at} inbox of {self.user_id}:{self.tweet_id}'
@@ -0,0 +1,39 @@
+from newsfeeds.sharding import get_shard
+
+
+class NewsFeedRouter:
+    """
+    NewsFeed 按 user_id 分布在 settings.NEWSFEED_DB_SHARDS 的多个数据库上，其他 model 都在 default
+    - 能拿到 NewsFeed instance 的读写（save, delete, refresh_from_db）按 instance.user_id 路由
+    - 没有 instance 的 queryset 需要显式调用 NewsFeed.objects.for_user(user_id)
+      或者 .using(get_shard(user_id))
+    所有数据库上都会建 NewsFeed 表，所以不需要实现 allow_migrate
+    """
+
+    @staticmethod
+    def _is_newsfeed(model):
+        return model._meta.app_label == 'newsfeeds'
+
+    def _route(self, model, **hints):
+        instance = hints.get('instance')
+        is_newsfeed_instance = instance is not None and self._is_newsfeed(instance.__class__)
+        if self._is_newsfeed(model):
+            if is_newsfeed_instance and instance.user_id is not None:
+                return get_shard(instance.user_id)
+            return None
+        # 从 shard 上读出来的 newsfeed 去访问 newsfeed.tweet / newsfeed.user 时，
+        # 要回到 default 数据库上去读，而不是 newsfeed 所在的 shard
+        if is_newsfeed_instance:
+            return 'default'
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self._is_newsfeed(obj1.__class__) or self._is_newsfeed(obj2.__class__):
+            return True
+        return None
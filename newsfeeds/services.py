@@ -1,14 +1,328 @@
-from newsfeeds.models import NewsFeed
+import hashlib
+import heapq
+import time
+
+from accounts.models import UserProfile
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
 from friendships.services import FriendshipService
+from newsfeeds.models import NewsFeed
+from newsfeeds.sharding import get_shards
+from newsfeeds.tasks import (
+    backfill_followers_newsfeeds_task,
+    backfill_newsfeeds_task,
+    fanout_newsfeeds_main_task,
+    retract_newsfeeds_task,
+)
+from tweets.models import Tweet
+from utils.redis_helper import RedisHelper
+
+USER_NEWSFEEDS_PATTERN = 'user_newsfeeds:{user_id}'
+# push 到用户 newsfeed 里的内容每变化一次，版本号加一
+USER_NEWSFEEDS_VERSION_PATTERN = 'user_newsfeeds_version:{user_id}'
+# 用户每发一条帖子，版本号加一，用来判断 pull 过来的那部分 newsfeed 有没有变化
+USER_TWEETS_VERSION_PATTERN = 'user_tweets_version:{user_id}'
 
 
 class NewsFeedService(object):
 
     @classmethod
     def fanout_to_followers(cls, tweet):
-        newsfeeds = [
-            NewsFeed(user=follower, tweet=tweet)
-            for follower in FriendshipService.get_followers(tweet.user)
+        # 不在 request 里直接 fanout，而是交给 celery 异步执行
+        # 必须等 tweet 所在的事务提交以后再投递任务，否则 worker 可能读不到这条 tweet
+        # 这里只传 id 而不是 tweet 对象，因为 task 的参数需要被序列化后放进 broker
+        # 作者的帖子版本号也要等提交以后再加，否则并发的请求可能把还看不到这条 tweet 的
+        # newsfeed 缓存在新的 ETag 下
+        def fanout():
+            RedisHelper.incr_versions([
+                USER_TWEETS_VERSION_PATTERN.format(user_id=tweet.user_id),
+            ])
+            fanout_newsfeeds_main_task.delay(tweet.id, tweet.user_id)
+
+        transaction.on_commit(fanout)
+
+    @classmethod
+    def backfill_followee(cls, follower_id, followee_id):
+        # 把新关注的人最近的帖子异步补到自己的 newsfeed 里
+        transaction.on_commit(
+            lambda: backfill_newsfeeds_task.delay(follower_id, followee_id),
+        )
+
+    @classmethod
+    def retract_followee(cls, follower_id, followee_id):
+        # 异步把取消关注的人的帖子从自己的 newsfeed 里删掉
+        transaction.on_commit(
+            lambda: retract_newsfeeds_task.delay(follower_id, followee_id),
+        )
+
+    @classmethod
+    def mark_unpushed_tweets(cls, author_id):
+        # 大V发帖的时候记一下，粉丝数降下来以后要补推
+        UserProfile.objects.filter(
+            user_id=author_id,
+            has_unpushed_tweets=False,
+        ).update(has_unpushed_tweets=True)
+
+    @classmethod
+    def backfill_unpushed_tweets(cls, author_id):
+        """
+        作者的帖子不再被 pull 以后调用，之前没有 fanout 的帖子补推给所有粉丝
+        只有一个调用方能把标记清掉，补推不会重复执行
+        """
+        cleared = UserProfile.objects.filter(
+            user_id=author_id,
+            has_unpushed_tweets=True,
+        ).update(has_unpushed_tweets=False)
+        if cleared:
+            backfill_followers_newsfeeds_task.delay(author_id)
+        return bool(cleared)
+
+    @classmethod
+    def handle_unfollowed(cls, followee_id):
+        """
+        取关以后大V的粉丝数可能降到了阈值以下，等事务提交以后用数据库里的粉丝数判断
+        清掉缓存的粉丝数，读 newsfeed 和 fanout 的时候马上按普通用户处理，再补推之前的帖子
+        """
+        def check():
+            counts = FriendshipService.get_friendship_counts(followee_id)
+            if counts is None:
+                return
+            if counts['followers_count'] >= settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD:
+                return
+            if not UserProfile.objects.filter(
+                user_id=followee_id,
+                has_unpushed_tweets=True,
+            ).exists():
+                return
+            FriendshipService.invalidate_followers_count(followee_id)
+            cls.backfill_unpushed_tweets(followee_id)
+
+        transaction.on_commit(check)
+
+    @classmethod
+    def invalidate_newsfeeds_cache(cls, user_id):
+        # 用户的 newsfeed 有删除或者插入了旧的数据
+        RedisHelper.invalidate(USER_NEWSFEEDS_PATTERN.format(user_id=user_id))
+        RedisHelper.incr_versions([USER_NEWSFEEDS_VERSION_PATTERN.format(user_id=user_id)])
+
+    @classmethod
+    def push_newsfeeds_to_cache(cls, user_ids, tweet_id, created_at):
+        # 新的 newsfeed 写入数据库以后调用
+        keys = [USER_NEWSFEEDS_PATTERN.format(user_id=user_id) for user_id in user_ids]
+        RedisHelper.push_id(keys, tweet_id, created_at)
+        RedisHelper.incr_versions([
+            USER_NEWSFEEDS_VERSION_PATTERN.format(user_id=user_id)
+            for user_id in user_ids
+        ])
+
+    @classmethod
+    def get_newsfeeds_etag(cls, user_id, query_string='', author_ids=None):
+        """
+        由用户 newsfeed 的版本号和关注的大V发帖的版本号生成 ETag，不需要读数据库里的 newsfeed
+        同一个用户不同的翻页参数返回的内容不同，所以 query_string 也要算进去
+        author_ids 是 get_pull_author_ids 的结果，同一个请求里算过一次的话直接传进来
+        """
+        if author_ids is None:
+            author_ids = cls.get_pull_author_ids(user_id)
+        keys = [USER_NEWSFEEDS_VERSION_PATTERN.format(user_id=user_id)] + [
+            USER_TWEETS_VERSION_PATTERN.format(user_id=author_id)
+            for author_id in sorted(author_ids)
         ]
-        newsfeeds.append(NewsFeed(user=tweet.user, tweet=tweet))
-        NewsFeed.objects.bulk_create(newsfeeds)
+        versions = RedisHelper.get_versions(keys)
+        raw = '{}|{}|{}'.format(
+            user_id,
+            ','.join(str(version) for version in versions),
+            query_string,
+        )
+        return '"{}"'.format(hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+    @classmethod
+    def get_cached_newsfeed_items(cls, user_id, limit, created_at__gt=None, created_at__lt=None):
+        """
+        返回 push 到用户 newsfeed 里的 (tweet_id, created_at)，优先从 redis 里读
+        """
+        return RedisHelper.get_ids(
+            USER_NEWSFEEDS_PATTERN.format(user_id=user_id),
+            NewsFeed.objects.for_user(user_id),
+            'tweet_id',
+            limit,
+            created_at__gt=created_at__gt,
+            created_at__lt=created_at__lt,
+        )
+
+    @classmethod
+    def attach_newsfeed_ids(cls, user_id, newsfeeds):
+        """
+        get_newsfeeds 返回的 NewsFeed 只有 tweet_id，按 (user, tweet) 的唯一索引批量查出 id
+        """
+        ids = dict(NewsFeed.objects.for_user(user_id).filter(
+            tweet_id__in=[newsfeed.tweet_id for newsfeed in newsfeeds],
+        ).values_list('tweet_id', 'id'))
+        for newsfeed in newsfeeds:
+            newsfeed.id = ids.get(newsfeed.tweet_id)
+
+    @classmethod
+    def get_pull_author_ids(cls, user_id):
+        """
+        当前用户关注的人里，发帖时不做 fanout 的大V
+        """
+        following_ids = FriendshipService.get_following_ids(user_id)
+        if not following_ids:
+            return []
+        followers_counts = FriendshipService.get_followers_counts(following_ids)
+        threshold = settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD
+        return [
+            following_id
+            for following_id in following_ids
+            if followers_counts[following_id] >= threshold
+        ]
+
+    @classmethod
+    def get_newsfeeds(
+        cls,
+        user_id,
+        limit,
+        created_at__gt=None,
+        created_at__lt=None,
+        author_ids=None,
+    ):
+        """
+        把 push 到用户 newsfeed 里的数据和从关注的大V那里 pull 过来的 tweets
+        按 created_at 倒序做 k 路归并，最多返回 limit 条
+        每一路都只取 limit 条，所以代价和大V的帖子总数无关
+        返回的 NewsFeed 对象只是用来序列化的，没有 id，tweet 需要再用 TweetHydrator 批量加载
+        author_ids 和 get_newsfeeds_etag 的一样
+        """
+        if author_ids is None:
+            author_ids = cls.get_pull_author_ids(user_id)
+        sources = [cls.get_cached_newsfeed_items(
+            user_id,
+            limit,
+            created_at__gt=created_at__gt,
+            created_at__lt=created_at__lt,
+        )]
+        for author_id in author_ids:
+            queryset = Tweet.objects.filter(user_id=author_id)
+            if created_at__gt is not None:
+                queryset = queryset.filter(created_at__gt=created_at__gt)
+            elif created_at__lt is not None:
+                queryset = queryset.filter(created_at__lt=created_at__lt)
+            sources.append(queryset.order_by('-created_at').values_list(
+                'id',
+                'created_at',
+            )[:limit])
+
+        items = []
+        seen_tweet_ids = set()
+        merged = heapq.merge(*sources, key=lambda item: item[1], reverse=True)
+        for tweet_id, created_at in merged:
+            # 用户在成为大V之前发的帖子已经被 push 过了，需要去重
+            if tweet_id in seen_tweet_ids:
+                continue
+            seen_tweet_ids.add(tweet_id)
+            items.append((tweet_id, created_at))
+            if len(items) >= limit:
+                break
+
+        return [
+            NewsFeed(user_id=user_id, tweet_id=tweet_id, created_at=created_at)
+            for tweet_id, created_at in items
+        ]
+
+    @classmethod
+    def trim_user_newsfeeds(cls, user_id, keep, batch_size, sleep=0):
+        """
+        只保留用户最新的 keep 条 newsfeed，更早的按 created_at 从旧到新分批删除
+        每批之间 sleep 一下，避免在主库上长时间占用锁和 IO
+        """
+        queryset = NewsFeed.objects.for_user(user_id)
+        # 按 (created_at, id) 截断，created_at 相同的 newsfeed 也不会被多删
+        cutoff = queryset.order_by('-created_at', '-id').values_list(
+            'created_at',
+            'id',
+        )[keep:keep + 1].first()
+        if cutoff is None:
+            return 0
+        cutoff_created_at, cutoff_id = cutoff
+        queryset = queryset.filter(
+            Q(created_at__lt=cutoff_created_at)
+            | Q(created_at=cutoff_created_at, id__lte=cutoff_id),
+        )
+
+        deleted = 0
+        while True:
+            newsfeed_ids = list(queryset.order_by(
+                'created_at',
+                'id',
+            ).values_list('id', flat=True)[:batch_size])
+            if not newsfeed_ids:
+                break
+            count, _ = queryset.filter(id__in=newsfeed_ids).delete()
+            deleted += count
+            if sleep:
+                time.sleep(sleep)
+        return deleted
+
+    @classmethod
+    def delete_dangling_newsfeeds(cls, shard, batch_size, sleep=0):
+        """
+        按 id 分批扫描一个 shard，删除 tweet 已经不存在的 newsfeed
+        """
+        deleted = 0
+        last_id = 0
+        queryset = NewsFeed.objects.using(shard)
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(
+                'id',
+                'tweet_id',
+                'user_id',
+            )[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            existing_tweet_ids = set(Tweet.objects.filter(
+                id__in=[tweet_id for _, tweet_id, _ in rows if tweet_id is not None],
+            ).values_list('id', flat=True))
+            dangling_rows = [
+                (newsfeed_id, user_id)
+                for newsfeed_id, tweet_id, user_id in rows
+                if tweet_id not in existing_tweet_ids
+            ]
+            if dangling_rows:
+                count, _ = queryset.filter(
+                    id__in=[newsfeed_id for newsfeed_id, _ in dangling_rows],
+                ).delete()
+                deleted += count
+                for user_id in {user_id for _, user_id in dangling_rows if user_id is not None}:
+                    cls.invalidate_newsfeeds_cache(user_id)
+            if sleep:
+                time.sleep(sleep)
+        return deleted
+
+    @classmethod
+    def compact(cls, keep, batch_size, sleep=0):
+        """
+        清理所有 shard：先删掉 tweet 已经不存在的 newsfeed，再把每个用户的 newsfeed 截断到 keep 条
+        返回 (dangling_deleted, trimmed)
+        """
+        dangling_deleted = 0
+        for shard in get_shards():
+            dangling_deleted += cls.delete_dangling_newsfeeds(shard, batch_size, sleep)
+
+        trimmed = 0
+        last_user_id = 0
+        while True:
+            user_ids = list(User.objects.filter(id__gt=last_user_id).order_by(
+                'id',
+            ).values_list('id', flat=True)[:batch_size])
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+            for user_id in user_ids:
+                count = cls.trim_user_newsfeeds(user_id, keep, batch_size, sleep)
+                if count:
+                    cls.invalidate_newsfeeds_cache(user_id)
+                trimmed += count
+        return dangling_deleted, trimmed
@@ -0,0 +1,14 @@
+from django.conf import settings
+
+
+def get_shards():
+    return settings.NEWSFEED_DB_SHARDS
+
+
+def get_shard(user_id):
+    """
+    一个用户的所有 newsfeed 都在同一个 shard 上，读一个用户的 newsfeed 只需要访问一个数据库
+    """
+    shards = get_shards()
+    return shards[int(user_id) % len(shards)]
+
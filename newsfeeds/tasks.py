@@ -0,0 +1,173 @@
+from celery import shared_task
+from django.conf import settings
+from friendships.services import FriendshipService
+from newsfeeds.models import NewsFeed
+from tweets.models import Tweet
+from utils.time_constants import ONE_DAY, ONE_HOUR
+
+
+def _get_tweet_created_at(tweet_id):
+    return Tweet.objects.filter(id=tweet_id).values_list(
+        'created_at',
+        flat=True,
+    ).first()
+
+
+@shared_task(queue='newsfeeds', time_limit=ONE_HOUR)
+def fanout_newsfeeds_batch_task(tweet_id, follower_ids):
+    created_at = _get_tweet_created_at(tweet_id)
+    if created_at is None:
+        return 'tweet {} does not exist'.format(tweet_id)
+    # ignore_conflicts 依赖 (user, tweet) 上的 unique_together
+    # 这样同一个 batch 被 broker 重复投递时也不会重复写入
+    newsfeeds = [
+        NewsFeed(user_id=follower_id, tweet_id=tweet_id, created_at=created_at)
+        for follower_id in follower_ids
+    ]
+    NewsFeed.objects.bulk_create_sharded(newsfeeds, ignore_conflicts=True)
+    from newsfeeds.services import NewsFeedService
+    NewsFeedService.push_newsfeeds_to_cache(follower_ids, tweet_id, created_at)
+    return '{} newsfeeds created'.format(len(newsfeeds))
+
+
+@shared_task(queue='default', time_limit=ONE_HOUR)
+def fanout_newsfeeds_main_task(tweet_id, tweet_user_id):
+    created_at = _get_tweet_created_at(tweet_id)
+    if created_at is None:
+        return 'tweet {} does not exist'.format(tweet_id)
+
+    # 先把发帖人自己的 newsfeed 写进去，保证发帖人最先看到自己的帖子
+    # 大V也一样，自己的帖子总是 push 到自己的 newsfeed 里
+    NewsFeed.objects.bulk_create_sharded(
+        [NewsFeed(user_id=tweet_user_id, tweet_id=tweet_id, created_at=created_at)],
+        ignore_conflicts=True,
+    )
+    from newsfeeds.services import NewsFeedService
+    NewsFeedService.push_newsfeeds_to_cache([tweet_user_id], tweet_id, created_at)
+
+    # 大V 不做 fanout，粉丝读 newsfeed 的时候再从大V的 tweets 里 pull
+    followers_count = FriendshipService.get_followers_count(tweet_user_id)
+    if followers_count >= settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD:
+        NewsFeedService.mark_unpushed_tweets(tweet_user_id)
+        return 'skipped fanout for {} followers.'.format(followers_count)
+    # 之前是大V的话，把没有 fanout 过的帖子补推给粉丝
+    NewsFeedService.backfill_unpushed_tweets(tweet_user_id)
+
+    # 把 followers 拆成若干个 batch，每个 batch 作为一个独立的 task 交给 worker 执行
+    follower_ids = FriendshipService.get_follower_ids(tweet_user_id)
+    batch_size = settings.NEWSFEED_FANOUT_BATCH_SIZE
+    for index in range(0, len(follower_ids), batch_size):
+        batch_ids = follower_ids[index:index + batch_size]
+        fanout_newsfeeds_batch_task.delay(tweet_id, batch_ids)
+
+    return '{} newsfeeds going to fanout, {} batches created.'.format(
+        len(follower_ids),
+        (len(follower_ids) - 1) // batch_size + 1 if follower_ids else 0,
+    )
+
+
+def _backfill_newsfeeds(follower_ids, followee_id):
+    # 把 followee 最近的帖子补到每个 follower 的 newsfeed 里，已经有的会被忽略
+    from newsfeeds.services import NewsFeedService
+    tweets = list(Tweet.objects.filter(user_id=followee_id).order_by(
+        '-created_at',
+    ).values_list('id', 'created_at')[:settings.NEWSFEED_BACKFILL_TWEETS_LIMIT])
+    newsfeeds = [
+        NewsFeed(user_id=follower_id, tweet_id=tweet_id, created_at=created_at)
+        for follower_id in follower_ids
+        for tweet_id, created_at in tweets
+    ]
+    NewsFeed.objects.bulk_create_sharded(
+        newsfeeds,
+        batch_size=settings.NEWSFEED_FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    # 旧的帖子会插到 list 中间，直接让 cache 失效，下次读的时候重新加载
+    for follower_id in follower_ids:
+        NewsFeedService.invalidate_newsfeeds_cache(follower_id)
+    return len(newsfeeds)
+
+
+@shared_task(queue='newsfeeds', time_limit=ONE_HOUR)
+def backfill_newsfeeds_task(follower_id, followee_id):
+    # 任务执行之前用户可能已经取消关注了
+    if not FriendshipService.has_followed(follower_id, followee_id):
+        return 'friendship does not exist'
+    # 大V的帖子是读的时候 pull 的，不需要 backfill
+    followers_count = FriendshipService.get_followers_count(followee_id)
+    if followers_count >= settings.NEWSFEED_PULL_FOLLOWERS_THRESHOLD:
+        return 'skipped backfill for {} followers.'.format(followers_count)
+
+    return '{} newsfeeds backfilled'.format(_backfill_newsfeeds([follower_id], followee_id))
+
+
+@shared_task(queue='newsfeeds', time_limit=ONE_HOUR)
+def backfill_followers_newsfeeds_batch_task(followee_id, follower_ids):
+    return '{} newsfeeds backfilled'.format(_backfill_newsfeeds(follower_ids, followee_id))
+
+
+@shared_task(queue='default', time_limit=ONE_HOUR)
+def backfill_followers_newsfeeds_task(followee_id):
+    """
+    大V的粉丝数降到阈值以下以后，粉丝读 newsfeed 时不再 pull 他的帖子，
+    所以要把之前没有 fanout 的帖子补推给所有粉丝
+    """
+    follower_ids = FriendshipService.get_follower_ids(followee_id)
+    batch_size = settings.NEWSFEED_FANOUT_BATCH_SIZE
+    for index in range(0, len(follower_ids), batch_size):
+        backfill_followers_newsfeeds_batch_task.delay(
+            followee_id,
+            follower_ids[index:index + batch_size],
+        )
+    return '{} followers going to backfill'.format(len(follower_ids))
+
+
+@shared_task(queue='newsfeeds', time_limit=ONE_HOUR)
+def retract_newsfeeds_task(follower_id, followee_id):
+    from newsfeeds.services import NewsFeedService
+    # 任务执行之前用户可能又重新关注了
+    if FriendshipService.has_followed(follower_id, followee_id):
+        return 'friendship exists'
+
+    # newsfeed 和 tweet 可能不在同一个数据库上，不能 join
+    # 按 id 分批扫描 follower 的 newsfeed，找出属于 followee 的再删除，避免长时间锁表
+    deleted = 0
+    last_id = 0
+    queryset = NewsFeed.objects.for_user(follower_id)
+    batch_size = settings.NEWSFEED_FANOUT_BATCH_SIZE
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(
+            'id',
+            'tweet_id',
+        )[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        followee_tweet_ids = set(Tweet.objects.filter(
+            id__in=[tweet_id for _, tweet_id in rows],
+            user_id=followee_id,
+        ).values_list('id', flat=True))
+        newsfeed_ids = [
+            newsfeed_id
+            for newsfeed_id, tweet_id in rows
+            if tweet_id in followee_tweet_ids
+        ]
+        if newsfeed_ids:
+            count, _ = queryset.filter(id__in=newsfeed_ids).delete()
+            deleted += count
+    NewsFeedService.invalidate_newsfeeds_cache(follower_id)
+    return '{} newsfeeds deleted'.format(deleted)
+
+
+@shared_task(queue='default', time_limit=ONE_DAY)
+def compact_newsfeeds_task():
+    from newsfeeds.services import NewsFeedService
+    dangling_deleted, trimmed = NewsFeedService.compact(
+        keep=settings.NEWSFEED_RETENTION_LIMIT,
+        batch_size=settings.NEWSFEED_COMPACT_BATCH_SIZE,
+        sleep=settings.NEWSFEED_COMPACT_SLEEP,
+    )
+    return '{} dangling newsfeeds deleted, {} old newsfeeds trimmed'.format(
+        dangling_deleted,
+        trimmed,
+    )
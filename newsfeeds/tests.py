@@ -0,0 +1,509 @@
+import json
+
+from accounts.models import UserProfile
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from friendships.models import Friendship
+from io import StringIO
+from django.test import override_settings
+from newsfeeds.benchmarks import percentile
+from newsfeeds.models import NewsFeed
+from newsfeeds.services import (
+    NewsFeedService,
+    USER_NEWSFEEDS_PATTERN,
+    USER_NEWSFEEDS_VERSION_PATTERN,
+    USER_TWEETS_VERSION_PATTERN,
+)
+from newsfeeds.sharding import get_shard
+from newsfeeds.tasks import (
+    backfill_newsfeeds_task,
+    fanout_newsfeeds_batch_task,
+    fanout_newsfeeds_main_task,
+    retract_newsfeeds_task,
+)
+from rest_framework.test import APIClient
+from testing.testcases import TestCase
+from utils.redis_helper import RedisHelper
+from utils.redis_client import RedisClient
+
+FOLLOW_URL = '/api/friendships/{}/follow/'
+UNFOLLOW_URL = '/api/friendships/{}/unfollow/'
+
+
+class NewsFeedServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_fanout_waits_for_commit(self):
+        tweet = self.create_tweet(self.linghu)
+        version_key = USER_TWEETS_VERSION_PATTERN.format(user_id=self.linghu.id)
+        version = RedisHelper.get_versions([version_key])[0]
+        with self.captureOnCommitCallbacks() as callbacks:
+            NewsFeedService.fanout_to_followers(tweet)
+        # 事务提交之前不会有任何 newsfeed 写入，作者的帖子版本号也不变
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(NewsFeed.objects.count(), 0)
+        self.assertEqual(RedisHelper.get_versions([version_key])[0], version)
+
+        callbacks[0]()
+        self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), 1)
+        self.assertGreater(RedisHelper.get_versions([version_key])[0], version)
+
+    @override_settings(NEWSFEED_PULL_FOLLOWERS_THRESHOLD=2)
+    def test_get_newsfeeds_merges_pulled_tweets(self):
+        celebrity = self.create_user('celebrity')
+        self.create_friendship(self.linghu, celebrity)
+        self.create_friendship(self.dongxie, celebrity)
+        self.create_friendship(self.linghu, self.dongxie)
+        self.assertEqual(NewsFeedService.get_pull_author_ids(self.linghu.id), [celebrity.id])
+
+        # 普通用户的帖子 push 到 newsfeed 表，大V的帖子不做 fanout
+        tweets = []
+        for i in range(3):
+            for author in [celebrity, self.dongxie]:
+                tweet = self.create_tweet(author, 'tweet {}'.format(i))
+                fanout_newsfeeds_main_task(tweet.id, author.id)
+                tweets.append(tweet)
+        self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), 3)
+        self.assertEqual(NewsFeed.objects.filter(user=celebrity).count(), 3)
+
+        newsfeeds = NewsFeedService.get_newsfeeds(self.linghu.id, limit=10)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweet.id for tweet in reversed(tweets)],
+        )
+
+        # cursor 在两种来源之间保持一致
+        newsfeeds = NewsFeedService.get_newsfeeds(
+            self.linghu.id,
+            limit=2,
+            created_at__lt=tweets[4].created_at,
+        )
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweets[3].id, tweets[2].id],
+        )
+        newsfeeds = NewsFeedService.get_newsfeeds(
+            self.linghu.id,
+            limit=10,
+            created_at__gt=tweets[3].created_at,
+        )
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweets[5].id, tweets[4].id],
+        )
+
+    @override_settings(NEWSFEED_PULL_FOLLOWERS_THRESHOLD=2)
+    def test_pull_author_downgrade(self):
+        celebrity = self.create_user('celebrity')
+        self.create_friendship(self.linghu, celebrity)
+        self.create_friendship(self.dongxie, celebrity)
+        tweet = self.create_tweet(celebrity)
+        fanout_newsfeeds_main_task(tweet.id, celebrity.id)
+        self.assertFalse(NewsFeed.objects.for_user(self.linghu.id).exists())
+        self.assertTrue(UserProfile.objects.get(user=celebrity).has_unpushed_tweets)
+        newsfeeds = NewsFeedService.get_newsfeeds(self.linghu.id, limit=10)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweet.id])
+
+        # 取关以后粉丝数降到阈值以下，不再 pull，之前没有 fanout 的帖子补推给剩下的粉丝
+        with self.captureOnCommitCallbacks(execute=True):
+            Friendship.objects.filter(from_user=self.dongxie, to_user=celebrity).delete()
+        self.assertEqual(NewsFeedService.get_pull_author_ids(self.linghu.id), [])
+        self.assertFalse(UserProfile.objects.get(user=celebrity).has_unpushed_tweets)
+        newsfeeds = NewsFeedService.get_newsfeeds(self.linghu.id, limit=10)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweet.id])
+        self.assertFalse(NewsFeed.objects.for_user(self.dongxie.id).exists())
+
+        # 粉丝数被 reconcile 改小了，下一次 fanout 的时候补推
+        self.create_friendship(self.dongxie, celebrity)
+        old_tweet = self.create_tweet(celebrity)
+        fanout_newsfeeds_main_task(old_tweet.id, celebrity.id)
+        UserProfile.objects.filter(user=celebrity).update(followers_count=1)
+        self.clear_cache()
+        new_tweet = self.create_tweet(celebrity)
+        fanout_newsfeeds_main_task(new_tweet.id, celebrity.id)
+        self.assertFalse(UserProfile.objects.get(user=celebrity).has_unpushed_tweets)
+        self.assertTrue(NewsFeed.objects.for_user(self.dongxie.id).filter(
+            tweet_id=old_tweet.id,
+        ).exists())
+
+    @override_settings(NEWSFEED_PULL_FOLLOWERS_THRESHOLD=1)
+    def test_get_newsfeeds_deduplicates(self):
+        # 成为大V之前已经 push 过的帖子不会重复出现
+        tweet = self.create_tweet(self.dongxie)
+        self.create_newsfeed(self.linghu, tweet)
+        self.create_friendship(self.linghu, self.dongxie)
+        newsfeeds = NewsFeedService.get_newsfeeds(self.linghu.id, limit=10)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweet.id])
+
+
+class NewsFeedTaskTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_fanout_main_task(self):
+        tweet = self.create_tweet(self.linghu, 'tweet 1')
+        self.create_friendship(self.dongxie, self.linghu)
+        msg = fanout_newsfeeds_main_task(tweet.id, self.linghu.id)
+        self.assertEqual(msg, '1 newsfeeds going to fanout, 1 batches created.')
+        self.assertEqual(1 + 1, NewsFeed.objects.count())
+
+        # batch size is 3 in testing
+        for i in range(2):
+            user = self.create_user('user{}'.format(i))
+            self.create_friendship(user, self.linghu)
+        tweet = self.create_tweet(self.linghu, 'tweet 2')
+        msg = fanout_newsfeeds_main_task(tweet.id, self.linghu.id)
+        self.assertEqual(msg, '3 newsfeeds going to fanout, 1 batches created.')
+        self.assertEqual(4 + 2, NewsFeed.objects.count())
+
+        user = self.create_user('another user')
+        self.create_friendship(user, self.linghu)
+        tweet = self.create_tweet(self.linghu, 'tweet 3')
+        msg = fanout_newsfeeds_main_task(tweet.id, self.linghu.id)
+        self.assertEqual(msg, '4 newsfeeds going to fanout, 2 batches created.')
+        self.assertEqual(8 + 3, NewsFeed.objects.count())
+
+        # 粉丝数达到阈值以后不再 fanout，只写发帖人自己的 newsfeed
+        with self.settings(NEWSFEED_PULL_FOLLOWERS_THRESHOLD=4):
+            self.clear_cache()
+            tweet = self.create_tweet(self.linghu, 'tweet 4')
+            msg = fanout_newsfeeds_main_task(tweet.id, self.linghu.id)
+        self.assertEqual(msg, 'skipped fanout for 4 followers.')
+        self.assertEqual(11 + 1, NewsFeed.objects.count())
+
+    def test_fanout_batch_task_is_idempotent(self):
+        tweet = self.create_tweet(self.linghu)
+        fanout_newsfeeds_batch_task(tweet.id, [self.dongxie.id])
+        # broker 重复投递同一个 batch
+        fanout_newsfeeds_batch_task(tweet.id, [self.dongxie.id])
+        self.assertEqual(NewsFeed.objects.filter(user=self.dongxie).count(), 1)
+
+
+class NewsFeedCacheTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_first_page_is_served_from_cache(self):
+        tweets = [self.create_tweet(self.dongxie) for _ in range(3)]
+        for tweet in tweets:
+            self.create_newsfeed(self.linghu, tweet)
+
+        # cold read loads the list from db
+        items = NewsFeedService.get_cached_newsfeed_items(self.linghu.id, limit=10)
+        self.assertEqual([tweet_id for tweet_id, _ in items], [t.id for t in reversed(tweets)])
+        self.assertEqual(items[0][1], tweets[-1].created_at)
+
+        # warm read never touches the newsfeed table
+        with self.assertNumQueries(0):
+            items = NewsFeedService.get_cached_newsfeed_items(self.linghu.id, limit=2)
+        self.assertEqual([tweet_id for tweet_id, _ in items], [tweets[2].id, tweets[1].id])
+        with self.assertNumQueries(0):
+            items = NewsFeedService.get_cached_newsfeed_items(
+                self.linghu.id,
+                limit=2,
+                created_at__lt=tweets[1].created_at,
+            )
+        self.assertEqual([tweet_id for tweet_id, _ in items], [tweets[0].id])
+
+        # fanout appends to the loaded list
+        tweet = self.create_tweet(self.dongxie)
+        fanout_newsfeeds_batch_task(tweet.id, [self.linghu.id])
+        with self.assertNumQueries(0):
+            items = NewsFeedService.get_cached_newsfeed_items(
+                self.linghu.id,
+                limit=10,
+                created_at__gt=tweets[2].created_at,
+            )
+        self.assertEqual([tweet_id for tweet_id, _ in items], [tweet.id])
+
+    def test_fanout_skips_cold_lists(self):
+        tweet = self.create_tweet(self.dongxie)
+        fanout_newsfeeds_batch_task(tweet.id, [self.linghu.id])
+        conn = RedisClient.get_connection()
+        self.assertEqual(conn.exists(USER_NEWSFEEDS_PATTERN.format(user_id=self.linghu.id)), 0)
+
+    def test_list_is_trimmed(self):
+        limit = settings.REDIS_LIST_LENGTH_LIMIT
+        tweets = [self.create_tweet(self.dongxie) for _ in range(limit + 5)]
+        NewsFeedService.get_cached_newsfeed_items(self.linghu.id, limit=1)
+        for tweet in tweets:
+            fanout_newsfeeds_batch_task(tweet.id, [self.linghu.id])
+
+        conn = RedisClient.get_connection()
+        key = USER_NEWSFEEDS_PATTERN.format(user_id=self.linghu.id)
+        # 占位成员 + 最新的 limit 个 id
+        self.assertEqual(conn.zcard(key), limit + 1)
+
+        # 翻出 cache 的范围以后回源到数据库
+        items = NewsFeedService.get_cached_newsfeed_items(
+            self.linghu.id,
+            limit=10,
+            created_at__lt=tweets[5].created_at,
+        )
+        self.assertEqual([tweet_id for tweet_id, _ in items], [t.id for t in reversed(tweets[:5])])
+
+
+class NewsFeedFollowTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+        self.linghu_client = APIClient()
+        self.linghu_client.force_authenticate(self.linghu)
+
+    def test_backfill_on_follow(self):
+        limit = settings.NEWSFEED_BACKFILL_TWEETS_LIMIT
+        tweets = [self.create_tweet(self.dongxie) for _ in range(limit + 2)]
+        # 先把 cache 加载出来，确认 backfill 以后 cache 会失效
+        self.assertEqual(NewsFeedService.get_newsfeeds(self.linghu.id, limit=10), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.linghu_client.post(FOLLOW_URL.format(self.dongxie.id))
+        newsfeeds = NewsFeedService.get_newsfeeds(self.linghu.id, limit=limit + 10)
+        self.assertEqual(
+            [newsfeed.tweet_id for newsfeed in newsfeeds],
+            [tweet.id for tweet in reversed(tweets[-limit:])],
+        )
+        self.assertEqual(newsfeeds[0].created_at, tweets[-1].created_at)
+
+        # idempotent
+        backfill_newsfeeds_task(self.linghu.id, self.dongxie.id)
+        self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), limit)
+
+    def test_backfill_skips_unfollowed(self):
+        self.create_tweet(self.dongxie)
+        msg = backfill_newsfeeds_task(self.linghu.id, self.dongxie.id)
+        self.assertEqual(msg, 'friendship does not exist')
+        self.assertEqual(NewsFeed.objects.count(), 0)
+
+    def test_retract_on_unfollow(self):
+        other = self.create_user('other')
+        self.create_friendship(self.linghu, self.dongxie)
+        for _ in range(settings.NEWSFEED_FANOUT_BATCH_SIZE + 1):
+            self.create_newsfeed(self.linghu, self.create_tweet(self.dongxie))
+        other_tweet = self.create_tweet(other)
+        self.create_newsfeed(self.linghu, other_tweet)
+        NewsFeedService.get_newsfeeds(self.linghu.id, limit=10)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.linghu_client.post(UNFOLLOW_URL.format(self.dongxie.id))
+        newsfeeds = NewsFeedService.get_newsfeeds(self.linghu.id, limit=10)
+        self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [other_tweet.id])
+
+        # 重新关注以后不会再删除
+        self.create_friendship(self.linghu, self.dongxie)
+        self.create_newsfeed(self.linghu, self.create_tweet(self.dongxie))
+        msg = retract_newsfeeds_task(self.linghu.id, self.dongxie.id)
+        self.assertEqual(msg, 'friendship exists')
+        self.assertEqual(NewsFeed.objects.filter(user=self.linghu).count(), 2)
+
+
+SHARDS = ['default', 'newsfeeds_shard_1', 'newsfeeds_shard_2']
+
+
+@override_settings(NEWSFEED_DB_SHARDS=SHARDS)
+class NewsFeedShardingTests(TestCase):
+    databases = set(SHARDS)
+
+    def setUp(self):
+        self.clear_cache()
+        self.users = [self.create_user('user{}'.format(i)) for i in range(6)]
+        self.author = self.users[0]
+        for user in self.users[1:]:
+            self.create_friendship(user, self.author)
+
+    def _count_by_shard(self):
+        return {
+            shard: NewsFeed.objects.using(shard).count()
+            for shard in SHARDS
+        }
+
+    def test_get_shard(self):
+        for user in self.users:
+            self.assertEqual(get_shard(user.id), SHARDS[user.id % 3])
+
+    def test_fanout_writes_to_user_shard(self):
+        tweet = self.create_tweet(self.author)
+        fanout_newsfeeds_main_task(tweet.id, self.author.id)
+
+        counts = self._count_by_shard()
+        self.assertEqual(sum(counts.values()), len(self.users))
+        for shard in SHARDS:
+            expected = len([user for user in self.users if get_shard(user.id) == shard])
+            self.assertEqual(counts[shard], expected)
+
+        # 每个用户的 newsfeed 只在一个 shard 上
+        for user in self.users:
+            self.assertEqual(NewsFeed.objects.for_user(user.id).count(), 1)
+            newsfeeds = NewsFeedService.get_newsfeeds(user.id, limit=10)
+            self.assertEqual([newsfeed.tweet_id for newsfeed in newsfeeds], [tweet.id])
+
+        # instance 的读写按照 user_id 路由
+        newsfeed = NewsFeed.objects.for_user(self.users[1].id).get()
+        self.assertEqual(newsfeed._state.db, get_shard(self.users[1].id))
+        self.assertEqual(newsfeed.tweet, tweet)
+        newsfeed.save()
+        newsfeed.refresh_from_db()
+
+    def test_retract_on_shard(self):
+        tweet = self.create_tweet(self.author)
+        fanout_newsfeeds_main_task(tweet.id, self.author.id)
+        follower = self.users[2]
+        Friendship.objects.filter(from_user=follower, to_user=self.author).delete()
+        retract_newsfeeds_task(follower.id, self.author.id)
+        self.assertEqual(NewsFeed.objects.for_user(follower.id).count(), 0)
+
+    def test_rebalance(self):
+        # 所有数据都写在 default 上，模拟新增 shard 之前的状态
+        tweet = self.create_tweet(self.author)
+        with self.settings(NEWSFEED_DB_SHARDS=['default']):
+            fanout_newsfeeds_main_task(tweet.id, self.author.id)
+        self.assertEqual(self._count_by_shard()['default'], len(self.users))
+
+        out = StringIO()
+        call_command('rebalance_newsfeed_shards', '--batch-size', '2', stdout=out)
+        counts = self._count_by_shard()
+        self.assertEqual(sum(counts.values()), len(self.users))
+        for user in self.users:
+            self.assertEqual(NewsFeed.objects.for_user(user.id).count(), 1)
+
+        # 再运行一次什么都不会发生
+        out = StringIO()
+        call_command('rebalance_newsfeed_shards', stdout=out)
+        self.assertIn('0 newsfeeds moved in total', out.getvalue())
+        self.assertEqual(self._count_by_shard(), counts)
+
+
+class NewsFeedRetentionTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_trim_user_newsfeeds(self):
+        tweets = [self.create_tweet(self.dongxie) for _ in range(5)]
+        for tweet in tweets:
+            self.create_newsfeed(self.linghu, tweet)
+            self.create_newsfeed(self.dongxie, tweet)
+
+        deleted = NewsFeedService.trim_user_newsfeeds(self.linghu.id, keep=2, batch_size=2)
+        self.assertEqual(deleted, 3)
+        self.assertEqual(
+            set(NewsFeed.objects.for_user(self.linghu.id).values_list('tweet_id', flat=True)),
+            {tweets[3].id, tweets[4].id},
+        )
+        self.assertEqual(NewsFeed.objects.for_user(self.dongxie.id).count(), 5)
+        self.assertEqual(NewsFeedService.trim_user_newsfeeds(self.linghu.id, keep=2, batch_size=2), 0)
+
+    def test_trim_user_newsfeeds_with_same_created_at(self):
+        tweets = [self.create_tweet(self.dongxie) for _ in range(5)]
+        newsfeeds = [self.create_newsfeed(self.linghu, tweet) for tweet in tweets]
+        created_at = newsfeeds[0].created_at
+        NewsFeed.objects.for_user(self.linghu.id).update(created_at=created_at)
+
+        deleted = NewsFeedService.trim_user_newsfeeds(self.linghu.id, keep=2, batch_size=2)
+        self.assertEqual(deleted, 3)
+        self.assertEqual(
+            set(NewsFeed.objects.for_user(self.linghu.id).values_list('id', flat=True)),
+            {newsfeeds[3].id, newsfeeds[4].id},
+        )
+
+    def test_compact_command(self):
+        tweets = [self.create_tweet(self.dongxie) for _ in range(4)]
+        for tweet in tweets:
+            self.create_newsfeed(self.linghu, tweet)
+        # tweet 被删除以后 newsfeed 还留在表里
+        tweets[3].delete()
+        NewsFeed.objects.for_user(self.linghu.id).filter(tweet_id=tweets[2].id).update(tweet_id=None)
+
+        out = StringIO()
+        call_command(
+            'compact_newsfeeds',
+            '--keep', '1',
+            '--batch-size', '1',
+            '--sleep', '0',
+            stdout=out,
+        )
+        self.assertIn('2 dangling newsfeeds deleted, 1 old newsfeeds trimmed', out.getvalue())
+        self.assertEqual(
+            list(NewsFeed.objects.for_user(self.linghu.id).values_list('tweet_id', flat=True)),
+            [tweets[1].id],
+        )
+
+    def test_compact_trims_every_user_in_batch(self):
+        users = [self.create_user('reader{}'.format(i)) for i in range(3)]
+        tweets = [self.create_tweet(self.dongxie) for _ in range(3)]
+        for user in users:
+            for tweet in tweets:
+                self.create_newsfeed(user, tweet)
+        version_keys = [USER_NEWSFEEDS_VERSION_PATTERN.format(user_id=user.id) for user in users]
+        versions = RedisHelper.get_versions(version_keys)
+
+        dangling_deleted, trimmed = NewsFeedService.compact(keep=1, batch_size=10)
+        self.assertEqual((dangling_deleted, trimmed), (0, 6))
+        conn = RedisClient.get_connection()
+        for user, version, new_version in zip(
+            users,
+            versions,
+            RedisHelper.get_versions(version_keys),
+        ):
+            self.assertEqual(
+                list(NewsFeed.objects.for_user(user.id).values_list('tweet_id', flat=True)),
+                [tweets[2].id],
+            )
+            # 每个被截断的用户的 cache 都失效了
+            self.assertFalse(conn.exists(USER_NEWSFEEDS_PATTERN.format(user_id=user.id)))
+            self.assertGreater(new_version, version)
+
+
+class NewsFeedBenchmarkTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertEqual(percentile([], 50), None)
+
+    @override_settings(NEWSFEED_PULL_FOLLOWERS_THRESHOLD=3)
+    def test_benchmark_command(self):
+        users_count = User.objects.count()
+        out = StringIO()
+        call_command(
+            'benchmark_newsfeeds',
+            '--sizes', '20', '40',
+            '--samples', '4',
+            stdout=out,
+            stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual([run['size'] for run in report['runs']], [20, 40])
+        run = report['runs'][1]
+        self.assertEqual(run['graph']['users'], 40)
+        # 粉丝数写进了 profile，大V会走 pull 的路径
+        self.assertGreater(run['graph']['pull_authors'], 0)
+        self.assertEqual(run['fanout']['seconds']['count'], 4)
+        self.assertGreater(run['fanout']['rows_written'], 4)
+        self.assertGreater(run['feed_read']['cold']['queries']['p50'], 0)
+        self.assertIn('p99', run['feed_read']['warm']['seconds'])
+        self.assertEqual(run['get_follower_ids']['warm']['seconds']['count'], 4)
+        # 所有的数据都被回滚了
+        self.assertEqual(User.objects.count(), users_count)
+        self.assertEqual(UserProfile.objects.count(), 0)
+        self.assertEqual(NewsFeed.objects.count(), 0)
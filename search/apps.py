@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class SearchConfig(AppConfig):
+    name = 'search'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from search.listeners import index_tweet, remove_tweet
+        from tweets.models import Tweet
+        post_save.connect(index_tweet, sender=Tweet)
+        post_delete.connect(remove_tweet, sender=Tweet)
@@ -0,0 +1,166 @@
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count
+from search.models import TweetSearchPosting
+
+# 多个 term 求交集的时候，每次从最短的 posting list 上读这么多个 tweet_id 去其他 list 里检查
+SEARCH_CHUNK_SIZE = 200
+# 用来挑选最短的 posting list，只数到这么多为止，常见词也不会扫整个 list
+SEARCH_TERM_COUNT_LIMIT = 1000
+
+
+class BaseSearchBackend(object):
+    """
+    倒排索引的存储，settings.SEARCH_BACKEND 指定使用哪一个实现
+    切词在 SearchService 里完成，backend 只处理 term 和 tweet_id
+    """
+
+    def index(self, documents):
+        """
+        documents 是 [(tweet_id, terms)]，已经存在的 tweet 会用新的 terms 覆盖
+        """
+        raise NotImplementedError
+
+    def remove(self, tweet_ids):
+        raise NotImplementedError
+
+    def search(self, terms, limit, id__lt=None):
+        """
+        返回包含所有 terms 的 tweet_id，按 tweet_id 倒序，最多 limit 个
+        id__lt 是翻页的 cursor，只返回比它小的 tweet_id
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    posting list 存在 TweetSearchPosting 表里，和 tweet 在同一个事务里写入
+    """
+
+    def index(self, documents):
+        postings = [
+            TweetSearchPosting(term=term, tweet_id=tweet_id)
+            for tweet_id, terms in documents
+            for term in terms
+        ]
+        with transaction.atomic():
+            self.remove([tweet_id for tweet_id, _ in documents])
+            TweetSearchPosting.objects.bulk_create(postings)
+
+    def remove(self, tweet_ids):
+        TweetSearchPosting.objects.filter(tweet_id__in=tweet_ids).delete()
+
+    def _get_posting_ids(self, term, limit, id__lt):
+        postings = TweetSearchPosting.objects.filter(term=term)
+        if id__lt is not None:
+            postings = postings.filter(tweet_id__lt=id__lt)
+        return list(postings.order_by('-tweet_id').values_list(
+            'tweet_id',
+            flat=True,
+        )[:limit])
+
+    def search(self, terms, limit, id__lt=None):
+        if not terms:
+            return []
+        postings = TweetSearchPosting.objects.all()
+        if id__lt is not None:
+            postings = postings.filter(tweet_id__lt=id__lt)
+        sizes = {
+            term: postings.filter(term=term)[:SEARCH_TERM_COUNT_LIMIT].count()
+            for term in terms
+        }
+        if not all(sizes.values()):
+            return []
+        # 从最短的 posting list 开始往后读，每读一段就去其他 list 里检查一次，
+        # 凑够 limit 个就停下来
+        driver, *others = sorted(terms, key=lambda term: sizes[term])
+        chunk_size = max(limit, SEARCH_CHUNK_SIZE) if others else limit
+        tweet_ids = []
+        while len(tweet_ids) < limit:
+            chunk = self._get_posting_ids(driver, chunk_size, id__lt)
+            if not chunk:
+                break
+            id__lt = chunk[-1]
+            if others:
+                matched = set(TweetSearchPosting.objects.filter(
+                    term__in=others,
+                    tweet_id__in=chunk,
+                ).values('tweet_id').annotate(
+                    count=Count('id'),
+                ).filter(count=len(others)).values_list('tweet_id', flat=True))
+                tweet_ids.extend(tweet_id for tweet_id in chunk if tweet_id in matched)
+            else:
+                tweet_ids.extend(chunk)
+            if len(chunk) < chunk_size:
+                break
+        return tweet_ids[:limit]
+
+    def clear(self):
+        TweetSearchPosting.objects.all().delete()
+
+
+class MemorySearchBackend(BaseSearchBackend):
+    """
+    进程内的索引，只用于本地开发，重启以后需要用 rebuild_search_index 重建
+    每个 posting list 是一个升序的 list，用二分查找定位 cursor 和检查是否包含
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(list)
+        self._terms = {}
+
+    def _remove(self, tweet_id):
+        for term in self._terms.pop(tweet_id, ()):
+            posting = self._postings[term]
+            posting.pop(bisect_left(posting, tweet_id))
+            if not posting:
+                del self._postings[term]
+
+    def index(self, documents):
+        with self._lock:
+            for tweet_id, terms in documents:
+                self._remove(tweet_id)
+                self._terms[tweet_id] = set(terms)
+                for term in self._terms[tweet_id]:
+                    insort(self._postings[term], tweet_id)
+
+    def remove(self, tweet_ids):
+        with self._lock:
+            for tweet_id in tweet_ids:
+                self._remove(tweet_id)
+
+    @classmethod
+    def _contains(cls, posting, tweet_id):
+        index = bisect_left(posting, tweet_id)
+        return index < len(posting) and posting[index] == tweet_id
+
+    def search(self, terms, limit, id__lt=None):
+        with self._lock:
+            postings = sorted(
+                (self._postings.get(term, []) for term in terms),
+                key=len,
+            )
+            if not postings or not postings[0]:
+                return []
+            driver, *others = postings
+            end = len(driver) if id__lt is None else bisect_left(driver, id__lt)
+            tweet_ids = []
+            for index in range(end - 1, -1, -1):
+                if len(tweet_ids) >= limit:
+                    break
+                tweet_id = driver[index]
+                if all(self._contains(posting, tweet_id) for posting in others):
+                    tweet_ids.append(tweet_id)
+            return tweet_ids
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._terms.clear()
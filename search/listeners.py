@@ -0,0 +1,11 @@
+def index_tweet(sender, instance, created, **kwargs):
+    # tweet 发出以后内容不能修改，只需要在创建的时候建索引
+    if not created:
+        return
+    from search.services import SearchService
+    SearchService.index_tweets([instance])
+
+
+def remove_tweet(sender, instance, **kwargs):
+    from search.services import SearchService
+    SearchService.remove_tweets([instance.id])
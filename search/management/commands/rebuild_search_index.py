@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from search.services import SearchService
+
+
+class Command(BaseCommand):
+    help = (
+        'Re-tokenize every tweet and rewrite its postings in the configured search backend. '
+        'Use it after changing the tokenizer or switching SEARCH_BACKEND.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = SearchService.rebuild_index(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('{} tweets indexed'.format(count)))
@@ -0,0 +1,27 @@
+# Generated by Django 3.1.3 on 2026-10-18 19:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('tweets', '0006_tweetphoto_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TweetSearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('tweet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tweets.tweet')),
+            ],
+            options={
+                'unique_together': {('term', 'tweet')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import models
+from tweets.models import Tweet
+
+
+class TweetSearchPosting(models.Model):
+    """
+    DatabaseSearchBackend 的倒排索引，每个 (term, tweet) 一行
+    (term, tweet) 上的唯一索引就是按 tweet_id 排好序的 posting list，
+    倒序读一段只需要在索引上 seek 一次，不需要把整个 posting list 读出来
+    """
+    term = models.CharField(max_length=64)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = (('term', 'tweet'),)
+
+    def __str__(self):
+        return '{} - {}'.format(self.term, self.tweet_id)
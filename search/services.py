@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.utils.module_loading import import_string
+from search.tokenizer import tokenize
+from tweets.models import Tweet
+
+# 每个进程每种 backend 只创建一次，MemorySearchBackend 的索引存在这个实例上
+_backends = {}
+
+
+class SearchService(object):
+
+    @classmethod
+    def get_backend(cls):
+        path = settings.SEARCH_BACKEND
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
+
+    @classmethod
+    def index_tweets(cls, tweets):
+        cls.get_backend().index([
+            (tweet.id, tokenize(tweet.content))
+            for tweet in tweets
+        ])
+
+    @classmethod
+    def remove_tweets(cls, tweet_ids):
+        cls.get_backend().remove(tweet_ids)
+
+    @classmethod
+    def search_tweet_ids(cls, query, limit, id__lt=None):
+        """
+        返回包含 query 里所有词的 tweet_id，从新到旧，最多 limit 个
+        """
+        return cls.get_backend().search(
+            tokenize(query, for_query=True),
+            limit,
+            id__lt=id__lt,
+        )
+
+    @classmethod
+    def rebuild_index(cls, batch_size=1000):
+        """
+        按 id 分批把所有 tweet 重新写一遍索引，已有的索引原地覆盖，不会出现搜不到的空窗期
+        返回处理的 tweet 数量
+        """
+        count = 0
+        last_id = 0
+        while True:
+            tweets = list(Tweet.objects.filter(
+                id__gt=last_id,
+            ).order_by('id').only('id', 'content')[:batch_size])
+            if not tweets:
+                break
+            cls.index_tweets(tweets)
+            count += len(tweets)
+            last_id = tweets[-1].id
+        return count
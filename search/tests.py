@@ -0,0 +1,144 @@
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+from search import backends
+from search.backends import DatabaseSearchBackend, MemorySearchBackend
+from search.models import TweetSearchPosting
+from search.services import SearchService
+from search.tokenizer import tokenize
+from testing.testcases import TestCase
+from unittest import mock
+
+
+class TokenizerTests(TestCase):
+
+    def test_tokenize(self):
+        self.assertEqual(
+            tokenize('Hello, WORLD! #Django @linghu hello_world'),
+            ['hello', 'world', 'django', 'linghu'],
+        )
+        # 全角字符归一化成半角
+        self.assertEqual(tokenize('ＡＢＣ１２３'), ['abc123'])
+        self.assertEqual(
+            tokenize('九章算法'),
+            ['九', '章', '算', '法', '九章', '章算', '算法'],
+        )
+        # 中英文混在一起的时候分开处理
+        self.assertEqual(tokenize('学python'), ['学', 'python'])
+        self.assertEqual(tokenize('x' * 65), [])
+        self.assertEqual(tokenize(''), [])
+
+    def test_tokenize_query(self):
+        self.assertEqual(tokenize('九章算法', for_query=True), ['九章', '章算', '算法'])
+        self.assertEqual(tokenize('九', for_query=True), ['九'])
+        self.assertEqual(tokenize('Django 九章', for_query=True), ['django', '九章'])
+
+
+class SearchBackendTestsMixin(object):
+
+    def get_backend(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.clear_cache()
+        self.user = self.create_user('linghu')
+        self.tweet_ids = [
+            self.create_tweet(self.user).id
+            for _ in range(6)
+        ]
+        self.backend = self.get_backend()
+        self.backend.clear()
+        # 偶数位置的 tweet 包含 django，所有 tweet 都包含 python
+        self.backend.index([
+            (tweet_id, ['python', 'django'] if index % 2 == 0 else ['python'])
+            for index, tweet_id in enumerate(self.tweet_ids)
+        ])
+
+    def test_search(self):
+        ids = self.tweet_ids
+        self.assertEqual(self.backend.search(['python'], 10), ids[::-1])
+        self.assertEqual(self.backend.search(['python'], 2), [ids[5], ids[4]])
+        self.assertEqual(self.backend.search(['python'], 2, id__lt=ids[4]), [ids[3], ids[2]])
+        self.assertEqual(
+            self.backend.search(['python', 'django'], 10),
+            [ids[4], ids[2], ids[0]],
+        )
+        self.assertEqual(
+            self.backend.search(['django', 'python'], 1, id__lt=ids[4]),
+            [ids[2]],
+        )
+        self.assertEqual(self.backend.search(['python', 'flask'], 10), [])
+        self.assertEqual(self.backend.search([], 10), [])
+
+    def test_index_and_remove(self):
+        ids = self.tweet_ids
+        # 重新建索引会覆盖旧的 terms
+        self.backend.index([(ids[5], ['django'])])
+        self.assertEqual(self.backend.search(['python'], 10), ids[4::-1])
+        self.assertEqual(self.backend.search(['django'], 10), [ids[5], ids[4], ids[2], ids[0]])
+        self.backend.remove([ids[4], ids[5]])
+        self.assertEqual(self.backend.search(['django'], 10), [ids[2], ids[0]])
+        self.backend.clear()
+        self.assertEqual(self.backend.search(['python'], 10), [])
+
+
+class DatabaseSearchBackendTests(SearchBackendTestsMixin, TestCase):
+
+    def get_backend(self):
+        return DatabaseSearchBackend()
+
+    def test_search_reads_chunks(self):
+        ids = self.tweet_ids
+        # 每次只从 posting list 上读一小段，找够了就不再往后读
+        with mock.patch.object(backends, 'SEARCH_CHUNK_SIZE', 2):
+            with CaptureQueriesContext(connection) as queries:
+                tweet_ids = self.backend.search(['python', 'django'], 1)
+            self.assertEqual(tweet_ids, [ids[4]])
+            # 2 次 count 选出最短的 list，1 次读 django 的前两个，1 次检查 python
+            self.assertEqual(len(queries), 4)
+            self.assertEqual(
+                self.backend.search(['python', 'django'], 10),
+                [ids[4], ids[2], ids[0]],
+            )
+
+
+class MemorySearchBackendTests(SearchBackendTestsMixin, TestCase):
+
+    def get_backend(self):
+        return MemorySearchBackend()
+
+
+class SearchServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.user = self.create_user('linghu')
+
+    def test_incremental_index(self):
+        tweet1 = self.create_tweet(self.user, content='Learning Django at 九章算法')
+        tweet2 = self.create_tweet(self.user, content='django rocks')
+        self.assertEqual(SearchService.search_tweet_ids('DJANGO', 10), [tweet2.id, tweet1.id])
+        self.assertEqual(SearchService.search_tweet_ids('django 算法', 10), [tweet1.id])
+        self.assertEqual(SearchService.search_tweet_ids('九章', 10), [tweet1.id])
+        self.assertEqual(SearchService.search_tweet_ids('!!!', 10), [])
+
+        tweet1.delete()
+        self.assertEqual(SearchService.search_tweet_ids('django', 10), [tweet2.id])
+        self.assertFalse(TweetSearchPosting.objects.filter(tweet_id=tweet1.id).exists())
+
+    def test_rebuild_index(self):
+        tweets = [self.create_tweet(self.user, content='hello') for _ in range(3)]
+        TweetSearchPosting.objects.all().delete()
+        self.assertEqual(SearchService.search_tweet_ids('hello', 10), [])
+
+        out = StringIO()
+        call_command('rebuild_search_index', batch_size=2, stdout=out)
+        self.assertIn('3 tweets indexed', out.getvalue())
+        self.assertEqual(
+            SearchService.search_tweet_ids('hello', 10),
+            [tweet.id for tweet in reversed(tweets)],
+        )
+        # 重复运行不会产生重复的 posting
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(TweetSearchPosting.objects.count(), 3)
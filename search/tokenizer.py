@@ -0,0 +1,42 @@
+import re
+import unicodedata
+
+# 字母和数字组成的连续片段，下划线当作分隔符
+WORD_RE = re.compile(r'[^\W_]+')
+# 中日韩的文字之间没有空格，按字切开以后再组成二元组
+CJK_RE = re.compile(
+    r'([\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)'
+)
+MAX_TERM_LENGTH = 64
+
+
+def _cjk_terms(run, for_query):
+    if len(run) == 1:
+        return [run]
+    bigrams = [run[i:i + 2] for i in range(len(run) - 1)]
+    # 查询的时候只用二元组，更有区分度；建索引的时候也存单字，这样只搜一个字也能搜到
+    if for_query:
+        return bigrams
+    return list(run) + bigrams
+
+
+def tokenize(text, for_query=False):
+    """
+    把文本切成 term，建索引和查询用同一套规则
+    - NFKC 归一化并转成小写，全角的字母数字和半角的一样
+    - 英文数字按非字母数字的字符切开，#tag 和 @user 会变成 tag 和 user
+    - 中日韩文字切成单字和相邻两个字的二元组
+    返回去重以后的 term，保持第一次出现的顺序
+    """
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    terms = []
+    for word in WORD_RE.findall(text):
+        for index, run in enumerate(CJK_RE.split(word)):
+            if not run:
+                continue
+            # split 带了分组，奇数位置上是中日韩文字的片段
+            if index % 2:
+                terms.extend(_cjk_terms(run, for_query))
+            elif len(run) <= MAX_TERM_LENGTH:
+                terms.append(run)
+    return list(dict.fromkeys(terms))
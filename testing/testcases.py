@@ -1,15 +1,55 @@
-from comments.models import Comment
+from comments.services import CommentService
 from django.contrib.auth.models import User
-from django.contrib.contenttypes.models import ContentType
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.test import TestCase as DjangoTestCase
-from likes.models import Like
+from friendships.models import Friendship
+from io import BytesIO
+from likes.services import LikeService
+from PIL import Image
 from rest_framework.test import APIClient
 from tweets.models import Tweet
+from utils.redis_client import RedisClient
 from newsfeeds.models import NewsFeed
+from newsfeeds.services import NewsFeedService
 
 
 class TestCase(DjangoTestCase):
 
+    @classmethod
+    @contextmanager
+    def captureOnCommitCallbacks(cls, *, using=DEFAULT_DB_ALIAS, execute=False):
+        """
+        Backport of Django 3.2's TestCase.captureOnCommitCallbacks.
+        TestCase 会把每个测试包在一个不会提交的事务里，所以 transaction.on_commit
+        注册的回调（比如投递 celery 任务）默认永远不会执行，需要用它来手动触发
+        """
+        callbacks = []
+        start_count = len(connections[using].run_on_commit)
+        try:
+            yield callbacks
+        finally:
+            while True:
+                run_on_commit = connections[using].run_on_commit[start_count:]
+                if not run_on_commit:
+                    break
+                start_count += len(run_on_commit)
+                for _, callback in run_on_commit:
+                    callbacks.append(callback)
+                    if execute:
+                        callback()
+                if not execute:
+                    break
+
+    def clear_cache(self):
+        # 测试之间数据库会回滚，id 也会被重新使用，所以 cache 也必须清空
+        for alias in settings.CACHES:
+            caches[alias].clear()
+        RedisClient.clear()
+
     @property
     def anonymous_client(self):
         if hasattr(self, '_anonymous_client'):
@@ -32,19 +72,29 @@ class TestCase(DjangoTestCase):
     def create_comment(self, user, tweet, content=None):
         if content is None:
             content = 'default comment content'
-        return Comment.objects.create(user=user, tweet=tweet, content=content)
+        return CommentService.create_comment(user.id, tweet.id, content)
 
     def create_newsfeed(self, user, tweet):
-        return NewsFeed.objects.create(user=user, tweet=tweet)
-
-    def create_like(self, user, target):
-        instance, _ = Like.objects.get_or_create(
-            content_type=ContentType.objects.get_for_model(target.__class__),
-            object_id=target.id,
+        newsfeed = NewsFeed.objects.for_user(user.id).create(
             user=user,
+            tweet=tweet,
+            created_at=tweet.created_at,
         )
+        NewsFeedService.push_newsfeeds_to_cache([user.id], tweet.id, tweet.created_at)
+        return newsfeed
+
+    def create_friendship(self, from_user, to_user):
+        return Friendship.objects.create(from_user=from_user, to_user=to_user)
+
+    def create_like(self, user, target):
+        instance, _ = LikeService.create_like(user, target.__class__, target.id)
         return instance
 
+    def create_image_file(self, name, size, image_format='JPEG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, color=(255, 0, 0)).save(buffer, image_format)
+        return SimpleUploadedFile(name, buffer.getvalue())
+
     def create_user_and_client(self, *args, **kwargs):
         user = self.create_user(*args, **kwargs)
         client = APIClient()
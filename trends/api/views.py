@@ -0,0 +1,12 @@
+from rest_framework import viewsets
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from trends.services import TrendService
+
+
+class TrendViewSet(viewsets.GenericViewSet):
+    permission_classes = (AllowAny,)
+
+    def list(self, request, *args, **kwargs):
+        # 结果由 trends worker 定期写到 cache 里，这里不做任何计算
+        return Response(TrendService.get_trends())
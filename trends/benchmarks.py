@@ -0,0 +1,101 @@
+import random
+import time
+from collections import Counter
+
+from django.conf import settings
+from newsfeeds.benchmarks import summarize
+from trends.services import TrendService
+from trends.sketches import SlidingWindowTopK
+
+
+class TrendsBenchmark(object):
+    """
+    用模拟的 tweet 流测量 trends 统计的吞吐量和准确率：
+    - 词表里排名第 i 的词出现的概率正比于 1 / i ^ alpha，少数热词 + 大量长尾
+    - tweets 的时间均匀分布在一个窗口里
+    - 吞吐量包括切词和更新 sketch，也就是 trends worker 处理一条 tweet 的全部工作
+    - 准确率和精确计数的 top k 比较，recall 是精确 top k 里有多少出现在估计的 top k 里
+    不需要数据库，也不会修改 worker 里的统计数据
+    """
+
+    def __init__(self, tweets, vocabulary=10000, alpha=1.1, words_per_tweet=8,
+                 hashtag_ratio=0.3, top_k=None, samples=5, seed=0):
+        self.tweets = tweets
+        self.vocabulary = vocabulary
+        self.alpha = alpha
+        self.words_per_tweet = words_per_tweet
+        self.hashtag_ratio = hashtag_ratio
+        self.top_k = top_k or settings.TRENDS_TOP_K
+        self.samples = samples
+        self.random = random.Random(seed)
+
+    def _generate_stream(self):
+        words = ['word{}'.format(rank) for rank in range(1, self.vocabulary + 1)]
+        weights = [1 / rank ** self.alpha for rank in range(1, self.vocabulary + 1)]
+        # 从一个时间片的开头开始，少用一个时间片，保证所有的 tweets 都还在窗口里
+        bucket_seconds = settings.TRENDS_WINDOW / settings.TRENDS_BUCKETS
+        duration = settings.TRENDS_WINDOW - bucket_seconds
+        start = (time.time() - duration) // bucket_seconds * bucket_seconds
+        stream = []
+        for index in range(self.tweets):
+            tokens = self.random.choices(words, weights, k=self.words_per_tweet)
+            if self.random.random() < self.hashtag_ratio:
+                tokens[0] = '#' + tokens[0]
+            timestamp = start + duration * index / self.tweets
+            stream.append((' '.join(tokens), timestamp))
+        return stream
+
+    def _create_engine(self):
+        return SlidingWindowTopK(
+            window=settings.TRENDS_WINDOW,
+            buckets=settings.TRENDS_BUCKETS,
+            width=settings.TRENDS_SKETCH_WIDTH,
+            depth=settings.TRENDS_SKETCH_DEPTH,
+            capacity=settings.TRENDS_HEAVY_HITTERS,
+        )
+
+    def measure_throughput(self, stream):
+        engine = self._create_engine()
+        start = time.perf_counter()
+        for content, timestamp in stream:
+            engine.add(TrendService.extract_terms(content), timestamp)
+        seconds = time.perf_counter() - start
+        return engine, {
+            'tweets': len(stream),
+            'seconds': seconds,
+            'tweets_per_second': len(stream) / seconds if seconds else None,
+        }
+
+    def measure_accuracy(self, engine, stream, now):
+        exact = Counter()
+        for content, _ in stream:
+            exact.update(TrendService.extract_terms(content))
+        expected = [term for term, _ in sorted(
+            exact.items(),
+            key=lambda item: (-item[1], item[0]),
+        )[:self.top_k]]
+
+        seconds = []
+        for _ in range(self.samples):
+            start = time.perf_counter()
+            estimated = engine.top(self.top_k, now)
+            seconds.append(time.perf_counter() - start)
+        errors = [
+            (count - exact[term]) / exact[term]
+            for term, count in estimated
+        ]
+        return {
+            'recall': len(set(expected) & {term for term, _ in estimated}) / len(expected),
+            'max_relative_error': max(errors) if errors else None,
+            'snapshot_seconds': summarize(seconds),
+        }
+
+    def run(self):
+        stream = self._generate_stream()
+        now = stream[-1][1]
+        engine, throughput = self.measure_throughput(stream)
+        return {
+            'throughput': throughput,
+            'accuracy': self.measure_accuracy(engine, stream, now),
+            'sketch_bytes': sum(sketch.table.itemsize * len(sketch.table) for sketch in engine.sketches),
+        }
@@ -0,0 +1,65 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from newsfeeds.benchmarks import get_git_revision
+from trends.benchmarks import TrendsBenchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Feed a synthetic Zipf-distributed tweet stream through the trends sketches and '
+        'report throughput in tweets/sec, top-k recall against exact counts and snapshot '
+        'latency. Results are written as JSON so runs on different commits can be compared.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tweets', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--vocabulary', type=int, default=10000)
+        parser.add_argument('--alpha', type=float, default=1.1)
+        parser.add_argument('--words-per-tweet', type=int, default=8)
+        parser.add_argument('--samples', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default=None, help='Write JSON here instead of stdout.')
+
+    def handle(self, *args, **options):
+        runs = []
+        for tweets in options['tweets']:
+            benchmark = TrendsBenchmark(
+                tweets=tweets,
+                vocabulary=options['vocabulary'],
+                alpha=options['alpha'],
+                words_per_tweet=options['words_per_tweet'],
+                samples=options['samples'],
+                seed=options['seed'],
+            )
+            runs.append(dict(benchmark.run(), size=tweets))
+            self.stderr.write('finished benchmark for {} tweets'.format(tweets))
+
+        report = {
+            'revision': get_git_revision(),
+            'created_at': timezone.now().isoformat(),
+            'settings': {
+                key: getattr(settings, key)
+                for key in [
+                    'TRENDS_WINDOW',
+                    'TRENDS_BUCKETS',
+                    'TRENDS_SKETCH_WIDTH',
+                    'TRENDS_SKETCH_DEPTH',
+                    'TRENDS_HEAVY_HITTERS',
+                    'TRENDS_TOP_K',
+                ]
+            },
+            'options': {
+                key: options[key]
+                for key in ['vocabulary', 'alpha', 'words_per_tweet', 'samples', 'seed']
+            },
+            'runs': runs,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from search.tokenizer import tokenize
+from trends.sketches import SlidingWindowTopK
+from trends.tasks import record_tweet_terms_task
+from tweets.services import TweetService
+
+TRENDS_CACHE_KEY = 'trends'
+# 太常见的英文词没有意义，不参与统计
+STOP_WORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'from', 'has',
+    'have', 'i', 'in', 'is', 'it', 'its', 'me', 'my', 'not', 'of', 'on', 'or', 'so',
+    'that', 'the', 'this', 'to', 'was', 'we', 'with', 'you', 'your',
+))
+
+# 只在消费 trends 队列的 worker 进程里创建
+_engine = None
+_last_snapshot_at = 0
+
+
+class TrendService(object):
+    """
+    发帖的时候把 tweet 里的 #tag 和关键词投递到 celery 的 trends 队列，
+    由一个 worker 进程在内存里按滑动窗口统计，定期把 top k 写到 cache 里，
+    /api/trends 只读 cache
+    trends 队列只能由一个并发为 1 的 worker 消费，否则每个进程只能看到一部分数据
+    """
+
+    @classmethod
+    def get_engine(cls):
+        global _engine
+        if _engine is None:
+            _engine = SlidingWindowTopK(
+                window=settings.TRENDS_WINDOW,
+                buckets=settings.TRENDS_BUCKETS,
+                width=settings.TRENDS_SKETCH_WIDTH,
+                depth=settings.TRENDS_SKETCH_DEPTH,
+                capacity=settings.TRENDS_HEAVY_HITTERS,
+            )
+        return _engine
+
+    @classmethod
+    def reset_engine(cls):
+        global _engine, _last_snapshot_at
+        _engine = None
+        _last_snapshot_at = 0
+
+    @classmethod
+    def extract_terms(cls, content):
+        # 同一条 tweet 里的词只算一次
+        hashtags = ['#{}'.format(name) for name in TweetService.extract_hashtags(content)]
+        words = [
+            term for term in tokenize(content, for_query=True)
+            if len(term) > 1 and term not in STOP_WORDS
+        ]
+        return hashtags + words
+
+    @classmethod
+    def record_tweet(cls, tweet):
+        # 只传词和时间，worker 不需要再读数据库
+        terms = cls.extract_terms(tweet.content)
+        if terms:
+            record_tweet_terms_task.delay(terms, tweet.created_at.timestamp())
+
+    @classmethod
+    def record_terms(cls, terms, timestamp, now=None):
+        global _last_snapshot_at
+        now = time.time() if now is None else now
+        cls.get_engine().add(terms, timestamp)
+        if now - _last_snapshot_at >= settings.TRENDS_SNAPSHOT_INTERVAL:
+            cls.snapshot(now)
+
+    @classmethod
+    def snapshot(cls, now=None):
+        global _last_snapshot_at
+        now = time.time() if now is None else now
+        _last_snapshot_at = now
+        trends = [
+            {'term': term, 'count': count}
+            for term, count in cls.get_engine().top(settings.TRENDS_TOP_K, now)
+        ]
+        # worker 挂了以后过一个窗口旧的结果自然消失
+        cache.set(TRENDS_CACHE_KEY, {
+            'trends': trends,
+            'updated_at': now,
+        }, timeout=settings.TRENDS_WINDOW)
+        return trends
+
+    @classmethod
+    def get_trends(cls):
+        return cache.get(TRENDS_CACHE_KEY) or {'trends': [], 'updated_at': None}
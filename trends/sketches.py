@@ -0,0 +1,134 @@
+import hashlib
+import heapq
+from array import array
+
+
+class CountMinSketch(object):
+    """
+    depth 行 width 列的计数器，每个 key 在每一行里映射到一列
+    估计值是这几列里最小的那个，只会多估不会少估
+    误差不超过 总数 * e / width 的概率是 1 - e^-depth，占用的内存和 key 的数量无关
+    """
+
+    def __init__(self, width, depth):
+        self.width = width
+        self.depth = depth
+        self.table = array('q', bytes(8 * width * depth))
+
+    def get_indexes(self, key):
+        # 一次 hash 得到两个 64 位整数，用 double hashing 生成 depth 个位置
+        # 同样大小的 sketch 里同一个 key 的位置都一样，可以只算一次
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [
+            row * self.width + (h1 + row * h2) % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, indexes, count=1):
+        table = self.table
+        for index in indexes:
+            table[index] += count
+
+    def estimate(self, indexes):
+        table = self.table
+        return min(table[index] for index in indexes)
+
+    def clear(self):
+        self.table = array('q', bytes(8 * self.width * self.depth))
+
+
+class SpaceSaving(object):
+    """
+    最多记录 capacity 个 key 的 heavy hitters
+    满了以后新的 key 替换掉计数最小的 key，并继承它的计数，所以出现次数超过
+    总数 / capacity 的 key 一定会被留下来
+    heap 里的计数只在 key 被替换的时候更新，弹出来的时候发现过时了再放回去
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+        self._heap = []
+
+    def add(self, key, count=1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+            return
+        if len(counts) < self.capacity:
+            counts[key] = count
+            heapq.heappush(self._heap, (count, key))
+            return
+        while True:
+            stale_count, victim = heapq.heappop(self._heap)
+            current = counts[victim]
+            if current == stale_count:
+                break
+            heapq.heappush(self._heap, (current, victim))
+        del counts[victim]
+        counts[key] = current + count
+        heapq.heappush(self._heap, (current + count, key))
+
+    def clear(self):
+        self.counts = {}
+        self._heap = []
+
+
+class SlidingWindowTopK(object):
+    """
+    把 window 秒分成 buckets 个时间片，每个时间片有自己的 CountMinSketch 和 SpaceSaving，
+    过期的时间片被清空以后循环使用，总内存固定
+    - 候选集合是所有还在窗口里的时间片的 heavy hitters
+    - 每个候选的计数是各个时间片 sketch 估计值的和
+    """
+
+    def __init__(self, window, buckets, width, depth, capacity):
+        self.bucket_seconds = window / buckets
+        self.sketches = [CountMinSketch(width, depth) for _ in range(buckets)]
+        self.heavy_hitters = [SpaceSaving(capacity) for _ in range(buckets)]
+        # 每个位置当前存的是第几个时间片，-1 表示还没有用过
+        self.epochs = [-1] * buckets
+
+    def _get_slot(self, epoch):
+        slot = epoch % len(self.epochs)
+        if self.epochs[slot] < epoch:
+            self.sketches[slot].clear()
+            self.heavy_hitters[slot].clear()
+            self.epochs[slot] = epoch
+        return slot
+
+    def _get_live_slots(self, now):
+        epoch = int(now // self.bucket_seconds)
+        return [
+            slot for slot, slot_epoch in enumerate(self.epochs)
+            if epoch - len(self.epochs) < slot_epoch <= epoch
+        ]
+
+    def add(self, keys, timestamp):
+        epoch = int(timestamp // self.bucket_seconds)
+        slot = epoch % len(self.epochs)
+        # 比窗口还早的事件直接丢掉，不能覆盖新的时间片
+        if self.epochs[slot] > epoch:
+            return
+        slot = self._get_slot(epoch)
+        sketch, heavy_hitters = self.sketches[slot], self.heavy_hitters[slot]
+        for key in keys:
+            sketch.add(sketch.get_indexes(key))
+            heavy_hitters.add(key)
+
+    def top(self, k, now):
+        """
+        返回窗口内估计次数最多的 k 个 [(key, count)]，次数相同的按 key 排序
+        """
+        slots = self._get_live_slots(now)
+        candidates = set()
+        for slot in slots:
+            candidates.update(self.heavy_hitters[slot].counts)
+        estimates = []
+        for key in candidates:
+            indexes = self.sketches[0].get_indexes(key)
+            count = sum(self.sketches[slot].estimate(indexes) for slot in slots)
+            estimates.append((key, count))
+        return heapq.nsmallest(k, estimates, key=lambda item: (-item[1], item[0]))
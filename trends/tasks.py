@@ -0,0 +1,15 @@
+from celery import shared_task
+from utils.time_constants import ONE_MINUTE
+
+
+@shared_task(queue='trends', time_limit=ONE_MINUTE)
+def record_tweet_terms_task(terms, timestamp):
+    from trends.services import TrendService
+    TrendService.record_terms(terms, timestamp)
+
+
+@shared_task(queue='trends', time_limit=ONE_MINUTE)
+def snapshot_trends_task():
+    # 没有新 tweet 的时候也要定期刷新，让过期的时间片从结果里消失
+    from trends.services import TrendService
+    return '{} trends'.format(len(TrendService.snapshot()))
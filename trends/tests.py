@@ -0,0 +1,121 @@
+import json
+import random
+from collections import Counter
+from django.core.management import call_command
+from io import StringIO
+from rest_framework.test import APIClient
+from testing.testcases import TestCase
+from trends.services import TrendService
+from trends.sketches import CountMinSketch, SlidingWindowTopK, SpaceSaving
+
+TREND_LIST_API = '/api/trends/'
+TWEET_CREATE_API = '/api/tweets/'
+
+
+class SketchTests(TestCase):
+
+    def test_count_min_sketch(self):
+        sketch = CountMinSketch(width=64, depth=4)
+        rng = random.Random(0)
+        keys = ['key{}'.format(rng.randint(0, 500)) for _ in range(2000)]
+        for key in keys:
+            sketch.add(sketch.get_indexes(key))
+        exact = Counter(keys)
+        # 只会多估不会少估
+        for key, count in exact.items():
+            self.assertGreaterEqual(sketch.estimate(sketch.get_indexes(key)), count)
+        sketch.clear()
+        self.assertEqual(sketch.estimate(sketch.get_indexes('key1')), 0)
+
+    def test_space_saving(self):
+        heavy_hitters = SpaceSaving(capacity=3)
+        stream = ['a'] * 10 + ['b'] * 6 + list('cdefghij') + ['a', 'b']
+        for key in stream:
+            heavy_hitters.add(key)
+        self.assertEqual(len(heavy_hitters.counts), 3)
+        # 出现次数超过 总数 / capacity 的 key 一定还在
+        self.assertEqual(heavy_hitters.counts['a'], 11)
+        self.assertIn('b', heavy_hitters.counts)
+        # 替换进来的 key 继承了被替换的计数，只会多估
+        self.assertGreaterEqual(heavy_hitters.counts['b'], 7)
+
+    def test_sliding_window(self):
+        engine = SlidingWindowTopK(window=60, buckets=6, width=256, depth=4, capacity=10)
+        engine.add(['old'] * 5, 0)
+        engine.add(['#django', 'python'], 30)
+        engine.add(['#django'], 55)
+        self.assertEqual(
+            engine.top(2, 55),
+            [('old', 5), ('#django', 2)],
+        )
+        # 第一个时间片滑出了窗口
+        self.assertEqual(engine.top(3, 65), [('#django', 2), ('python', 1)])
+        # 新的时间片复用了过期的位置
+        engine.add(['new'], 62)
+        self.assertEqual(engine.top(1, 70), [('#django', 2)])
+        self.assertEqual(engine.top(5, 70)[-1], ('python', 1))
+        # 比窗口还早的事件被丢掉
+        engine.add(['late'], 1)
+        self.assertNotIn('late', dict(engine.top(10, 70)))
+        self.assertEqual(engine.top(10, 200), [])
+
+
+class TrendServiceTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        TrendService.reset_engine()
+        self.user = self.create_user('linghu')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        TrendService.reset_engine()
+
+    def test_extract_terms(self):
+        self.assertEqual(
+            TrendService.extract_terms('The #Django tips, the django TIPS 九章算法 a'),
+            ['#django', 'django', 'tips', '九章', '章算', '算法'],
+        )
+
+    def test_trends_api(self):
+        response = self.anonymous_client.get(TREND_LIST_API)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'trends': [], 'updated_at': None})
+
+        for content in ['#django is great', 'learning #Django', 'python and django']:
+            self.client.post(TWEET_CREATE_API, {'content': content})
+        # 第一条 tweet 处理完就写了一次 cache，还没到下一次 snapshot 的时间
+        response = self.anonymous_client.get(TREND_LIST_API)
+        self.assertEqual(response.data['trends'], [
+            {'term': '#django', 'count': 1},
+            {'term': 'django', 'count': 1},
+            {'term': 'great', 'count': 1},
+        ])
+
+        TrendService.snapshot()
+        response = self.anonymous_client.get(TREND_LIST_API)
+        self.assertEqual(response.data['trends'][:2], [
+            {'term': 'django', 'count': 3},
+            {'term': '#django', 'count': 2},
+        ])
+        self.assertIsNotNone(response.data['updated_at'])
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            'benchmark_trends',
+            '--tweets', '200', '400',
+            '--vocabulary', '50',
+            '--samples', '2',
+            stdout=out,
+            stderr=StringIO(),
+        )
+        report = json.loads(out.getvalue())
+        self.assertEqual([run['size'] for run in report['runs']], [200, 400])
+        run = report['runs'][1]
+        self.assertEqual(run['throughput']['tweets'], 400)
+        self.assertGreater(run['throughput']['tweets_per_second'], 0)
+        self.assertGreater(run['accuracy']['recall'], 0.5)
+        self.assertGreaterEqual(run['accuracy']['max_relative_error'], 0)
+        self.assertEqual(run['accuracy']['snapshot_seconds']['count'], 2)
@@ -18,8 +18,9 @@ class TweetPhotoAdmin(admin.ModelAdmin):
         'user',
         'file',
         'status',
+        'upload_status',
         'has_deleted',
         'created_at',
     )
-    list_filter = ('status', 'has_deleted')
+    list_filter = ('status', 'upload_status', 'has_deleted')
     date_hierarchy = 'created_at'
\ No newline at end of file
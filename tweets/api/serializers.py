@@ -1,25 +1,38 @@
+from django.db import transaction
 from rest_framework import serializers
 from accounts.api.serializers import UserSerializerForTweet
+from accounts.services import UserService
+from comments.hydrators import CommentHydrator
 from comments.api.serializers import CommentSerializer
 from likes.api.serializers import LikeSerializer
 from rest_framework.exceptions import ValidationError
-from tweets.constants import TWEET_PHOTOS_UPLOAD_LIMIT
+from tweets.constants import (
+    TWEET_DETAIL_COMMENTS_PREVIEW_LIMIT,
+    TWEET_DETAIL_LIKES_PREVIEW_LIMIT,
+    TWEET_PHOTOS_UPLOAD_LIMIT,
+    TweetPhotoUploadStatus,
+)
 from likes.services import LikeService
 from tweets.models import Tweet
 from tweets.services import TweetService
+from utils.images import ImageVariantHelper
 
 
 class TweetSerializer(serializers.ModelSerializer):
     user = UserSerializerForTweet()
+    # snowflake id 超过了 javascript 能精确表示的整数范围，前端需要用字符串形式的 id
+    id_str = serializers.SerializerMethodField()
     comments_count = serializers.SerializerMethodField()
     likes_count = serializers.SerializerMethodField()
     has_liked = serializers.SerializerMethodField()
     photo_urls = serializers.SerializerMethodField()
+    photos = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
         fields = (
             'id',
+            'id_str',
             'user',
             'created_at',
             'content',
@@ -27,32 +40,64 @@ class TweetSerializer(serializers.ModelSerializer):
             'likes_count',
             'has_liked',
             'photo_urls',
+            'photos',
         )
 
+    def get_id_str(self, obj):
+        return str(obj.id)
+
     def get_likes_count(self, obj):
-        return obj.like_set.count()
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.get_likes_count(obj.id)
+        return obj.likes_count
 
     def get_comments_count(self, obj):
-        return obj.comment_set.count()
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.get_comments_count(obj.id)
+        return obj.comments_count
 
     def get_has_liked(self, obj):
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.has_liked(obj.id)
         return LikeService.has_liked(self.context['request'].user, obj)
 
+    def _get_uploaded_photos(self, obj):
+        return obj.tweetphoto_set.filter(
+            upload_status=TweetPhotoUploadStatus.UPLOADED,
+        ).order_by('order')
+
     def get_photo_urls(self, obj):
-        photo_urls = []
-        for photo in obj.tweetphoto_set.all().order_by('order'):
-            photo_urls.append(photo.file.url)
-        return photo_urls
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.get_photo_urls(obj.id)
+        return [photo.file.url for photo in self._get_uploaded_photos(obj)]
+
+    def get_photos(self, obj):
+        # 每张照片不同尺寸的地址 {'original', 'thumb', 'medium', 'large'}
+        hydrator = self.context.get('hydrator')
+        if hydrator is not None:
+            return hydrator.get_photos(obj.id)
+        return [
+            ImageVariantHelper.get_urls(photo.file, photo.variant_files)
+            for photo in self._get_uploaded_photos(obj)
+        ]
 
 
 class TweetSerializerForDetail(TweetSerializer):
-    comments = CommentSerializer(source='comment_set', many=True)
-    likes = LikeSerializer(source='like_set', many=True)
+    """
+    详情页只带最新的几条评论和点赞，总数看 comments_count 和 likes_count
+    """
+    comments = serializers.SerializerMethodField()
+    likes = serializers.SerializerMethodField()
 
     class Meta:
         model = Tweet
         fields = (
             'id',
+            'id_str',
             'user',
             'comments',
             'created_at',
@@ -62,8 +107,35 @@ class TweetSerializerForDetail(TweetSerializer):
             'comments_count',
             'has_liked',
             'photo_urls',
+            'photos',
         )
 
+    def get_comments(self, obj):
+        comments = obj.comment_set.order_by(
+            '-created_at',
+        )[:TWEET_DETAIL_COMMENTS_PREVIEW_LIMIT]
+        return serialize_comments(comments, self.context['request'])
+
+    def get_likes(self, obj):
+        likes = obj.like_set.select_related('user')[:TWEET_DETAIL_LIKES_PREVIEW_LIMIT]
+        return serialize_likes(likes, self.context['request'])
+
+
+def serialize_comments(comments, request):
+    # 不能直接用 tweet 的 context，里面的 hydrator 是给 tweet 用的
+    hydrator = CommentHydrator(comments, request.user)
+    return CommentSerializer(
+        hydrator.comments,
+        context={'request': request, 'hydrator': hydrator},
+        many=True,
+    ).data
+
+
+def serialize_likes(likes, request):
+    likes = list(likes)
+    UserService.attach_profiles([like.user for like in likes])
+    return LikeSerializer(likes, context={'request': request}, many=True).data
+
 
 class TweetSerializerForCreate(serializers.ModelSerializer):
     content = serializers.CharField(min_length=6, max_length=140)
@@ -89,11 +161,12 @@ class TweetSerializerForCreate(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         content = validated_data['content']
-        tweet = Tweet.objects.create(user=user, content=content)
-        if validated_data.get('files'):
-            TweetService.create_photos_from_files(
-                tweet,
-                validated_data['files'],
-            )
+        with transaction.atomic():
+            tweet = Tweet.objects.create(user=user, content=content)
+            if validated_data.get('files'):
+                TweetService.create_photos_from_files(
+                    tweet,
+                    validated_data['files'],
+                )
 
         return tweet
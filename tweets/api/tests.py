@@ -1,17 +1,33 @@
+from comments.models import Comment
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from testing.testcases import TestCase
 from tweets.models import Tweet
 from django.core.files.uploadedfile import SimpleUploadedFile
+from likes.models import Like
+from tweets.constants import (
+    TWEET_BATCH_MAX_SIZE,
+    TWEET_DETAIL_COMMENTS_PREVIEW_LIMIT,
+    TWEET_DETAIL_LIKES_PREVIEW_LIMIT,
+)
 from tweets.models import Tweet, TweetPhoto
+from utils.paginations import EndlessPagination
 
 TWEET_LIST_API = '/api/tweets/'
 TWEET_CREATE_API = '/api/tweets/'
 TWEET_RETRIEVE_API = '/api/tweets/{}/'
+TWEET_COMMENTS_API = '/api/tweets/{}/comments/'
+TWEET_LIKES_API = '/api/tweets/{}/likes/'
+TWEET_BATCH_API = '/api/tweets/batch/'
+TWEET_SEARCH_API = '/api/tweets/search/'
+TWEET_MENTIONS_API = '/api/tweets/mentions/'
+TAG_TWEETS_API = '/api/tags/{}/tweets/'
 
 class TweetApiTests(TestCase):
 
     def setUp(self):
-
+        self.clear_cache()
         # create user
         self.user1 = self.create_user('user1', 'user1@jiuzhang.com')
         self.tweets1 = [
@@ -35,12 +51,75 @@ class TweetApiTests(TestCase):
         # legal request with user API
         response = self.anonymous_client.get(TWEET_LIST_API, {'user_id': self.user1.id})
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data['tweets']), 3)
+        self.assertEqual(len(response.data['results']), 3)
         response = self.anonymous_client.get(TWEET_LIST_API, {'user_id': self.user2.id})
-        self.assertEqual(len(response.data['tweets']), 2)
+        self.assertEqual(len(response.data['results']), 2)
+
+        self.assertEqual(response.data['results'][0]['id'], self.tweets2[1].id)
+        self.assertEqual(response.data['results'][1]['id'], self.tweets2[0].id)
+
+    def test_pagination(self):
+        page_size = EndlessPagination.page_size
+        # 加上 setUp 里创建的 3 条一共 2 页
+        for i in range(page_size * 2 - len(self.tweets1)):
+            self.tweets1.append(self.create_tweet(self.user1, 'tweet{}'.format(i)))
+        tweets = self.tweets1[::-1]
+
+        response = self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id})
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(len(response.data['results']), page_size)
+        self.assertEqual(response.data['results'][0]['id'], tweets[0].id)
+        self.assertEqual(response.data['results'][page_size - 1]['id'], tweets[page_size - 1].id)
+
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'created_at__lt': tweets[page_size - 1].created_at,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet.id for tweet in tweets[page_size:]],
+        )
+
+        # 下拉刷新
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'created_at__gt': tweets[0].created_at,
+        })
+        self.assertEqual(len(response.data['results']), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_tweet = self.create_tweet(self.user1)
+        response = self.user1_client.get(TWEET_LIST_API, {
+            'user_id': self.user1.id,
+            'created_at__gt': tweets[0].created_at,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual(response.data['results'][0]['id'], new_tweet.id)
+
+        # 客户端可以指定更小的页面
+        response = self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id, 'size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertEqual(response.data['has_next_page'], True)
 
-        self.assertEqual(response.data['tweets'][0]['id'], self.tweets2[1].id)
-        self.assertEqual(response.data['tweets'][1]['id'], self.tweets2[0].id)
+    def test_list_api_reads_from_cache(self):
+        self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user1_client.post(TWEET_CREATE_API, {'content': 'Hello Gongzi!'})
+        # 新的 tweet id 已经插到了 timeline cache 里，只有这一条 tweet 需要查数据库
+        with CaptureQueriesContext(connection) as queries:
+            self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id})
+        tweet_queries = [query for query in queries if '"tweets_tweet"' in query['sql']]
+        self.assertEqual(len(tweet_queries), 1)
+        # tweet id 和 tweet 都在 cache 里，只需要查 user / profile / 点赞 / 照片
+        with CaptureQueriesContext(connection) as queries:
+            response = self.user1_client.get(TWEET_LIST_API, {'user_id': self.user1.id})
+        self.assertEqual(response.data['results'][0]['content'], 'Hello Gongzi!')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertFalse(any('"tweets_tweet"' in query['sql'] for query in queries))
+
+        # 不合法的 user_id
+        response = self.anonymous_client.get(TWEET_LIST_API, {'user_id': 'abc'})
+        self.assertEqual(response.status_code, 400)
 
     def test_create_api(self):
         # must login
@@ -105,16 +184,23 @@ class TweetApiTests(TestCase):
             content=str.encode('selfie 2'),
             content_type='image/jpeg',
         )
-        response = self.user1_client.post(TWEET_CREATE_API, {
-            'content': 'two selfies',
-            'files': [file1, file2],
-        })
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.user1_client.post(TWEET_CREATE_API, {
+                'content': 'two selfies',
+                'files': [file1, file2],
+            })
         self.assertEqual(response.status_code, 201)
         self.assertEqual(TweetPhoto.objects.count(), 3)
 
-        # 从读取的 API 里确保已经包含了 photo 的地址
+        # 上传完成之前照片不会出现在 tweet 里
         retrieve_url = TWEET_RETRIEVE_API.format(response.data['id'])
         response = self.user1_client.get(retrieve_url)
+        self.assertEqual(response.data['photo_urls'], [])
+        for callback in callbacks:
+            callback()
+
+        # 从读取的 API 里确保已经包含了 photo 的地址
+        response = self.user1_client.get(retrieve_url)
         self.assertEqual(len(response.data['photo_urls']), 2)
         self.assertEqual('selfie1' in response.data['photo_urls'][0], True)
         self.assertEqual('selfie2' in response.data['photo_urls'][1], True)
@@ -155,4 +241,236 @@ class TweetApiTests(TestCase):
 
         profile = self.user1.profile
         self.assertEqual(response.data['user']['nickname'], profile.nickname)
-        self.assertEqual(response.data['user']['avatar_url'], None)
\ No newline at end of file
+        self.assertEqual(response.data['user']['avatar_url'], None)
+
+    def test_retrieve_previews(self):
+        tweet = self.create_tweet(self.user1)
+        comments = [
+            self.create_comment(self.user2, tweet, 'comment {}'.format(i))
+            for i in range(TWEET_DETAIL_COMMENTS_PREVIEW_LIMIT + 2)
+        ]
+        users = [self.create_user('liker{}'.format(i)) for i in range(TWEET_DETAIL_LIKES_PREVIEW_LIMIT + 2)]
+        for user in users:
+            self.create_like(user, tweet)
+        self.create_like(self.user1, comments[-1])
+
+        response = self.user1_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        self.assertEqual(response.status_code, 200)
+        # 只带最新的几条，总数是完整的
+        self.assertEqual(
+            [comment['id'] for comment in response.data['comments']],
+            [comment.id for comment in comments[::-1][:TWEET_DETAIL_COMMENTS_PREVIEW_LIMIT]],
+        )
+        self.assertEqual(response.data['comments_count'], len(comments))
+        self.assertEqual(response.data['comments'][0]['has_liked'], True)
+        self.assertEqual(response.data['comments'][1]['has_liked'], False)
+        self.assertEqual(
+            [like['user']['id'] for like in response.data['likes']],
+            [user.id for user in users[::-1][:TWEET_DETAIL_LIKES_PREVIEW_LIMIT]],
+        )
+        self.assertEqual(response.data['likes_count'], len(users))
+
+        # 评论和点赞再多，query 的数量也不会变
+        with CaptureQueriesContext(connection) as before:
+            self.user1_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        for i in range(5):
+            self.create_comment(self.create_user('commenter{}'.format(i)), tweet)
+            self.create_like(self.create_user('another_liker{}'.format(i)), tweet)
+        # 计数变了 tweet cache 会失效，新用户的 profile 也是第一次访问时创建，先预热一次
+        self.user1_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        with CaptureQueriesContext(connection) as after:
+            self.user1_client.get(TWEET_RETRIEVE_API.format(tweet.id))
+        self.assertEqual(len(before), len(after))
+
+    def test_comments_and_likes_pagination(self):
+        tweet = self.create_tweet(self.user1)
+        comments = [self.create_comment(self.user2, tweet) for _ in range(3)]
+        self.create_comment(self.user2, self.create_tweet(self.user2))
+        users = [self.create_user('liker{}'.format(i)) for i in range(3)]
+        for user in users:
+            self.create_like(user, tweet)
+
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {'size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comments[2].id, comments[1].id],
+        )
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {
+            'size': 2,
+            'created_at__lt': comments[1].created_at,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual([comment['id'] for comment in response.data['results']], [comments[0].id])
+
+        response = self.anonymous_client.get(TWEET_LIKES_API.format(tweet.id), {'size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [like['user']['id'] for like in response.data['results']],
+            [users[2].id, users[1].id],
+        )
+        cursor = Like.objects.get(user=users[1]).created_at
+        response = self.anonymous_client.get(TWEET_LIKES_API.format(tweet.id), {
+            'created_at__lt': cursor,
+        })
+        self.assertEqual([like['user']['id'] for like in response.data['results']], [users[0].id])
+
+        # created_at 相同的时候带上 id cursor，翻页不会跳过数据
+        Comment.objects.filter(tweet=tweet).update(created_at=comments[0].created_at)
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {'size': 2})
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comments[2].id, comments[1].id],
+        )
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {
+            'size': 2,
+            'created_at__lt': comments[0].created_at,
+            'id__lt': comments[1].id,
+        })
+        self.assertEqual([comment['id'] for comment in response.data['results']], [comments[0].id])
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {
+            'created_at__gt': comments[0].created_at,
+            'id__gt': comments[0].id,
+        })
+        self.assertEqual(
+            [comment['id'] for comment in response.data['results']],
+            [comments[2].id, comments[1].id],
+        )
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {
+            'created_at__lt': comments[0].created_at,
+            'id__lt': 'abc',
+        })
+        self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(tweet.id), {
+            'created_at__lt': comments[0].created_at,
+            'id__lt': 2 ** 63,
+        })
+        self.assertEqual(response.status_code, 400)
+
+        response = self.anonymous_client.get(TWEET_COMMENTS_API.format(0))
+        self.assertEqual(response.status_code, 404)
+        response = self.anonymous_client.get(TWEET_LIKES_API.format(0))
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch(self):
+        tweet_ids = [
+            self.tweets2[0].id,
+            self.tweets1[2].id,
+            0,
+            self.tweets1[0].id,
+            self.tweets2[0].id,
+        ]
+        self.create_like(self.user1, self.tweets2[0])
+        response = self.user1_client.get(TWEET_BATCH_API, {
+            'ids': ','.join(str(tweet_id) for tweet_id in tweet_ids),
+        })
+        self.assertEqual(response.status_code, 200)
+        # 保持请求的顺序，不存在和重复的 id 被跳过
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['tweets']],
+            [self.tweets2[0].id, self.tweets1[2].id, self.tweets1[0].id],
+        )
+        self.assertEqual(response.data['tweets'][0]['has_liked'], True)
+        self.assertEqual(response.data['tweets'][0]['id_str'], str(self.tweets2[0].id))
+        self.assertEqual(response.data['tweets'][1]['has_liked'], False)
+
+        # 不合法的参数
+        response = self.anonymous_client.get(TWEET_BATCH_API)
+        self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(TWEET_BATCH_API, {'ids': '1,abc'})
+        self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(TWEET_BATCH_API, {'ids': '1,{}'.format(2 ** 63)})
+        self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(TWEET_BATCH_API, {
+            'ids': ','.join(str(i) for i in range(1, TWEET_BATCH_MAX_SIZE + 2)),
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_queries(self):
+        users = [self.create_user('batch{}'.format(i)) for i in range(10)]
+        tweets = [self.create_tweet(user) for user in users for _ in range(3)]
+        small_ids = ','.join(str(tweet.id) for tweet in tweets[:2])
+        large_ids = ','.join(str(tweet.id) for tweet in tweets)
+        # 预热 tweet cache 和 profile
+        self.user1_client.get(TWEET_BATCH_API, {'ids': large_ids})
+
+        with CaptureQueriesContext(connection) as small:
+            self.user1_client.get(TWEET_BATCH_API, {'ids': small_ids})
+        with CaptureQueriesContext(connection) as large:
+            response = self.user1_client.get(TWEET_BATCH_API, {'ids': large_ids})
+        self.assertEqual(len(response.data['tweets']), len(tweets))
+        self.assertEqual(len(small), len(large))
+        self.assertFalse(any('"tweets_tweet"' in query['sql'] for query in large))
+
+    def test_search(self):
+        tweets = [
+            self.create_tweet(self.user2, content='django tips {}'.format(i))
+            for i in range(3)
+        ]
+        self.create_tweet(self.user1, content='flask tips')
+        self.create_like(self.user1, tweets[2])
+
+        response = self.user1_client.get(TWEET_SEARCH_API, {'q': 'Django tips', 'size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweets[2].id, tweets[1].id],
+        )
+        self.assertEqual(response.data['results'][0]['has_liked'], True)
+
+        # 用上一页最后一个 tweet 的 id 向下翻页
+        response = self.anonymous_client.get(TWEET_SEARCH_API, {
+            'q': 'Django tips',
+            'size': 2,
+            'id__lt': tweets[1].id,
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual([tweet['id'] for tweet in response.data['results']], [tweets[0].id])
+
+        response = self.anonymous_client.get(TWEET_SEARCH_API, {'q': 'rails'})
+        self.assertEqual(response.data['results'], [])
+
+        # 不合法的参数
+        response = self.anonymous_client.get(TWEET_SEARCH_API)
+        self.assertEqual(response.status_code, 400)
+        response = self.anonymous_client.get(TWEET_SEARCH_API, {'q': 'django', 'id__lt': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_tag_and_mentions_timeline(self):
+        tweet_ids = []
+        for i in range(3):
+            response = self.user1_client.post(TWEET_CREATE_API, {
+                'content': 'Day {} of #Django with @User2'.format(i),
+            })
+            tweet_ids.append(response.data['id'])
+        self.user1_client.post(TWEET_CREATE_API, {'content': '#flask only'})
+
+        response = self.anonymous_client.get(TAG_TWEETS_API.format('DJANGO'), {'size': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['has_next_page'], True)
+        self.assertEqual(
+            [tweet['id'] for tweet in response.data['results']],
+            [tweet_ids[2], tweet_ids[1]],
+        )
+        response = self.anonymous_client.get(TAG_TWEETS_API.format('django'), {
+            'size': 2,
+            'created_at__lt': response.data['results'][1]['created_at'],
+        })
+        self.assertEqual(response.data['has_next_page'], False)
+        self.assertEqual([tweet['id'] for tweet in response.data['results']], [tweet_ids[0]])
+        response = self.anonymous_client.get(TAG_TWEETS_API.format('rails'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [])
+
+        # 只有被 @ 的人能看到自己的 mentions
+        response = self.anonymous_client.get(TWEET_MENTIONS_API)
+        self.assertEqual(response.status_code, 403)
+        response = self.user1_client.get(TWEET_MENTIONS_API)
+        self.assertEqual(response.data['results'], [])
+        user2_client = APIClient()
+        user2_client.force_authenticate(self.user2)
+        response = user2_client.get(TWEET_MENTIONS_API)
+        self.assertEqual([tweet['id'] for tweet in response.data['results']], tweet_ids[::-1])
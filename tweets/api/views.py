@@ -1,10 +1,45 @@
-from django.shortcuts import render
+from comments.models import Comment
+from django.db.models import BigIntegerField
+from django.http import Http404
+from rest_framework.decorators import action
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated,AllowAny
 from rest_framework.response import Response
-from tweets.api.serializers import TweetSerializer, TweetSerializerForCreate, TweetSerializerForDetail
-from tweets.models import Tweet
+from search.services import SearchService
+from trends.services import TrendService
+from tweets.api.serializers import (
+    TweetSerializer,
+    TweetSerializerForCreate,
+    TweetSerializerForDetail,
+    serialize_comments,
+    serialize_likes,
+)
+from tweets.constants import TWEET_BATCH_MAX_SIZE
+from tweets.hydrators import TweetHydrator
+from tweets.models import Hashtag, Tweet, TweetHashtag, TweetMention
+from tweets.services import TweetService
 from newsfeeds.services import NewsFeedService
+from utils.paginations import EndlessPagination
+
+
+def paginate_tweet_index(view, index_queryset):
+    """
+    index_queryset 是 TweetHashtag / TweetMention 这种 (key, created_at, tweet) 的索引表，
+    在索引上翻一页拿到 tweet_id，再批量取出 tweets
+    """
+    rows = view.paginator.paginate_queryset(
+        index_queryset.only('tweet_id', 'created_at'),
+        view.request,
+        view=view,
+        id_field='tweet_id',
+    )
+    hydrator = TweetHydrator.from_ids([row.tweet_id for row in rows], view.request.user)
+    serializer = TweetSerializer(
+        hydrator.tweets,
+        context={'request': view.request, 'hydrator': hydrator},
+        many=True,
+    )
+    return view.get_paginated_response(serializer.data)
 
 
 class TweetViewSet(viewsets.GenericViewSet,
@@ -13,9 +48,11 @@ class TweetViewSet(viewsets.GenericViewSet,
 
     queryset = Tweet.objects.all()
     serializer_class = TweetSerializerForCreate
+    lookup_value_regex = '[0-9]+'
+    pagination_class = EndlessPagination
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'comments', 'likes', 'batch', 'search']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
@@ -32,26 +69,158 @@ class TweetViewSet(viewsets.GenericViewSet,
             }, status=400)
         tweet = serializer.save()
         NewsFeedService.fanout_to_followers(tweet)
+        TrendService.record_tweet(tweet)
         serializer = TweetSerializer(tweet, context={'request': request})
         return Response(serializer.data, status=201)
 
     def list(self, request, *arg, **kwargs):
         if 'user_id' not in request.query_params:
             return Response('missing user_id', status=400)
+        try:
+            user_id = int(request.query_params['user_id'])
+        except ValueError:
+            return Response('invalid user_id', status=400)
 
-        tweets = Tweet.objects.filter(
-            user_id=request.query_params['user_id']
-        ).order_by('-created_at')
+        # 最新的一段 tweet id 从 redis 里读，翻出 cache 的范围以后才走 (user, created_at) 索引
+        created_at__gt, created_at__lt = self.paginator.get_cursors(request)
+        items = TweetService.get_user_tweet_items(
+            user_id,
+            limit=self.paginator.get_page_size(request) + 1,
+            created_at__gt=created_at__gt,
+            created_at__lt=created_at__lt,
+        )
+        hydrator = TweetHydrator.from_ids([tweet_id for tweet_id, _ in items], request.user)
+        tweets = self.paginator.paginate_ordered_list(hydrator.tweets, request)
         serializer = TweetSerializer(
             tweets,
-            context={'request': request},
+            context={'request': request, 'hydrator': hydrator},
             many=True
         )
-        return Response({'tweets': serializer.data})
+        return self.get_paginated_response(serializer.data)
 
     def retrieve(self, request, *arg, **kwargs):
+        hydrator = TweetHydrator([self.get_tweet_or_404()], request.user)
         serializer = TweetSerializerForDetail(
-            self.get_object(),
-            context={'request': request},
+            hydrator.tweets[0],
+            context={'request': request, 'hydrator': hydrator},
         )
         return Response(serializer.data)
+
+    def get_tweet_or_404(self):
+        tweet = TweetService.get(int(self.kwargs['pk']))
+        if tweet is None:
+            raise Http404
+        return tweet
+
+    @action(methods=['GET'], detail=True)
+    def comments(self, request, *args, **kwargs):
+        # 走 (tweet, created_at) 索引，从新到旧翻页
+        tweet = self.get_tweet_or_404()
+        comments = self.paginate_queryset(Comment.objects.filter(tweet_id=tweet.id))
+        return self.get_paginated_response(serialize_comments(comments, request))
+
+    @action(methods=['GET'], detail=True)
+    def likes(self, request, *args, **kwargs):
+        # 走 (content_type, object_id, created_at) 索引，从新到旧翻页
+        tweet = self.get_tweet_or_404()
+        # 一个用户只能点赞一次，结果里的 user id 可以作为 id cursor
+        likes = self.paginator.paginate_queryset(
+            tweet.like_set.select_related('user'),
+            request,
+            view=self,
+            id_field='user_id',
+        )
+        return self.get_paginated_response(serialize_likes(likes, request))
+
+    @action(methods=['GET'], detail=False)
+    def mentions(self, request, *args, **kwargs):
+        # 当前用户被 @ 的 tweets，从新到旧
+        return paginate_tweet_index(
+            self,
+            TweetMention.objects.filter(mentioned_user=request.user),
+        )
+
+    @action(methods=['GET'], detail=False)
+    def batch(self, request, *args, **kwargs):
+        """
+        GET /api/tweets/batch/?ids=3,1,2
+        按照 ids 的顺序返回 tweets，不存在的 id 直接跳过
+        tweet 从 cache 里 get_many，其他数据由 hydrator 批量加载，query 数量和 ids 的个数无关
+        """
+        try:
+            tweet_ids = [
+                int(tweet_id)
+                for tweet_id in request.query_params.get('ids', '').split(',')
+                if tweet_id.strip()
+            ]
+        except ValueError:
+            return Response('invalid ids', status=400)
+        # 超出 BIGINT 范围的 id 查数据库的时候会溢出
+        if any(abs(tweet_id) > BigIntegerField.MAX_BIGINT for tweet_id in tweet_ids):
+            return Response('invalid ids', status=400)
+        if not tweet_ids:
+            return Response('missing ids', status=400)
+        # 重复的 id 只返回第一次出现的位置
+        tweet_ids = list(dict.fromkeys(tweet_ids))
+        if len(tweet_ids) > TWEET_BATCH_MAX_SIZE:
+            return Response(
+                'at most {} ids are allowed'.format(TWEET_BATCH_MAX_SIZE),
+                status=400,
+            )
+
+        hydrator = TweetHydrator.from_ids(tweet_ids, request.user)
+        serializer = TweetSerializer(
+            hydrator.tweets,
+            context={'request': request, 'hydrator': hydrator},
+            many=True,
+        )
+        return Response({'tweets': serializer.data})
+
+    @action(methods=['GET'], detail=False)
+    def search(self, request, *args, **kwargs):
+        """
+        GET /api/tweets/search/?q=<query>&id__lt=<cursor>
+        返回包含所有关键词的 tweets，从新到旧。向下翻页的时候把上一页最后一个 tweet 的 id
+        作为 id__lt 传进来，每一页只从倒排索引里读 size + 1 个 tweet_id
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response('missing q', status=400)
+        id__lt = None
+        if 'id__lt' in request.query_params:
+            try:
+                id__lt = int(request.query_params['id__lt'])
+            except ValueError:
+                return Response('invalid id__lt', status=400)
+
+        page_size = self.paginator.get_page_size(request)
+        tweet_ids = SearchService.search_tweet_ids(query, page_size + 1, id__lt=id__lt)
+        self.paginator.has_next_page = len(tweet_ids) > page_size
+        hydrator = TweetHydrator.from_ids(tweet_ids[:page_size], request.user)
+        serializer = TweetSerializer(
+            hydrator.tweets,
+            context={'request': request, 'hydrator': hydrator},
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
+
+class TagViewSet(viewsets.GenericViewSet):
+    """
+    GET /api/tags/{tag}/tweets/ 包含 #tag 的 tweets，从新到旧
+    """
+    queryset = Hashtag.objects.all()
+    permission_classes = (AllowAny,)
+    pagination_class = EndlessPagination
+    lookup_field = 'name'
+    lookup_value_regex = '[^/]+'
+
+    @action(methods=['GET'], detail=True)
+    def tweets(self, request, *args, **kwargs):
+        hashtag = Hashtag.objects.filter(
+            name=TweetService.normalize_hashtag(self.kwargs['name']),
+        ).first()
+        # 没人用过的 tag 返回空的一页
+        if hashtag is None:
+            return paginate_tweet_index(self, TweetHashtag.objects.none())
+        return paginate_tweet_index(self, TweetHashtag.objects.filter(hashtag=hashtag))
@@ -3,3 +3,18 @@ from django.apps import AppConfig
 
 class TweetsConfig(AppConfig):
     name = 'tweets'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from tweets.listeners import (
+            create_hashtags_and_mentions,
+            invalidate_tweet_cache,
+            invalidate_user_tweets_cache,
+            push_tweet_to_cache,
+        )
+        from tweets.models import Tweet
+        post_save.connect(invalidate_tweet_cache, sender=Tweet)
+        post_save.connect(push_tweet_to_cache, sender=Tweet)
+        post_save.connect(create_hashtags_and_mentions, sender=Tweet)
+        post_delete.connect(invalidate_tweet_cache, sender=Tweet)
+        post_delete.connect(invalidate_user_tweets_cache, sender=Tweet)
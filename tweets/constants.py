@@ -10,4 +10,23 @@ TWEET_PHOTO_STATUS_CHOICES = (
     (TweetPhotoStatus.REJECTED, 'Rejected'),
 )
 
-TWEET_PHOTOS_UPLOAD_LIMIT = 9
\ No newline at end of file
+# 照片先存在本地磁盘上，由后台任务上传到 DEFAULT_FILE_STORAGE 以后才对外可见
+class TweetPhotoUploadStatus:
+    PENDING = 0
+    UPLOADED = 1
+    FAILED = 2
+
+
+TWEET_PHOTO_UPLOAD_STATUS_CHOICES = (
+    (TweetPhotoUploadStatus.PENDING, 'Pending'),
+    (TweetPhotoUploadStatus.UPLOADED, 'Uploaded'),
+    (TweetPhotoUploadStatus.FAILED, 'Failed'),
+)
+
+TWEET_PHOTOS_UPLOAD_LIMIT = 9
+# tweet 详情页里最多带多少条最新的评论和点赞，更多的通过 /api/tweets/{id}/comments/ 和
+# /api/tweets/{id}/likes/ 翻页获取
+TWEET_DETAIL_COMMENTS_PREVIEW_LIMIT = 3
+TWEET_DETAIL_LIKES_PREVIEW_LIMIT = 3
+# /api/tweets/batch/ 一次最多查多少个 tweet
+TWEET_BATCH_MAX_SIZE = 200
@@ -0,0 +1,83 @@
+from accounts.services import UserService
+from collections import defaultdict
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from likes.models import Like
+from tweets.constants import TweetPhotoUploadStatus
+from tweets.models import Tweet, TweetPhoto
+from tweets.services import TweetService
+from utils.images import ImageVariantHelper
+
+
+class TweetHydrator(object):
+    """
+    序列化一页 tweets 需要的 user, profile, has_liked, photo_urls
+    全部用固定数量的 query 批量取出来，而不是每个 tweet 各查一遍
+    likes_count 和 comments_count 直接读 tweet 上的冗余字段
+    通过 serializer 的 context['hydrator'] 传给 TweetSerializer
+    """
+
+    def __init__(self, tweets, viewer):
+        self.tweets = [tweet for tweet in tweets if tweet is not None]
+        self.viewer = viewer
+        tweet_ids = [tweet.id for tweet in self.tweets]
+        self._tweets = {tweet.id: tweet for tweet in self.tweets}
+        self._liked_tweet_ids = set()
+        self._photos = defaultdict(list)
+        if not tweet_ids:
+            return
+
+        self._load_users()
+        self._load_liked_tweet_ids(tweet_ids)
+        self._load_photos(tweet_ids)
+
+    @classmethod
+    def from_ids(cls, tweet_ids, viewer):
+        # 按照 tweet_ids 的顺序返回，不存在的 tweet 会被跳过
+        tweets = TweetService.get_by_ids(tweet_ids)
+        return cls([tweets.get(tweet_id) for tweet_id in tweet_ids], viewer)
+
+    def _load_users(self):
+        users = User.objects.in_bulk({tweet.user_id for tweet in self.tweets})
+        UserService.attach_profiles(users.values())
+        for tweet in self.tweets:
+            # 赋值以后 tweet.user 会被缓存在 tweet 对象上
+            tweet.user = users.get(tweet.user_id)
+
+    def _load_liked_tweet_ids(self, tweet_ids):
+        if self.viewer is None or self.viewer.is_anonymous:
+            return
+        self._liked_tweet_ids = set(Like.objects.filter(
+            content_type=ContentType.objects.get_for_model(Tweet),
+            object_id__in=tweet_ids,
+            user=self.viewer,
+        ).values_list('object_id', flat=True))
+
+    def _load_photos(self, tweet_ids):
+        photos = TweetPhoto.objects.filter(
+            tweet_id__in=tweet_ids,
+            upload_status=TweetPhotoUploadStatus.UPLOADED,
+        ).order_by('tweet_id', 'order')
+        for photo in photos:
+            self._photos[photo.tweet_id].append(photo)
+
+    def get_tweet(self, tweet_id):
+        return self._tweets.get(tweet_id)
+
+    def get_likes_count(self, tweet_id):
+        return self._tweets[tweet_id].likes_count
+
+    def get_comments_count(self, tweet_id):
+        return self._tweets[tweet_id].comments_count
+
+    def has_liked(self, tweet_id):
+        return tweet_id in self._liked_tweet_ids
+
+    def get_photo_urls(self, tweet_id):
+        return [photo.file.url for photo in self._photos.get(tweet_id, [])]
+
+    def get_photos(self, tweet_id):
+        return [
+            ImageVariantHelper.get_urls(photo.file, photo.variant_files)
+            for photo in self._photos.get(tweet_id, [])
+        ]
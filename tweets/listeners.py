@@ -0,0 +1,24 @@
+def invalidate_tweet_cache(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    TweetService.invalidate_tweet_cache(instance.id)
+
+
+def push_tweet_to_cache(sender, instance, created, **kwargs):
+    # 新发的帖子插到作者 timeline cache 的最前面
+    if not created:
+        return
+    from tweets.services import TweetService
+    TweetService.push_tweet_to_cache(instance)
+
+
+def create_hashtags_and_mentions(sender, instance, created, **kwargs):
+    # 不管 tweet 是从哪里创建的，都要出现在 tag 和 mentions 的 timeline 里
+    if not created:
+        return
+    from tweets.services import TweetService
+    TweetService.create_hashtags_and_mentions(instance)
+
+
+def invalidate_user_tweets_cache(sender, instance, **kwargs):
+    from tweets.services import TweetService
+    TweetService.invalidate_user_tweets_cache(instance.user_id)
@@ -0,0 +1,31 @@
+from comments.models import Comment
+from comments.services import CommentService
+from django.core.management.base import BaseCommand
+from likes.services import LikeService
+from tweets.models import Tweet
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute Tweet.likes_count, Tweet.comments_count and Comment.likes_count '
+        'in batches and fix the rows that drifted from the real number of likes / comments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to sleep between two batches.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size, sleep = options['batch_size'], options['sleep']
+        fixed = {
+            'tweet likes_count': LikeService.reconcile_likes_count(Tweet, batch_size, sleep),
+            'tweet comments_count': CommentService.reconcile_comments_count(batch_size, sleep),
+            'comment likes_count': LikeService.reconcile_likes_count(Comment, batch_size, sleep),
+        }
+        for name, count in fixed.items():
+            self.stdout.write(self.style.SUCCESS('{} {} fixed'.format(count, name)))
@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-18 19:44
+
+from django.db import migrations, models
+import tweets.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0004_tweet_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweetphoto',
+            name='staged_file',
+            field=models.FileField(blank=True, null=True, storage=tweets.models.get_staging_storage, upload_to=''),
+        ),
+        # 已经存在的照片都是在 request 里同步上传的
+        migrations.AddField(
+            model_name='tweetphoto',
+            name='upload_status',
+            field=models.IntegerField(choices=[(0, 'Pending'), (1, 'Uploaded'), (2, 'Failed')], default=1),
+        ),
+        migrations.AlterField(
+            model_name='tweetphoto',
+            name='upload_status',
+            field=models.IntegerField(choices=[(0, 'Pending'), (1, 'Uploaded'), (2, 'Failed')], default=0),
+        ),
+    ]
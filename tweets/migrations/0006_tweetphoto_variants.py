@@ -0,0 +1,28 @@
+# Generated by Django 3.1.3 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0005_tweetphoto_upload_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tweetphoto',
+            name='large_file',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='tweetphoto',
+            name='medium_file',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='tweetphoto',
+            name='thumb_file',
+            field=models.FileField(blank=True, null=True, upload_to=''),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.3 on 2026-10-18 20:05
+
+from django.db import migrations, models
+import utils.snowflake
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tweets', '0007_hashtags_and_mentions'),
+    ]
+
+    # 已有的 tweet 保留原来的自增 id，新的 snowflake id 一定比它们大，按 id 排序仍然是按时间排序
+    # 引用 tweet 的外键列（包括各个 newsfeed 分库里的）会跟着一起改成 bigint
+    operations = [
+        migrations.AlterField(
+            model_name='tweet',
+            name='id',
+            field=models.BigIntegerField(default=utils.snowflake.next_id, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
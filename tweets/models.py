@@ -1,16 +1,35 @@
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
 from django.db import models
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from utils.snowflake import next_id
 from utils.time_helpers import utc_now
 from likes.models import Like
-from tweets.constants import TweetPhotoStatus, TWEET_PHOTO_STATUS_CHOICES
+from tweets.constants import (
+    TWEET_PHOTO_STATUS_CHOICES,
+    TWEET_PHOTO_UPLOAD_STATUS_CHOICES,
+    TweetPhotoStatus,
+    TweetPhotoUploadStatus,
+)
+
+
+def get_staging_storage():
+    # 上传的照片先写到 web server 本地的磁盘上，request 不需要等 S3
+    return FileSystemStorage(location=settings.TWEET_PHOTO_STAGING_ROOT)
 
 
 class Tweet(models.Model):
+    # 按时间递增的 snowflake id，不需要数据库生成，以前的自增 id 都比它小，所以按 id 排序仍然是按时间排序
+    id = models.BigIntegerField(primary_key=True, default=next_id, editable=False)
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     content = models.CharField(max_length=255)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # 冗余的计数，点赞 / 评论的时候在同一个事务里用 F() 更新，避免每次都 count
+    likes_count = models.IntegerField(default=0)
+    comments_count = models.IntegerField(default=0)
+
     class Meta:
         index_together = (('user', 'created_at'),)
         ordering = ('user', '-created_at')
@@ -35,8 +54,19 @@ class TweetPhoto(models.Model):
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
 
     file = models.FileField()
+    # 还没有上传到 DEFAULT_FILE_STORAGE 的文件，上传成功以后删除
+    staged_file = models.FileField(storage=get_staging_storage, null=True, blank=True)
+    upload_status = models.IntegerField(
+        default=TweetPhotoUploadStatus.PENDING,
+        choices=TWEET_PHOTO_UPLOAD_STATUS_CHOICES,
+    )
     order = models.IntegerField(default=0)
 
+    # 后台生成的缩略图，没有生成之前为空
+    thumb_file = models.FileField(null=True, blank=True)
+    medium_file = models.FileField(null=True, blank=True)
+    large_file = models.FileField(null=True, blank=True)
+
     status = models.IntegerField(
         default=TweetPhotoStatus.PENDING,
         choices=TWEET_PHOTO_STATUS_CHOICES,
@@ -53,3 +83,53 @@ class TweetPhoto(models.Model):
             ('status', 'created_at'),
             ('tweet', 'order'),
         )
+
+    @property
+    def variant_files(self):
+        return {
+            'thumb': self.thumb_file,
+            'medium': self.medium_file,
+            'large': self.large_file,
+        }
+
+
+class Hashtag(models.Model):
+    # 统一转成小写存储，#Django 和 #django 是同一个 tag
+    name = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '#{}'.format(self.name)
+
+
+class TweetHashtag(models.Model):
+    """
+    tag timeline 的索引表，created_at 冗余了 tweet 的创建时间
+    (hashtag, created_at) 上的索引让 /api/tags/{tag}/tweets/ 的每一页都是一次范围扫描
+    """
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('hashtag', 'tweet'),)
+        index_together = (('hashtag', 'created_at'),)
+
+    def __str__(self):
+        return '{} {} - {}'.format(self.created_at, self.hashtag_id, self.tweet_id)
+
+
+class TweetMention(models.Model):
+    """
+    mentions timeline 的索引表，和 TweetHashtag 一样按 (mentioned_user, created_at) 翻页
+    """
+    mentioned_user = models.ForeignKey(User, on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, on_delete=models.CASCADE)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = (('mentioned_user', 'tweet'),)
+        index_together = (('mentioned_user', 'created_at'),)
+
+    def __str__(self):
+        return '{} {} - {}'.format(self.created_at, self.mentioned_user_id, self.tweet_id)
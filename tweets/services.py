@@ -1,17 +1,203 @@
-from tweets.models import TweetPhoto
+import os
+import re
+import unicodedata
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from tweets.constants import TweetPhotoUploadStatus
+from tweets.models import Hashtag, Tweet, TweetHashtag, TweetMention, TweetPhoto
+from tweets.tasks import upload_tweet_photo_task
+from utils.images import ImageVariantHelper
+from utils.redis_helper import RedisHelper
+from utils.time_constants import ONE_DAY
+
+TWEET_PATTERN = 'tweet:{tweet_id}'
+USER_TWEETS_PATTERN = 'user_tweets:{user_id}'
+
+# 前面不能紧跟字母数字，email 里的 @ 不算
+HASHTAG_RE = re.compile(r'(?<!\w)#(\w+)')
+MENTION_RE = re.compile(r'(?<!\w)@(\w+)')
+# 解析之前先去掉链接，url 里的 #anchor 和 /@username 不算
+URL_RE = re.compile(r'\b(?:https?://|www\.)\S+', re.IGNORECASE)
 
 
 class TweetService(object):
 
     @classmethod
     def create_photos_from_files(cls, tweet, files):
+        """
+        request 里只把文件写到本地磁盘，创建 PENDING 状态的 TweetPhoto
+        真正上传到 DEFAULT_FILE_STORAGE 交给 celery 的 photos 队列异步执行
+        """
         photos = []
         for index, file in enumerate(files):
             photo = TweetPhoto(
                 tweet=tweet,
                 user=tweet.user,
-                file=file,
+                staged_file=file,
+                upload_status=TweetPhotoUploadStatus.PENDING,
                 order=index,
             )
             photos.append(photo)
-        TweetPhoto.objects.bulk_create(photos)
\ No newline at end of file
+        TweetPhoto.objects.bulk_create(photos)
+        # bulk_create 在 mysql 上不会返回 id，需要再查一次
+        photo_ids = list(TweetPhoto.objects.filter(
+            tweet=tweet,
+            upload_status=TweetPhotoUploadStatus.PENDING,
+        ).values_list('id', flat=True))
+        transaction.on_commit(lambda: [
+            upload_tweet_photo_task.delay(photo_id)
+            for photo_id in photo_ids
+        ])
+
+    @classmethod
+    def upload_staged_photo(cls, photo):
+        staged_file = photo.staged_file
+        photo.file.save(os.path.basename(staged_file.name), staged_file, save=False)
+        staged_file.close()
+        photo.staged_file = None
+        photo.upload_status = TweetPhotoUploadStatus.UPLOADED
+        photo.save(update_fields=['file', 'staged_file', 'upload_status'])
+        # 数据库更新成功以后才删除本地的文件，上传失败重试的时候还能找到它
+        staged_file.storage.delete(staged_file.name)
+
+    @classmethod
+    def generate_photo_variants(cls, photo):
+        names = ImageVariantHelper.save_variants(photo.file)
+        TweetPhoto.objects.filter(id=photo.id).update(**{
+            '{}_file'.format(variant): name
+            for variant, name in names.items()
+        })
+
+    @classmethod
+    def _get_field_names(cls):
+        return [field.attname for field in Tweet._meta.concrete_fields]
+
+    @classmethod
+    def serialize(cls, tweet):
+        # cache 里只存字段值组成的 tuple，比 pickle 整个 model 对象小很多
+        return tuple(getattr(tweet, name) for name in cls._get_field_names())
+
+    @classmethod
+    def deserialize(cls, values):
+        field_names = cls._get_field_names()
+        # 表结构变了以后旧格式的数据当作没有命中
+        if not isinstance(values, tuple) or len(values) != len(field_names):
+            return None
+        return Tweet.from_db('default', field_names, values)
+
+    @classmethod
+    def get_by_ids(cls, tweet_ids):
+        """
+        返回 {tweet_id: tweet}，和 in_bulk 一样，不存在的 tweet 不会出现在结果里
+        先从 cache 里 get_many，没有命中的用一次 query 从数据库里取出来再写回 cache
+        """
+        keys = {tweet_id: TWEET_PATTERN.format(tweet_id=tweet_id) for tweet_id in set(tweet_ids)}
+        cached = cache.get_many(keys.values())
+        tweets = {}
+        missing_ids = []
+        for tweet_id, key in keys.items():
+            tweet = cls.deserialize(cached[key]) if key in cached else None
+            if tweet is None:
+                missing_ids.append(tweet_id)
+            else:
+                tweets[tweet_id] = tweet
+        if not missing_ids:
+            return tweets
+
+        missing_tweets = Tweet.objects.in_bulk(missing_ids)
+        cache.set_many({
+            keys[tweet_id]: cls.serialize(tweet)
+            for tweet_id, tweet in missing_tweets.items()
+        }, timeout=ONE_DAY)
+        tweets.update(missing_tweets)
+        return tweets
+
+    @classmethod
+    def get(cls, tweet_id):
+        return cls.get_by_ids([tweet_id]).get(tweet_id)
+
+    @classmethod
+    def invalidate_tweet_cache(cls, tweet_id):
+        key = TWEET_PATTERN.format(tweet_id=tweet_id)
+        cache.delete(key)
+        # 事务提交之前，并发的请求可能又把旧的数据写回了 cache，提交以后再删一次
+        transaction.on_commit(lambda: cache.delete(key))
+
+    @classmethod
+    def get_user_tweet_items(cls, user_id, limit, created_at__gt=None, created_at__lt=None):
+        """
+        返回用户自己发的最新的 (tweet_id, created_at)，第一次读的时候从数据库加载到 redis
+        """
+        return RedisHelper.get_ids(
+            USER_TWEETS_PATTERN.format(user_id=user_id),
+            Tweet.objects.filter(user_id=user_id),
+            'id',
+            limit,
+            created_at__gt=created_at__gt,
+            created_at__lt=created_at__lt,
+        )
+
+    @classmethod
+    def push_tweet_to_cache(cls, tweet):
+        # 只有已经加载过的 list 才会被更新，没人看过的用户不占用 redis
+        # 等事务提交以后再 push，回滚的话 cache 里不会留下不存在的 tweet
+        transaction.on_commit(lambda: RedisHelper.push_id(
+            [USER_TWEETS_PATTERN.format(user_id=tweet.user_id)],
+            tweet.id,
+            tweet.created_at,
+        ))
+
+    @classmethod
+    def invalidate_user_tweets_cache(cls, user_id):
+        RedisHelper.invalidate(USER_TWEETS_PATTERN.format(user_id=user_id))
+
+    @classmethod
+    def normalize_hashtag(cls, name):
+        return unicodedata.normalize('NFKC', name).lower()
+
+    @classmethod
+    def extract_hashtags(cls, content):
+        content = URL_RE.sub(' ', content)
+        names = [cls.normalize_hashtag(name) for name in HASHTAG_RE.findall(content)]
+        return list(dict.fromkeys(
+            name for name in names
+            if len(name) <= Hashtag._meta.get_field('name').max_length
+        ))
+
+    @classmethod
+    def extract_mentions(cls, content):
+        # 注册的时候 username 都转成了小写
+        content = URL_RE.sub(' ', content)
+        return list(dict.fromkeys(name.lower() for name in MENTION_RE.findall(content)))
+
+    @classmethod
+    def create_hashtags_and_mentions(cls, tweet):
+        """
+        tweet 创建的时候解析一次 #tag 和 @username，写到 TweetHashtag / TweetMention 里，
+        之后按 tag 或者被 @ 的人查 tweets 都只需要走索引，不用 LIKE 扫 content
+        不存在的 username 会被忽略，重复调用不会重复写入
+        """
+        names = cls.extract_hashtags(tweet.content)
+        if names:
+            # 并发创建同一个 tag 的时候依靠唯一索引去重
+            Hashtag.objects.bulk_create(
+                [Hashtag(name=name) for name in names],
+                ignore_conflicts=True,
+            )
+            TweetHashtag.objects.bulk_create([
+                TweetHashtag(hashtag_id=hashtag_id, tweet=tweet, created_at=tweet.created_at)
+                for hashtag_id in Hashtag.objects.filter(
+                    name__in=names,
+                ).values_list('id', flat=True)
+            ], ignore_conflicts=True)
+
+        usernames = cls.extract_mentions(tweet.content)
+        if usernames:
+            TweetMention.objects.bulk_create([
+                TweetMention(mentioned_user_id=user_id, tweet=tweet, created_at=tweet.created_at)
+                for user_id in User.objects.filter(
+                    username__in=usernames,
+                ).values_list('id', flat=True)
+            ], ignore_conflicts=True)
@@ -0,0 +1,67 @@
+from celery import shared_task
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+from tweets.constants import TweetPhotoUploadStatus
+from tweets.models import TweetPhoto
+from utils.images import ImageTooLargeError
+from utils.time_constants import ONE_HOUR
+
+# 文件本身有问题，重试也没有用
+INVALID_IMAGE_ERRORS = (UnidentifiedImageError, ImageTooLargeError, Image.DecompressionBombError)
+
+
+@shared_task(
+    bind=True,
+    queue='photos',
+    time_limit=ONE_HOUR,
+    max_retries=settings.TWEET_PHOTO_UPLOAD_MAX_RETRIES,
+)
+def upload_tweet_photo_task(self, photo_id):
+    # 重复投递的任务或者已经上传成功的照片直接跳过
+    photo = TweetPhoto.objects.filter(
+        id=photo_id,
+        upload_status=TweetPhotoUploadStatus.PENDING,
+    ).first()
+    if photo is None:
+        return 'photo {} is not pending'.format(photo_id)
+
+    from tweets.services import TweetService
+    try:
+        TweetService.upload_staged_photo(photo)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            # 本地的文件保留下来，方便排查以后重新上传
+            TweetPhoto.objects.filter(id=photo_id).update(
+                upload_status=TweetPhotoUploadStatus.FAILED,
+            )
+            return 'photo {} failed to upload'.format(photo_id)
+        # 指数退避，S3 短暂不可用的时候不会立刻把重试次数用完
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+    generate_tweet_photo_variants_task.delay(photo_id)
+    return 'photo {} uploaded'.format(photo_id)
+
+
+@shared_task(
+    bind=True,
+    queue='photos',
+    time_limit=ONE_HOUR,
+    max_retries=settings.TWEET_PHOTO_UPLOAD_MAX_RETRIES,
+)
+def generate_tweet_photo_variants_task(self, photo_id):
+    photo = TweetPhoto.objects.filter(
+        id=photo_id,
+        upload_status=TweetPhotoUploadStatus.UPLOADED,
+    ).first()
+    if photo is None:
+        return 'photo {} is not uploaded'.format(photo_id)
+
+    from tweets.services import TweetService
+    try:
+        TweetService.generate_photo_variants(photo)
+    except INVALID_IMAGE_ERRORS as exc:
+        return 'photo {} is not a valid image: {}'.format(photo_id, exc)
+    except Exception as exc:
+        if self.request.retries >= self.max_retries:
+            return 'failed to generate variants for photo {}'.format(photo_id)
+        raise self.retry(exc=exc, countdown=2 ** self.request.retries)
+    return 'variants generated for photo {}'.format(photo_id)
@@ -1,12 +1,44 @@
-from testing.testcases import TestCase
+from comments.models import Comment
+from comments.services import CommentService
 from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from io import StringIO
+import threading
+from unittest import mock
+from likes.services import LikeService
+from PIL import Image
+from utils.redis_client import RedisClient
+from utils.snowflake import (
+    MAX_SEQUENCE,
+    MAX_WORKER_ID,
+    SnowflakeIdGenerator,
+    WORKER_ID_LEASE_PATTERN,
+    WorkerIdLease,
+)
 from utils.time_helpers import utc_now
 from testing.testcases import TestCase
-from tweets.constants import TweetPhotoStatus
-from tweets.models import TweetPhoto
+from tweets.constants import TweetPhotoStatus, TweetPhotoUploadStatus
+from tweets.hydrators import TweetHydrator
+from tweets.models import (
+    Hashtag,
+    Tweet,
+    TweetHashtag,
+    TweetMention,
+    TweetPhoto,
+    get_staging_storage,
+)
+from tweets.tasks import upload_tweet_photo_task
+from tweets.services import TWEET_PATTERN, USER_TWEETS_PATTERN, TweetService
 
 class TweetTests(TestCase):
     def setUp(self):
+        self.clear_cache()
         self.linghu = self.create_user('linghu')
         self.tweet = self.create_tweet(self.linghu, content='Jiuzhang Dafa Hao')
 
@@ -34,4 +66,511 @@ class TweetTests(TestCase):
         )
         self.assertEqual(photo.user, self.linghu)
         self.assertEqual(photo.status, TweetPhotoStatus.PENDING)
-        self.assertEqual(self.tweet.tweetphoto_set.count(), 1)
\ No newline at end of file
+        self.assertEqual(self.tweet.tweetphoto_set.count(), 1)
+
+
+class TweetHydratorTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def _create_tweets(self, count):
+        tweets = []
+        for i in range(count):
+            tweet = self.create_tweet(self.linghu if i % 2 else self.dongxie)
+            self.create_like(self.dongxie, tweet)
+            self.create_comment(self.linghu, tweet)
+            for order, name in enumerate(['cover', 'photo']):
+                TweetPhoto.objects.create(
+                    tweet=tweet,
+                    user=tweet.user,
+                    file='{}{}.jpg'.format(name, i),
+                    order=order,
+                    upload_status=TweetPhotoUploadStatus.UPLOADED,
+                )
+            tweets.append(tweet)
+        return tweets
+
+    def test_hydrate(self):
+        tweets = self._create_tweets(3)
+        self.create_like(self.linghu, tweets[0])
+        hydrator = TweetHydrator.from_ids([tweets[2].id, -1, tweets[0].id], self.dongxie)
+        self.assertEqual([tweet.id for tweet in hydrator.tweets], [tweets[2].id, tweets[0].id])
+        self.assertEqual(hydrator.get_likes_count(tweets[0].id), 2)
+        self.assertEqual(hydrator.get_comments_count(tweets[0].id), 1)
+        self.assertEqual(hydrator.has_liked(tweets[0].id), True)
+        self.assertEqual(
+            [url.split('/')[-1] for url in hydrator.get_photo_urls(tweets[2].id)],
+            ['cover2.jpg', 'photo2.jpg'],
+        )
+
+        # user 和 profile 都已经加载好了
+        with self.assertNumQueries(0):
+            for tweet in hydrator.tweets:
+                self.assertEqual(tweet.user.profile.user_id, tweet.user_id)
+
+        hydrator = TweetHydrator(tweets, AnonymousUser())
+        self.assertEqual(hydrator.has_liked(tweets[0].id), False)
+
+    def test_constant_number_of_queries(self):
+        self.linghu.profile
+        self.dongxie.profile
+        tweets = self._create_tweets(2)
+        with CaptureQueriesContext(connection) as small_page:
+            TweetHydrator.from_ids([tweet.id for tweet in tweets], self.dongxie)
+        tweets = self._create_tweets(6)
+        with CaptureQueriesContext(connection) as large_page:
+            TweetHydrator.from_ids([tweet.id for tweet in tweets], self.dongxie)
+        self.assertEqual(len(small_page), len(large_page))
+
+
+class TweetCountersTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+        self.tweet = self.create_tweet(self.linghu)
+
+    def test_likes_count(self):
+        self.create_like(self.linghu, self.tweet)
+        self.create_like(self.linghu, self.tweet)
+        self.create_like(self.dongxie, self.tweet)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 2)
+
+        self.assertEqual(LikeService.cancel_like(self.linghu, Tweet, self.tweet.id), 1)
+        # 没有点过赞的时候取消不会让计数变少
+        self.assertEqual(LikeService.cancel_like(self.linghu, Tweet, self.tweet.id), 0)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 1)
+
+        comment = self.create_comment(self.dongxie, self.tweet)
+        self.create_like(self.linghu, comment)
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 1)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.likes_count, 1)
+
+    def test_comments_count(self):
+        comments = [self.create_comment(self.dongxie, self.tweet) for _ in range(2)]
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.comments_count, 2)
+
+        CommentService.delete_comment(comments[0])
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.comments_count, 1)
+
+    def test_reconcile_counters_command(self):
+        tweets = [self.tweet] + [self.create_tweet(self.linghu) for _ in range(2)]
+        comment = self.create_comment(self.dongxie, tweets[0])
+        self.create_like(self.dongxie, tweets[0])
+        self.create_like(self.dongxie, comment)
+        Tweet.objects.filter(id=tweets[0].id).update(likes_count=5, comments_count=0)
+        Tweet.objects.filter(id=tweets[2].id).update(likes_count=-1)
+        Comment.objects.filter(id=comment.id).update(likes_count=0)
+
+        out = StringIO()
+        call_command('reconcile_counters', '--batch-size', '2', '--sleep', '0', stdout=out)
+        self.assertIn('2 tweet likes_count fixed', out.getvalue())
+        self.assertIn('1 tweet comments_count fixed', out.getvalue())
+        self.assertIn('1 comment likes_count fixed', out.getvalue())
+        self.assertEqual(
+            list(Tweet.objects.filter(id__in=[t.id for t in tweets]).order_by('id').values_list(
+                'likes_count',
+                'comments_count',
+            )),
+            [(1, 1), (0, 0), (0, 0)],
+        )
+        comment.refresh_from_db()
+        self.assertEqual(comment.likes_count, 1)
+
+        out = StringIO()
+        call_command('reconcile_counters', '--sleep', '0', stdout=out)
+        self.assertIn('0 tweet likes_count fixed', out.getvalue())
+
+
+class TweetCacheTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_get_by_ids(self):
+        tweets = [self.create_tweet(self.linghu, 'tweet {}'.format(i)) for i in range(3)]
+        tweet_ids = [tweet.id for tweet in tweets]
+        with self.assertNumQueries(1):
+            cached = TweetService.get_by_ids(tweet_ids + [-1])
+        self.assertEqual(set(cached.keys()), set(tweet_ids))
+
+        # 全部命中 cache，不再查数据库
+        with self.assertNumQueries(0):
+            cached = TweetService.get_by_ids(tweet_ids)
+        self.assertEqual(cached[tweet_ids[1]].content, 'tweet 1')
+        self.assertEqual(cached[tweet_ids[1]].user_id, self.linghu.id)
+        self.assertEqual(cached[tweet_ids[1]].created_at, tweets[1].created_at)
+
+        # 只有没命中的部分查一次数据库
+        new_tweet = self.create_tweet(self.dongxie)
+        with self.assertNumQueries(1):
+            cached = TweetService.get_by_ids(tweet_ids + [new_tweet.id])
+        self.assertEqual(len(cached), 4)
+        with self.assertNumQueries(0):
+            self.assertEqual(TweetService.get(new_tweet.id).user_id, self.dongxie.id)
+
+    def test_invalidate_on_save_and_delete(self):
+        tweet = self.create_tweet(self.linghu, 'original')
+        self.assertEqual(TweetService.get(tweet.id).content, 'original')
+        tweet.content = 'updated'
+        tweet.save()
+        self.assertEqual(TweetService.get(tweet.id).content, 'updated')
+
+        tweet.delete()
+        self.assertEqual(TweetService.get(tweet.id), None)
+
+    def test_invalidate_on_counters_change(self):
+        tweet = self.create_tweet(self.linghu)
+        self.assertEqual(TweetService.get(tweet.id).likes_count, 0)
+        self.create_like(self.dongxie, tweet)
+        self.assertEqual(TweetService.get(tweet.id).likes_count, 1)
+        comment = self.create_comment(self.dongxie, tweet)
+        self.assertEqual(TweetService.get(tweet.id).comments_count, 1)
+        CommentService.delete_comment(comment)
+        self.assertEqual(TweetService.get(tweet.id).comments_count, 0)
+        LikeService.cancel_like(self.dongxie, Tweet, tweet.id)
+        self.assertEqual(TweetService.get(tweet.id).likes_count, 0)
+
+    def test_stale_format_is_a_miss(self):
+        tweet = self.create_tweet(self.linghu)
+        cache.set(TWEET_PATTERN.format(tweet_id=tweet.id), (tweet.id, 'old format'))
+        self.assertEqual(TweetService.get(tweet.id).id, tweet.id)
+
+
+class UserTweetsCacheTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_lazy_load_and_push(self):
+        tweets = [self.create_tweet(self.linghu) for _ in range(3)]
+        key = USER_TWEETS_PATTERN.format(user_id=self.linghu.id)
+        conn = RedisClient.get_connection()
+        # 没有人读过，不会写进 redis
+        self.assertEqual(conn.exists(key), 0)
+
+        items = TweetService.get_user_tweet_items(self.linghu.id, limit=10)
+        self.assertEqual([tweet_id for tweet_id, _ in items], [t.id for t in reversed(tweets)])
+        self.assertEqual(conn.exists(key), 1)
+
+        # 事务提交之前不会 push，回滚的话 cache 里不会有这条 tweet
+        with self.captureOnCommitCallbacks() as callbacks:
+            new_tweet = self.create_tweet(self.linghu)
+        items = TweetService.get_user_tweet_items(self.linghu.id, limit=1)
+        self.assertEqual([tweet_id for tweet_id, _ in items], [tweets[2].id])
+
+        # 提交以后新发的帖子插到最前面，之后的读不需要访问数据库
+        for callback in callbacks:
+            callback()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_tweet(self.dongxie)
+        with self.assertNumQueries(0):
+            items = TweetService.get_user_tweet_items(self.linghu.id, limit=2)
+        self.assertEqual([tweet_id for tweet_id, _ in items], [new_tweet.id, tweets[2].id])
+        self.assertEqual(items[0][1], new_tweet.created_at)
+
+        with self.assertNumQueries(0):
+            items = TweetService.get_user_tweet_items(
+                self.linghu.id,
+                limit=10,
+                created_at__lt=tweets[2].created_at,
+            )
+        self.assertEqual([tweet_id for tweet_id, _ in items], [tweets[1].id, tweets[0].id])
+
+    def test_invalidate_on_delete(self):
+        tweets = [self.create_tweet(self.linghu) for _ in range(2)]
+        TweetService.get_user_tweet_items(self.linghu.id, limit=10)
+        tweets[1].delete()
+        items = TweetService.get_user_tweet_items(self.linghu.id, limit=10)
+        self.assertEqual([tweet_id for tweet_id, _ in items], [tweets[0].id])
+
+
+class TweetPhotoUploadTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.tweet = self.create_tweet(self.linghu)
+
+    def _create_photos(self, count):
+        files = [
+            SimpleUploadedFile('upload{}.jpg'.format(i), str.encode('photo {}'.format(i)))
+            for i in range(count)
+        ]
+        with self.captureOnCommitCallbacks() as callbacks:
+            TweetService.create_photos_from_files(self.tweet, files)
+        return list(TweetPhoto.objects.filter(tweet=self.tweet).order_by('order')), callbacks
+
+    def test_photos_are_staged(self):
+        photos, callbacks = self._create_photos(2)
+        self.assertEqual(len(callbacks), 1)
+        for photo in photos:
+            self.assertEqual(photo.upload_status, TweetPhotoUploadStatus.PENDING)
+            self.assertEqual(photo.file.name, '')
+            self.assertTrue(photo.staged_file.storage.exists(photo.staged_file.name))
+
+        callbacks[0]()
+        for photo in photos:
+            staged_name = photo.staged_file.name
+            photo.refresh_from_db()
+            self.assertEqual(photo.upload_status, TweetPhotoUploadStatus.UPLOADED)
+            self.assertFalse(photo.staged_file)
+            self.assertFalse(get_staging_storage().exists(staged_name))
+            self.assertTrue(photo.file.storage.exists(photo.file.name))
+        with photos[1].file.open('rb') as f:
+            self.assertEqual(f.read(), b'photo 1')
+
+        # 重复投递的任务什么都不做
+        self.assertIn('is not pending', upload_tweet_photo_task(photos[0].id))
+
+    def test_upload_retries(self):
+        photos, callbacks = self._create_photos(1)
+        upload = TweetService.upload_staged_photo
+        errors = [IOError('S3 is down')]
+
+        def flaky_upload(photo):
+            # 第一次失败，重试的时候成功
+            if errors:
+                raise errors.pop()
+            return upload(photo)
+
+        with mock.patch.object(
+            TweetService,
+            'upload_staged_photo',
+            side_effect=flaky_upload,
+        ) as mocked:
+            upload_tweet_photo_task.delay(photos[0].id)
+        self.assertEqual(mocked.call_count, 2)
+        photos[0].refresh_from_db()
+        self.assertEqual(photos[0].upload_status, TweetPhotoUploadStatus.UPLOADED)
+
+    def test_upload_fails_after_max_retries(self):
+        photos, callbacks = self._create_photos(1)
+        with mock.patch.object(
+            TweetService,
+            'upload_staged_photo',
+            side_effect=IOError('S3 is down'),
+        ) as mocked:
+            upload_tweet_photo_task.delay(photos[0].id)
+        self.assertEqual(mocked.call_count, settings.TWEET_PHOTO_UPLOAD_MAX_RETRIES + 1)
+        photos[0].refresh_from_db()
+        self.assertEqual(photos[0].upload_status, TweetPhotoUploadStatus.FAILED)
+        # 本地的文件还在，可以重新上传
+        self.assertTrue(photos[0].staged_file.storage.exists(photos[0].staged_file.name))
+
+
+class TweetPhotoVariantTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.tweet = self.create_tweet(self.linghu)
+
+    def test_generate_variants(self):
+        files = [
+            self.create_image_file('landscape.jpg', (2400, 1200)),
+            self.create_image_file('small.png', (100, 50), 'PNG'),
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            TweetService.create_photos_from_files(self.tweet, files)
+        photos = list(TweetPhoto.objects.filter(tweet=self.tweet).order_by('order'))
+
+        expected_sizes = [
+            {'large': (1200, 600), 'medium': (600, 300), 'thumb': (150, 75)},
+            # 比目标尺寸小的图片不会被放大
+            {'large': (100, 50), 'medium': (100, 50), 'thumb': (100, 50)},
+        ]
+        for photo, sizes in zip(photos, expected_sizes):
+            for variant, size in sizes.items():
+                file = photo.variant_files[variant]
+                self.assertTrue(file)
+                with file.open('rb') as f:
+                    self.assertEqual(Image.open(f).size, size)
+
+        hydrator = TweetHydrator([self.tweet], None)
+        urls = hydrator.get_photos(self.tweet.id)
+        self.assertEqual(len(urls), 2)
+        self.assertEqual(urls[0]['original'], photos[0].file.url)
+        self.assertEqual(urls[0]['thumb'], photos[0].thumb_file.url)
+        self.assertNotEqual(urls[0]['thumb'], urls[0]['original'])
+
+    def test_invalid_image(self):
+        files = [SimpleUploadedFile('fake.jpg', b'not an image')]
+        with self.captureOnCommitCallbacks(execute=True):
+            TweetService.create_photos_from_files(self.tweet, files)
+        photo = TweetPhoto.objects.get(tweet=self.tweet)
+        self.assertEqual(photo.upload_status, TweetPhotoUploadStatus.UPLOADED)
+        self.assertFalse(photo.thumb_file)
+
+        # 没有缩略图的时候用原图代替
+        urls = TweetHydrator([self.tweet], None).get_photos(self.tweet.id)
+        self.assertEqual(urls[0]['thumb'], photo.file.url)
+        self.assertEqual(urls[0]['large'], photo.file.url)
+
+    def test_too_large_image(self):
+        with mock.patch('utils.images.IMAGE_VARIANT_MAX_PIXELS', 100):
+            with self.captureOnCommitCallbacks(execute=True):
+                TweetService.create_photos_from_files(
+                    self.tweet,
+                    [self.create_image_file('large.jpg', (20, 20))],
+                )
+        photo = TweetPhoto.objects.get(tweet=self.tweet)
+        self.assertFalse(photo.thumb_file)
+
+
+class HashtagAndMentionTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+        self.linghu = self.create_user('linghu')
+        self.dongxie = self.create_user('dongxie')
+
+    def test_extract(self):
+        self.assertEqual(
+            TweetService.extract_hashtags('#Django and #django, #九章 a#b x@y.com #'),
+            ['django', '九章'],
+        )
+        self.assertEqual(TweetService.extract_hashtags('#' + 'a' * 65), [])
+        self.assertEqual(
+            TweetService.extract_mentions('hi @LingHu @dongxie! @linghu mail me at a@b.com'),
+            ['linghu', 'dongxie'],
+        )
+        content = 'see http://x.com/#anchor www.y.com/#top https://medium.com/@linghu #real @dongxie'
+        self.assertEqual(TweetService.extract_hashtags(content), ['real'])
+        self.assertEqual(TweetService.extract_mentions(content), ['dongxie'])
+
+    def test_create_hashtags_and_mentions(self):
+        # 不经过 api，直接创建的 tweet 也会被解析
+        tweet = self.create_tweet(self.linghu, content='#Django with @dongxie and @nobody')
+        other = self.create_tweet(self.dongxie, content='#django #python')
+        # 重复调用不会重复写入
+        TweetService.create_hashtags_and_mentions(other)
+        self.assertEqual(TweetHashtag.objects.filter(tweet=other).count(), 2)
+
+        # 已经存在的 tag 不会重复创建
+        self.assertEqual(Hashtag.objects.count(), 2)
+        django = Hashtag.objects.get(name='django')
+        self.assertEqual(
+            set(TweetHashtag.objects.filter(hashtag=django).values_list('tweet_id', flat=True)),
+            {tweet.id, other.id},
+        )
+        mention = TweetMention.objects.get()
+        self.assertEqual(mention.mentioned_user, self.dongxie)
+        self.assertEqual(mention.created_at, tweet.created_at)
+
+        tweet.delete()
+        self.assertFalse(TweetHashtag.objects.filter(tweet_id=tweet.id).exists())
+        self.assertFalse(TweetMention.objects.exists())
+
+
+class SnowflakeIdTests(TestCase):
+
+    def setUp(self):
+        self.clear_cache()
+
+    def test_layout(self):
+        generator = SnowflakeIdGenerator(worker_id=5, clock=lambda: 1700000000.123)
+        first, second = generator.next_id(), generator.next_id()
+        self.assertEqual(SnowflakeIdGenerator.parse(first), (1700000000123, 5, 0))
+        self.assertEqual(SnowflakeIdGenerator.parse(second), (1700000000123, 5, 1))
+        self.assertLess(second, 1 << 63)
+        with self.assertRaises(ValueError):
+            SnowflakeIdGenerator(worker_id=1024).next_id()
+
+    def test_clock_moves_backwards_and_sequence_overflow(self):
+        now = [1700000000.0]
+        generator = SnowflakeIdGenerator(worker_id=1, clock=lambda: now[0])
+        ids = [generator.next_id()]
+        # 时间往回调以后继续用上一次的时间戳
+        now[0] -= 5
+        ids.append(generator.next_id())
+        self.assertEqual(SnowflakeIdGenerator.parse(ids[1])[0], 1700000000000)
+        # 同一毫秒里的序列号用完以后借用下一毫秒
+        ids.extend(generator.next_id() for _ in range(MAX_SEQUENCE + 1))
+        self.assertEqual(SnowflakeIdGenerator.parse(ids[-1])[0], 1700000000001)
+        self.assertEqual(ids, sorted(set(ids)))
+
+    def test_monotonic_under_concurrency(self):
+        generator = SnowflakeIdGenerator(worker_id=3)
+        results = [[] for _ in range(8)]
+        barrier = threading.Barrier(len(results))
+
+        def generate(ids):
+            barrier.wait()
+            for _ in range(2000):
+                ids.append(generator.next_id())
+
+        threads = [threading.Thread(target=generate, args=(ids,)) for ids in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        all_ids = [tweet_id for ids in results for tweet_id in ids]
+        self.assertEqual(len(set(all_ids)), len(all_ids))
+        # 每个线程拿到的 id 都是严格递增的
+        for ids in results:
+            self.assertEqual(ids, sorted(set(ids)))
+
+    def test_worker_ids_from_redis(self):
+        generators = [SnowflakeIdGenerator() for _ in range(3)]
+        worker_ids = [SnowflakeIdGenerator.parse(g.next_id())[1] for g in generators]
+        self.assertEqual(len(set(worker_ids)), 3)
+        # fork 出来的子进程重新租一个 worker id
+        generator = generators[0]
+        with mock.patch('utils.snowflake.os.getpid', return_value=-1):
+            self.assertNotIn(SnowflakeIdGenerator.parse(generator.next_id())[1], worker_ids)
+
+    def test_worker_id_lease(self):
+        now = [0]
+        conn = RedisClient.get_connection()
+        with mock.patch('utils.snowflake.random.randrange', return_value=MAX_WORKER_ID):
+            first = WorkerIdLease(ttl=10, clock=lambda: now[0])
+            self.assertEqual(first.get_worker_id(), MAX_WORKER_ID)
+            # 被占用的 worker id 不会再租给别人，不管之前有多少进程启动过
+            second = WorkerIdLease(ttl=10, clock=lambda: now[0])
+            self.assertEqual(second.get_worker_id(), 0)
+        key = WORKER_ID_LEASE_PATTERN.format(worker_id=MAX_WORKER_ID)
+
+        # 过了一半的 ttl 续租
+        now[0] = 5
+        conn.expire(key, 1)
+        self.assertEqual(first.get_worker_id(), MAX_WORKER_ID)
+        self.assertGreater(conn.ttl(key), 1)
+
+        # 租约过期以后被别的进程拿走了，重新租一个
+        now[0] = 10
+        conn.set(key, 'other')
+        self.assertNotIn(first.get_worker_id(), [MAX_WORKER_ID, 0])
+        self.assertEqual(conn.get(key), b'other')
+
+        # 所有 worker id 都被占用的时候不能生成 id
+        for worker_id in range(MAX_WORKER_ID + 1):
+            conn.set(WORKER_ID_LEASE_PATTERN.format(worker_id=worker_id), 'other')
+        with self.assertRaises(RuntimeError):
+            WorkerIdLease().get_worker_id()
+
+    def test_tweet_ids(self):
+        user = self.create_user('linghu')
+        tweets = [self.create_tweet(user) for _ in range(3)]
+        ids = [tweet.id for tweet in tweets]
+        self.assertEqual(ids, sorted(ids))
+        self.assertGreater(ids[0], 1 << 32)
+        # 比 32 位大的 id 也可以被点赞
+        like = self.create_like(user, tweets[0])
+        like.refresh_from_db()
+        self.assertEqual(like.object_id, ids[0])
+        self.assertEqual(Tweet.objects.get(id=ids[0]).likes_count, 1)
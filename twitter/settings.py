@@ -10,12 +10,15 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+from celery.schedules import crontab
 from pathlib import Path
 import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+TESTING = ((" ".join(sys.argv)).find('manage.py test') != -1)
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.1/howto/deployment/checklist/
@@ -52,6 +55,8 @@ INSTALLED_APPS = [
     'comments',
     'likes',
     'inbox',
+    'search',
+    'trends',
 ]
 
 REST_FRAMEWORK = {
@@ -108,6 +113,19 @@ DATABASES = {
 }
 
 
+# NewsFeed 按 user_id 分布在下面这些数据库上，其他的表都在 default 数据库上
+# 增加 shard 以后需要运行 python manage.py rebalance_newsfeed_shards 迁移数据
+NEWSFEED_DB_SHARDS = ['default']
+DATABASE_ROUTERS = ['newsfeeds.routers.NewsFeedRouter']
+if TESTING:
+    # 单元测试里用多个本地的 sqlite 数据库模拟多个 shard
+    for alias in ('newsfeeds_shard_1', 'newsfeeds_shard_2'):
+        DATABASES[alias] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / f'{alias}.sqlite3',
+        }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -148,7 +166,6 @@ STATIC_URL = '/static/'
 
 # 设置存储用户上传文件的 storage 用什么系统
 DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
-TESTING = ((" ".join(sys.argv)).find('manage.py test') != -1)
 if TESTING:
     DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
 
@@ -173,6 +190,102 @@ AWS_S3_REGION_NAME = 'us-west-1'
 # - media 里使用户上传的数据文件，而不是代码
 MEDIA_ROOT = 'media/'
 
+# 发帖时上传的照片先写在这个本地目录里，再由 celery worker 上传到 DEFAULT_FILE_STORAGE
+# 处理 photos 队列的 worker 需要和 web server 部署在同一台机器上（或者共享这个目录）
+TWEET_PHOTO_STAGING_ROOT = '/var/tmp/twitter/staging/' if not TESTING else 'media/staging/'
+TWEET_PHOTO_UPLOAD_MAX_RETRIES = 5
+
+# memcached
+# tweet 这类单个对象的 cache 放在 memcached 里，多个 web server 共享
+# 单元测试里用进程内的 LocMemCache 代替
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '127.0.0.1:11211',
+        'TIMEOUT': 86400,
+    },
+}
+if TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'TIMEOUT': 86400,
+        },
+    }
+
+# snowflake id
+# tweet 的主键是按时间递增的 64 位 snowflake id，时间戳从 SNOWFLAKE_EPOCH (毫秒) 开始计算
+# SNOWFLAKE_WORKER_ID 为 None 时每个进程从 redis 租一个 0 ~ 1023 的 worker id，
+# 每 SNOWFLAKE_WORKER_LEASE_TTL / 2 秒续租一次，进程退出以后租约过期再被别的进程使用
+# 固定配置 SNOWFLAKE_WORKER_ID 的话（比如从环境变量读），必须保证每个进程都不一样
+SNOWFLAKE_EPOCH = 1577836800000  # 2020-01-01 00:00:00 UTC
+SNOWFLAKE_WORKER_ID = None
+SNOWFLAKE_WORKER_LEASE_TTL = 60
+
+# 全文搜索
+# 倒排索引的存储，需要是 search.backends.BaseSearchBackend 的子类
+# 本地开发可以用 search.backends.MemorySearchBackend，重启以后用 rebuild_search_index 重建
+SEARCH_BACKEND = 'search.backends.DatabaseSearchBackend'
+
+# redis
+# 生产环境连接真实的 redis server，单元测试里用 fakeredis 代替
+REDIS_HOST = '127.0.0.1'
+REDIS_PORT = 6379
+REDIS_DB = 0
+# 每个用户的 newsfeed / timeline 在 redis 里最多缓存多少个 id
+REDIS_LIST_LENGTH_LIMIT = 200 if not TESTING else 20
+
+# trends 统计最近 TRENDS_WINDOW 秒内出现最多的 #tag 和关键词
+# 窗口被切成 TRENDS_BUCKETS 个时间片，每个时间片一个 count-min sketch 和 heavy hitters
+# 内存大约是 TRENDS_BUCKETS * (TRENDS_SKETCH_WIDTH * TRENDS_SKETCH_DEPTH * 8 字节 + TRENDS_HEAVY_HITTERS 个词)
+TRENDS_WINDOW = 60 * 60
+TRENDS_BUCKETS = 12
+TRENDS_SKETCH_WIDTH = 4096
+TRENDS_SKETCH_DEPTH = 4
+TRENDS_HEAVY_HITTERS = 200
+TRENDS_TOP_K = 20
+# 每隔多少秒把 top k 写到 cache 里
+TRENDS_SNAPSHOT_INTERVAL = 60
+
+# celery 配置
+# broker 是可插拔的：生产环境用 redis 作为消息队列，由独立的 celery worker 异步执行任务
+# 测试环境下 CELERY_TASK_ALWAYS_EAGER 会让 task.delay() 直接在当前进程里同步执行
+# 启动 worker: celery -A twitter worker -l INFO -Q default,newsfeeds,photos
+# trends 的统计数据在 worker 的内存里，需要单独一个进程消费:
+# celery -A twitter worker -l INFO -Q trends --concurrency 1
+CELERY_BROKER_URL = 'redis://127.0.0.1:6379/2' if not TESTING else 'redis://127.0.0.1:6379/1'
+CELERY_TIMEZONE = 'UTC'
+CELERY_TASK_ALWAYS_EAGER = TESTING
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+# 定时任务需要另外启动 beat: celery -A twitter beat -l INFO
+CELERY_BEAT_SCHEDULE = {
+    'compact-newsfeeds': {
+        'task': 'newsfeeds.tasks.compact_newsfeeds_task',
+        'schedule': crontab(hour=4, minute=0),
+    },
+    'snapshot-trends': {
+        'task': 'trends.tasks.snapshot_trends_task',
+        'schedule': TRENDS_SNAPSHOT_INTERVAL,
+    },
+}
+
+# fanout 时每个 batch 里最多包含多少个 follower
+NEWSFEED_FANOUT_BATCH_SIZE = 1000 if not TESTING else 3
+# 粉丝数超过这个阈值的用户（大V）发帖时不做 fanout，粉丝读 newsfeed 时再 pull
+NEWSFEED_PULL_FOLLOWERS_THRESHOLD = 10000
+# 关注一个人以后，把他最近的多少条帖子补到自己的 newsfeed 里
+NEWSFEED_BACKFILL_TWEETS_LIMIT = 100 if not TESTING else 5
+# 每个用户最多保留多少条 newsfeed，更早的会被定期清理掉
+NEWSFEED_RETENTION_LIMIT = 1000
+# 定期清理 newsfeed 时每批删除多少行，以及两批之间 sleep 多少秒
+NEWSFEED_COMPACT_BATCH_SIZE = 1000
+NEWSFEED_COMPACT_SLEEP = 0.1
+# 轮询新动态时最多数到多少条
+NEWSFEED_NEW_COUNT_LIMIT = 100 if not TESTING else 5
+
+# 每个进程内存里最多缓存多少个用户的 follower / following id 列表
+FRIENDSHIP_IDS_LOCAL_CACHE_SIZE = 1000
+
 try:
     from .local_settings import *
 except:
@@ -17,7 +17,8 @@ from django.contrib import admin
 from django.urls import include, path
 from rest_framework import routers
 from accounts.api.views import UserViewSet, AccountViewSet
-from tweets.api.views import TweetViewSet
+from trends.api.views import TrendViewSet
+from tweets.api.views import TagViewSet, TweetViewSet
 from friendships.api.views import FriendshipViewSet
 from inbox.api.views import NotificationViewSet
 from newsfeeds.api.views import NewsFeedViewSet
@@ -29,6 +30,8 @@ router = routers.DefaultRouter()
 router.register(r'api/users', UserViewSet)
 router.register(r'api/accounts', AccountViewSet, basename='accounts')
 router.register(r'api/tweets', TweetViewSet, basename='tweets')
+router.register(r'api/tags', TagViewSet, basename='tags')
+router.register(r'api/trends', TrendViewSet, basename='trends')
 router.register(r'api/friendships', FriendshipViewSet, basename='friendships')
 router.register(r'api/newsfeeds', NewsFeedViewSet, basename='newsfeeds')
 router.register(r'api/comments', CommentViewSet, basename='comments')
@@ -0,0 +1,62 @@
+import time
+
+from django.db.models import Count, F
+
+
+class CounterHelper(object):
+    """
+    维护 Tweet.likes_count 这类冗余的计数字段
+    """
+
+    @classmethod
+    def incr(cls, model_class, object_id, field, delta=1):
+        # 用 F() 在数据库里做加减，并发的请求不会互相覆盖
+        # 调用方负责和写 Like / Comment 放在同一个事务里
+        return model_class.objects.filter(id=object_id).update(**{
+            field: F(field) + delta,
+        })
+
+    @classmethod
+    def decr(cls, model_class, object_id, field, delta=1):
+        return cls.incr(model_class, object_id, field, -delta)
+
+    @classmethod
+    def reconcile(cls, model_class, field, source_queryset, group_field,
+                  batch_size=1000, sleep=0, on_fixed=None, key_field='id'):
+        """
+        按 id 分批重新计算 model_class.field，修正和 source_queryset 实际条数不一致的行
+        source_queryset 按 group_field 分组计数，和 model_class 的 key_field 对应，
+        比如 UserProfile 的计数要用 user_id 去和 Friendship.to_user_id 对应
+        更新的时候带上旧的值做 compare-and-set，如果这期间计数被正常的请求改过了就跳过，
+        不会覆盖掉并发的 F() 更新，下次运行的时候再修正
+        on_fixed(object_id) 在每一行被修正以后调用，用来清理 cache
+        返回被修正的行数
+        """
+        fixed = 0
+        last_id = 0
+        while True:
+            rows = list(model_class.objects.filter(
+                id__gt=last_id,
+            ).order_by('id').values_list('id', key_field, field)[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            counts = dict(source_queryset.filter(**{
+                '{}__in'.format(group_field): [key for _, key, _ in rows],
+            }).values(group_field).annotate(
+                count=Count('id'),
+            ).values_list(group_field, 'count'))
+            for object_id, key, stored in rows:
+                expected = counts.get(key, 0)
+                if stored == expected:
+                    continue
+                updated = model_class.objects.filter(
+                    id=object_id,
+                    **{field: stored}
+                ).update(**{field: expected})
+                if updated and on_fixed is not None:
+                    on_fixed(object_id)
+                fixed += updated
+            if sleep:
+                time.sleep(sleep)
+        return fixed
@@ -0,0 +1,79 @@
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+# 每种尺寸图片的最长边，从大到小排列，生成的时候每一张都在上一张的基础上缩小
+IMAGE_VARIANT_SIZES = (
+    ('large', 1200),
+    ('medium', 600),
+    ('thumb', 150),
+)
+IMAGE_VARIANTS = tuple(variant for variant, _ in IMAGE_VARIANT_SIZES)
+# 解码以后超过这个像素数的图片不处理，一张 RGB 图片最多占用 3 倍这么多字节的内存
+IMAGE_VARIANT_MAX_PIXELS = 40 * 1000 * 1000
+
+
+class ImageTooLargeError(Exception):
+    pass
+
+
+class ImageVariantHelper(object):
+    """
+    把用户上传的原图缩小成几种固定的尺寸，客户端可以按需要选择最小的那一张
+    """
+
+    @classmethod
+    def get_variant_name(cls, name, variant):
+        base, _ = os.path.splitext(os.path.basename(name))
+        return 'variants/{}_{}.jpg'.format(base, variant)
+
+    @classmethod
+    def _open(cls, source):
+        image = Image.open(source)
+        # 只读了文件头，还没有解码，先检查尺寸再决定要不要处理
+        width, height = image.size
+        if width * height > IMAGE_VARIANT_MAX_PIXELS:
+            raise ImageTooLargeError('{}x{} is too large'.format(width, height))
+        # jpeg 可以在解码的时候直接按 1/2, 1/4, 1/8 缩小，不需要把整张原图解码到内存里
+        largest = IMAGE_VARIANT_SIZES[0][1]
+        image.draft('RGB', (largest, largest))
+        # 手机拍的照片方向存在 exif 里，缩小以后 exif 就没了，需要先转正
+        return ImageOps.exif_transpose(image).convert('RGB')
+
+    @classmethod
+    def save_variants(cls, source):
+        """
+        source 是原图的 FieldFile，生成的图片存在同一个 storage 里
+        返回 {variant: 存储的文件名}
+        同一时间内存里只有一张解码后的图片和一张编码后的图片
+        """
+        names = {}
+        source.open('rb')
+        try:
+            image = cls._open(source)
+            for variant, size in IMAGE_VARIANT_SIZES:
+                image.thumbnail((size, size), Image.LANCZOS)
+                buffer = BytesIO()
+                image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+                names[variant] = source.storage.save(
+                    cls.get_variant_name(source.name, variant),
+                    ContentFile(buffer.getvalue()),
+                )
+        finally:
+            source.close()
+        return names
+
+    @classmethod
+    def get_urls(cls, original, variants):
+        """
+        variants 是 {variant: FieldFile}，还没有生成的尺寸用原图代替
+        """
+        if not original:
+            return None
+        urls = {'original': original.url}
+        for variant in IMAGE_VARIANTS:
+            file = variants.get(variant)
+            urls[variant] = file.url if file else urls['original']
+        return urls
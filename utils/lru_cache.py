@@ -0,0 +1,35 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    进程内的 LRU cache，最多保存 maxsize 个 key，线程安全
+    不同进程之间不共享，调用方需要自己保证读到的不是过期的数据，比如把版本号放在 key 里
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
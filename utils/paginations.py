@@ -0,0 +1,132 @@
+from django.db.models import BigIntegerField, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+
+class EndlessPagination(BasePagination):
+    """
+    基于 created_at 的 keyset (cursor) 翻页，适用于 newsfeed / timeline 这类
+    按时间倒序、不需要总页数的无限下拉列表。
+    - created_at__lt=<cursor> 向下翻页，拿比 cursor 更早的一页
+    - created_at__gt=<cursor> 下拉刷新，拿比 cursor 更新的最新一页
+    无论 cursor 在哪里，每次都只在 (user, created_at) 索引上读 page_size + 1 行，
+    所以翻到第几页、用户有多少数据都不影响单次请求的代价。
+    created_at 相同的数据（比如批量插入的）在页面边界上会被跳过，所以 queryset 翻页时
+    客户端可以同时带上这一页最后一条的 id__lt（下拉刷新时第一条的 id__gt），按 (created_at, id) 翻页。
+    paginate_ordered_list 的数据来自 redis / newsfeed 归并，只支持 created_at 的 cursor。
+    """
+    page_size = 20
+    page_size_query_param = 'size'
+    max_page_size = 50
+
+    def __init__(self):
+        super(EndlessPagination, self).__init__()
+        self.has_next_page = False
+
+    def get_page_size(self, request):
+        if self.page_size_query_param in request.query_params:
+            try:
+                size = int(request.query_params[self.page_size_query_param])
+            except ValueError:
+                size = self.page_size
+            if size > 0:
+                return min(size, self.max_page_size)
+        return self.page_size
+
+    def get_cursor(self, request, param):
+        if param not in request.query_params:
+            return None
+        try:
+            cursor = parse_datetime(request.query_params[param])
+        except ValueError:
+            # 格式正确但是日期不存在，比如 2020-13-45T00:00:00
+            cursor = None
+        if cursor is None:
+            raise ValidationError({param: 'Invalid cursor'})
+        return cursor
+
+    def get_cursors(self, request):
+        return (
+            self.get_cursor(request, 'created_at__gt'),
+            self.get_cursor(request, 'created_at__lt'),
+        )
+
+    def get_id_cursor(self, request, param):
+        if param not in request.query_params:
+            return None
+        try:
+            id_cursor = int(request.query_params[param])
+        except ValueError:
+            id_cursor = None
+        # 超出 BIGINT 范围的 cursor 查数据库的时候会溢出
+        if id_cursor is None or abs(id_cursor) > BigIntegerField.MAX_BIGINT:
+            raise ValidationError({param: 'Invalid cursor'})
+        return id_cursor
+
+    def filter_by_cursor(self, queryset, lookup, created_at, id_cursor, id_field):
+        # (created_at, id) 比 cursor 大 / 小，没有 id cursor 的时候只比较 created_at
+        if id_cursor is None:
+            return queryset.filter(**{'created_at__{}'.format(lookup): created_at})
+        return queryset.filter(
+            Q(**{'created_at__{}'.format(lookup): created_at})
+            | Q(**{'created_at': created_at, '{}__{}'.format(id_field, lookup): id_cursor}),
+        )
+
+    def paginate_queryset(self, queryset, request, view=None, id_field='id'):
+        """
+        id_field 是客户端在结果里看到的 id 对应的字段，比如 tweet 索引表上的 tweet_id
+        """
+        page_size = self.get_page_size(request)
+        created_at__gt, created_at__lt = self.get_cursors(request)
+        if created_at__gt is not None:
+            # 下拉刷新：只返回比 cursor 新的最新 page_size 条
+            # 如果新数据超过一页，has_next_page 为 True，说明和客户端已有的数据之间
+            # 存在空洞，客户端应该丢弃旧数据，从这一页开始重新向下翻
+            queryset = self.filter_by_cursor(
+                queryset,
+                'gt',
+                created_at__gt,
+                self.get_id_cursor(request, 'id__gt'),
+                id_field,
+            )
+        elif created_at__lt is not None:
+            queryset = self.filter_by_cursor(
+                queryset,
+                'lt',
+                created_at__lt,
+                self.get_id_cursor(request, 'id__lt'),
+                id_field,
+            )
+        objects = list(queryset.order_by('-created_at', '-' + id_field)[:page_size + 1])
+        self.has_next_page = len(objects) > page_size
+        return objects[:page_size]
+
+    def paginate_ordered_list(self, reverse_ordered_list, request):
+        """
+        对已经按 created_at 倒序排好的 list 进行翻页，用于 newsfeed 归并、cache 等
+        不是直接来自一个 queryset 的数据
+        """
+        page_size = self.get_page_size(request)
+        created_at__gt, created_at__lt = self.get_cursors(request)
+        if created_at__gt is not None:
+            objects = [
+                obj for obj in reverse_ordered_list
+                if obj.created_at > created_at__gt
+            ]
+        elif created_at__lt is not None:
+            objects = [
+                obj for obj in reverse_ordered_list
+                if obj.created_at < created_at__lt
+            ]
+        else:
+            objects = list(reverse_ordered_list)
+        self.has_next_page = len(objects) > page_size
+        return objects[:page_size]
+
+    def get_paginated_response(self, data):
+        return Response({
+            'has_next_page': self.has_next_page,
+            'results': data,
+        })
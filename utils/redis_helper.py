@@ -0,0 +1,162 @@
+import calendar
+import time
+from datetime import datetime
+
+import pytz
+from django.conf import settings
+from utils.redis_client import RedisClient
+from utils.time_constants import ONE_DAY
+
+# sorted set 里 score 最小的占位成员，用来表示这个 list 已经从数据库里完整加载过了
+# fanout 和 cache 失效并发时可能会生成一个不完整的 key，读的时候发现没有占位成员就重新加载
+LOADED_MARKER = 'loaded'
+LOADED_MARKER_SCORE = -1
+LOAD_LOCK_TIMEOUT = 10
+
+
+def _to_score(created_at):
+    # 精确到微秒的整数，不会超过 2^53，用 float 存在 redis 里也不会丢精度
+    return calendar.timegm(created_at.utctimetuple()) * 10 ** 6 + created_at.microsecond
+
+
+def _from_score(score):
+    score = int(score)
+    return datetime.fromtimestamp(score // 10 ** 6, tz=pytz.utc).replace(
+        microsecond=score % 10 ** 6,
+    )
+
+
+class RedisHelper:
+    """
+    在 redis 里为每个用户维护一个定长的 (id, created_at) 列表，只存最新的
+    REDIS_LIST_LENGTH_LIMIT 个 id，用 sorted set 实现，score 是 created_at。
+    - 读的时候是 cache aside 的模式：第一次读时加锁从数据库加载，避免缓存击穿
+    - 写的时候只往已经加载过的 list 里追加，没人读的 list 不占内存
+    """
+
+    @classmethod
+    def _load_ids(cls, conn, key, queryset, id_field):
+        items = queryset.order_by('-created_at').values_list(
+            id_field,
+            'created_at',
+        )[:settings.REDIS_LIST_LENGTH_LIMIT]
+        mapping = {LOADED_MARKER: LOADED_MARKER_SCORE}
+        for object_id, created_at in items:
+            mapping[object_id] = _to_score(created_at)
+        pipe = conn.pipeline()
+        pipe.delete(key)
+        pipe.zadd(key, mapping)
+        pipe.expire(key, ONE_DAY)
+        pipe.execute()
+
+    @classmethod
+    def _get_ids_from_db(cls, queryset, id_field, limit, created_at__gt, created_at__lt):
+        if created_at__gt is not None:
+            queryset = queryset.filter(created_at__gt=created_at__gt)
+        elif created_at__lt is not None:
+            queryset = queryset.filter(created_at__lt=created_at__lt)
+        return list(queryset.order_by('-created_at').values_list(
+            id_field,
+            'created_at',
+        )[:limit])
+
+    @classmethod
+    def get_ids(
+        cls,
+        key,
+        queryset,
+        id_field,
+        limit,
+        created_at__gt=None,
+        created_at__lt=None,
+    ):
+        """
+        按 created_at 倒序返回最多 limit 个 (id, created_at)，翻页语义和 EndlessPagination 一致
+        queryset 是 cache miss 时用来加载的数据源，需要有 created_at 字段
+        """
+        max_score, min_score = '+inf', 0
+        if created_at__gt is not None:
+            min_score = '({}'.format(_to_score(created_at__gt))
+        elif created_at__lt is not None:
+            max_score = '({}'.format(_to_score(created_at__lt))
+
+        conn = RedisClient.get_connection()
+        for _ in range(2):
+            pipe = conn.pipeline()
+            pipe.zscore(key, LOADED_MARKER)
+            pipe.zcard(key)
+            pipe.zrevrangebyscore(key, max_score, min_score, start=0, num=limit, withscores=True)
+            loaded, size, items = pipe.execute()
+            if loaded is not None:
+                break
+            # 只有一个请求可以去数据库加载，其他请求这次直接读数据库，不等待
+            lock_key = 'lock:{}'.format(key)
+            if not conn.set(lock_key, 1, nx=True, ex=LOAD_LOCK_TIMEOUT):
+                return cls._get_ids_from_db(queryset, id_field, limit, created_at__gt, created_at__lt)
+            try:
+                cls._load_ids(conn, key, queryset, id_field)
+            finally:
+                conn.delete(lock_key)
+        else:
+            return cls._get_ids_from_db(queryset, id_field, limit, created_at__gt, created_at__lt)
+
+        # 向下翻页翻出了 cache 的范围（list 被截断过而且这一页不够），只能去数据库里取
+        # 下拉刷新要的总是最新的数据，cache 里一定有，不需要回源
+        is_truncated = size - 1 >= settings.REDIS_LIST_LENGTH_LIMIT
+        if created_at__gt is None and len(items) < limit and is_truncated:
+            return cls._get_ids_from_db(queryset, id_field, limit, created_at__gt, created_at__lt)
+        return [(int(object_id), _from_score(score)) for object_id, score in items]
+
+    @classmethod
+    def push_id(cls, keys, object_id, created_at):
+        """
+        把一个新的 id 追加到已经加载过的 list 里，并把 list 截断到固定长度
+        还没有加载过的 list 不做任何处理，等第一次读的时候再从数据库加载
+        """
+        conn = RedisClient.get_connection()
+        pipe = conn.pipeline()
+        for key in keys:
+            pipe.exists(key)
+        loaded_keys = [key for key, exists in zip(keys, pipe.execute()) if exists]
+        if not loaded_keys:
+            return
+
+        score = _to_score(created_at)
+        pipe = conn.pipeline()
+        for key in loaded_keys:
+            pipe.zadd(key, {object_id: score})
+            # rank 0 是 score 最小的占位成员，保留它和最新的 REDIS_LIST_LENGTH_LIMIT 个 id
+            pipe.zremrangebyrank(key, 1, -(settings.REDIS_LIST_LENGTH_LIMIT + 1))
+        pipe.execute()
+
+    @classmethod
+    def invalidate(cls, key):
+        RedisClient.get_connection().delete(key)
+
+    @classmethod
+    def _init_versions(cls, pipe, keys):
+        # key 被淘汰以后重新从当前时间开始计数，不会和淘汰之前发出去的版本号重复
+        initial = int(time.time() * 1000)
+        for key in keys:
+            pipe.set(key, initial, nx=True, ex=ONE_DAY)
+
+    @classmethod
+    def incr_versions(cls, keys):
+        if not keys:
+            return
+        pipe = RedisClient.get_connection().pipeline()
+        cls._init_versions(pipe, keys)
+        for key in keys:
+            pipe.incr(key)
+            pipe.expire(key, ONE_DAY)
+        pipe.execute()
+
+    @classmethod
+    def get_versions(cls, keys):
+        if not keys:
+            return []
+        pipe = RedisClient.get_connection().pipeline()
+        cls._init_versions(pipe, keys)
+        for key in keys:
+            pipe.get(key)
+        return [int(version) for version in pipe.execute()[len(keys):]]
@@ -0,0 +1,157 @@
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+import redis
+from django.conf import settings
+from utils.redis_client import RedisClient
+
+# 64 位的 id = 1 位符号位 + 41 位毫秒时间戳 + 10 位 worker id + 12 位序列号
+# 41 位的毫秒数从 SNOWFLAKE_EPOCH 开始可以用 69 年
+TIMESTAMP_BITS = 41
+WORKER_ID_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_ID_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+WORKER_ID_SHIFT = SEQUENCE_BITS
+TIMESTAMP_SHIFT = SEQUENCE_BITS + WORKER_ID_BITS
+WORKER_ID_LEASE_PATTERN = 'snowflake:worker:{worker_id}'
+
+
+class WorkerIdLease(object):
+    """
+    在 redis 里租一个 worker id: SET snowflake:worker:<n> <owner> NX EX ttl
+    - 只有没人持有或者已经过期的 worker id 才能租到，同时存活的进程不会拿到同一个 worker id
+    - 每过 ttl 的一半续租一次，生成 id 的时候租约至少还剩一半的时间
+    - 续租的时候发现租约已经被别的进程拿走了（比如进程被挂起超过了 ttl），重新租一个
+    """
+
+    def __init__(self, ttl=None, clock=None):
+        self.ttl = settings.SNOWFLAKE_WORKER_LEASE_TTL if ttl is None else ttl
+        self.clock = clock or time.monotonic
+        self.owner = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+        self.worker_id = None
+        self.renew_at = None
+
+    def _key(self, worker_id):
+        return WORKER_ID_LEASE_PATTERN.format(worker_id=worker_id)
+
+    def _acquire(self):
+        conn = RedisClient.get_connection()
+        # 从随机的位置开始找，很多进程同时启动的时候不会都去抢同一个 worker id
+        start = random.randrange(MAX_WORKER_ID + 1)
+        for offset in range(MAX_WORKER_ID + 1):
+            worker_id = (start + offset) % (MAX_WORKER_ID + 1)
+            if conn.set(self._key(worker_id), self.owner, nx=True, ex=self.ttl):
+                return worker_id
+        raise RuntimeError('all {} snowflake worker ids are leased'.format(MAX_WORKER_ID + 1))
+
+    def _renew(self):
+        # 只能给自己持有的租约续期，get 和 expire 之间被别人改了的话 execute 会失败
+        key = self._key(self.worker_id)
+        with RedisClient.get_connection().pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != self.owner.encode():
+                    return False
+                pipe.multi()
+                pipe.expire(key, self.ttl)
+                pipe.execute()
+            except redis.WatchError:
+                return False
+        return True
+
+    def get_worker_id(self):
+        now = self.clock()
+        if self.worker_id is not None and now < self.renew_at:
+            return self.worker_id
+        if self.worker_id is None or not self._renew():
+            self.worker_id = self._acquire()
+        self.renew_at = now + self.ttl / 2
+        return self.worker_id
+
+
+class SnowflakeIdGenerator(object):
+    """
+    不需要访问数据库就能生成的、按时间递增的 64 位 id
+    - 同一个 generator 生成的 id 严格递增，多线程共用一个 generator 也是安全的
+    - 同一毫秒内超过 4096 个 id 时借用下一毫秒的时间戳
+    - 系统时间被往回调的时候继续用上一次的时间戳，不会生成更小或者重复的 id
+    不同进程的 worker id 必须不同：没有指定 worker id 的时候从 redis 租一个，
+    fork 出来的子进程会重新租
+    """
+
+    def __init__(self, worker_id=None, epoch=None, clock=None):
+        self._lock = threading.Lock()
+        self._worker_id = worker_id
+        self._lease = None
+        self._pid = None
+        self.epoch = settings.SNOWFLAKE_EPOCH if epoch is None else epoch
+        self.clock = clock or time.time
+        self.last_timestamp = -1
+        self.sequence = 0
+
+    @property
+    def worker_id(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # 子进程不能沿用父进程租到的 worker id
+            self._lease = None
+            self._pid = pid
+            self.last_timestamp, self.sequence = -1, 0
+        worker_id = self._worker_id
+        if worker_id is None:
+            worker_id = settings.SNOWFLAKE_WORKER_ID
+        if worker_id is None:
+            if self._lease is None:
+                self._lease = WorkerIdLease()
+            worker_id = self._lease.get_worker_id()
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError('worker id must be between 0 and {}'.format(MAX_WORKER_ID))
+        return worker_id
+
+    def _get_timestamp(self):
+        return int(self.clock() * 1000) - self.epoch
+
+    def next_id(self):
+        with self._lock:
+            worker_id = self.worker_id
+            timestamp = max(self._get_timestamp(), self.last_timestamp)
+            if timestamp == self.last_timestamp:
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # 这一毫秒的序列号用完了，借用下一毫秒，不阻塞等待
+                    timestamp = self.last_timestamp + 1
+            else:
+                self.sequence = 0
+            if timestamp >= 1 << TIMESTAMP_BITS:
+                raise OverflowError('snowflake timestamp is out of range')
+            self.last_timestamp = timestamp
+            return (
+                (timestamp << TIMESTAMP_SHIFT)
+                | (worker_id << WORKER_ID_SHIFT)
+                | self.sequence
+            )
+
+    @classmethod
+    def parse(cls, snowflake_id, epoch=None):
+        """
+        返回 (毫秒时间戳, worker id, 序列号)，时间戳是 unix 时间
+        """
+        epoch = settings.SNOWFLAKE_EPOCH if epoch is None else epoch
+        return (
+            (snowflake_id >> TIMESTAMP_SHIFT) + epoch,
+            (snowflake_id >> WORKER_ID_SHIFT) & MAX_WORKER_ID,
+            snowflake_id & MAX_SEQUENCE,
+        )
+
+
+_generator = SnowflakeIdGenerator()
+
+
+def next_id():
+    # 作为 model 字段的 default，migration 里会引用这个函数
+    return _generator.next_id()